@@ -1,3 +1,4 @@
+import argparse
 import tkinter as tk
 from tkinter.colorchooser import askcolor
 from controller import Controller
@@ -101,10 +102,24 @@ class GUI:
     def set_label_text(self, txt):
         self.__txtvar.set(txt)
 
+    def get_label_text(self):
+        return self.__txtvar.get()
+
+    # image the canvas can show, from base64 encoded PPM data
+    def photo_image(self, data):
+        return tk.PhotoImage(master=self.__root, data=data, format='PPM')
+
 
 def main():
+    parser = argparse.ArgumentParser(description='sketchpad')
+    parser.add_argument('--join', metavar='HOST:PORT', help='draw on a shared board, see collab.py')
+    args = parser.parse_args()
+
     gui = GUI()
     controller = Controller(gui)
+    if args.join:
+        host, _, port = args.join.rpartition(':')
+        controller.join(host or 'localhost', int(port))
     gui.start_gui()
     return
 
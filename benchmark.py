@@ -0,0 +1,529 @@
+import argparse
+import contextlib
+import gc
+import io
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+from controller import Controller
+from commands import GroupEntries, MoveEntry
+from drawable import Drawable
+from headless import HeadlessGUI
+from packed_geometry import PackedCoords, numpy
+from scene_index import leaves
+from scene_format import SceneSnapshot, write_scene
+
+# latency and memory of the controller hot paths on synthetic scenes, run on the headless canvas,
+# and of the packed geometry kernel over every stroke of the scene
+#
+#   python benchmark.py                       run every size and compare with the saved baseline
+#   python benchmark.py --sizes 1000 --ops move undo
+#   python benchmark.py --save                store the results as the new baseline
+#
+# the baseline keeps every median as a multiple of the time a fixed pure Python workload takes in the
+# same run, so a baseline recorded on one machine can be compared on another; the ratios still move a
+# little between Python versions and processors
+
+SIZES = [1000, 10000, 100000]
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+
+# differences below this many milliseconds are noise, whatever the ratio
+NOISE_MS = 0.05
+
+COLORS = ['#000000', '#d62728', '#1f77b4', '#2ca02c']
+
+# canvas items allowed before baking while the raster ops run
+RASTER_ITEMS = 200
+
+
+def stroke(rng, width, height, points=16):
+    x, y = rng.uniform(0, width), rng.uniform(0, height)
+    coords = []
+    for _ in range(points):
+        coords.append(x)
+        coords.append(y)
+        x += rng.uniform(-6, 6)
+        y += rng.uniform(-6, 6)
+    return coords
+
+
+# n freehand strokes at the same density whatever n is, four screens per thousand strokes;
+# the last tenth of them in one group
+def build_scene(n, seed=0):
+    gui = HeadlessGUI()
+    controller = Controller(gui, autosave_dir=None)
+    canvas = gui.get_canvas()
+    rng = random.Random(seed)
+    side = 2 * max(1.0, n / 1000) ** 0.5
+
+    drawables = controller.get_drawables()
+    for i in range(n):
+        coords = stroke(rng, side * canvas.winfo_width(), side * canvas.winfo_height())
+        color = COLORS[i % len(COLORS)]
+        controller.insert_entry(len(drawables), Drawable(controller.store.new_ident(), 'freehand', coords, color,
+                                                         controller.store))
+
+    # executing the command also creates the canvas items near the view
+    controller.execute(GroupEntries(range(n - max(1, n // 10), n)))
+    return gui, controller
+
+
+# screen position of a point on a random stroke inside the view, or on one of the big group
+def stroke_point(controller, rng, in_group=False):
+    drawables = controller.get_drawables()
+    x0, y0, x1, y1 = controller.viewport.view()
+    while True:
+        entry = drawables[-1] if in_group else drawables[rng.randrange(len(drawables) - 1)]
+        leaf = entry[rng.randrange(len(entry))] if in_group else entry
+        x, y = leaf.coords[0], leaf.coords[1]
+        if x0 <= x < x1 and y0 <= y < y1:
+            return controller.viewport.to_screen([x, y])
+
+
+# every operation prepares one run and returns it together with what restores the scene afterwards
+
+def prepare_draw(gui, controller, rng):
+    controller.set_freehand_mode(None)
+    canvas = gui.get_canvas()
+    coords = stroke(rng, canvas.winfo_width(), canvas.winfo_height(), 32)
+
+    def run():
+        canvas.event('<Button-1>', coords[0], coords[1])
+        for i in range(2, len(coords), 2):
+            canvas.event('<B1-Motion>', coords[i], coords[i + 1])
+        canvas.event('<ButtonRelease-1>', coords[-2], coords[-1])
+
+    return run, lambda: controller.undo(None)
+
+
+def prepare_search(gui, controller, rng):
+    controller.set_cursor_mode(None)
+    canvas = gui.get_canvas()
+    x, y = stroke_point(controller, rng)
+    return lambda: canvas.event('<Button-1>', x, y), lambda: None
+
+
+def prepare_move(gui, controller, rng):
+    controller.set_cursor_mode(None)
+    canvas = gui.get_canvas()
+    x, y = stroke_point(controller, rng, True)
+
+    def run():
+        canvas.event('<Button-1>', x, y)
+        for i in range(1, 11):
+            canvas.event('<B1-Motion>', x + 3 * i, y + 2 * i)
+        canvas.event('<ButtonRelease-1>', x + 30, y + 20)
+
+    return run, lambda: controller.undo(None)
+
+
+# the big group rotated a quarter turn with its rotate handle, drawing a frame after every motion
+def prepare_turn(gui, controller, rng):
+    controller.set_cursor_mode(None)
+    canvas = gui.get_canvas()
+    root = gui.get_root()
+    x, y = stroke_point(controller, rng, True)
+    canvas.event('<Button-1>', x, y)
+    canvas.event('<ButtonRelease-1>', x, y)
+
+    x0, y0, x1, y1 = controller.viewport.to_screen(controller.handle_box)
+    cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
+    radius = cy - y0 + controller.handle_lift * controller.handle_size
+
+    def run():
+        canvas.event('<Button-1>', cx, cy - radius)
+        for i in range(1, 11):
+            angle = math.pi / 20 * i
+            canvas.event('<B1-Motion>', cx - radius * math.sin(angle), cy - radius * math.cos(angle))
+            root.update()
+        canvas.event('<ButtonRelease-1>', cx - radius, cy)
+
+    return run, lambda: controller.undo(None)
+
+
+# a dense scribble of twenty thousand points added in the middle of the view, erased across with a
+# frame drawn after every motion
+def prepare_erase(gui, controller, rng):
+    controller.set_eraser_mode(None)
+    canvas = gui.get_canvas()
+    root = gui.get_root()
+    width, height = canvas.winfo_width(), canvas.winfo_height()
+
+    x, y = width / 2, height / 2
+    coords = []
+    for _ in range(20000):
+        coords.append(x)
+        coords.append(y)
+        x = min(max(x + rng.uniform(-3, 3), width / 4), 3 * width / 4)
+        y = min(max(y + rng.uniform(-3, 3), height / 4), 3 * height / 4)
+    drawables = controller.get_drawables()
+    scribble = Drawable(controller.store.new_ident(), 'freehand', controller.viewport.to_world(coords), COLORS[0],
+                        controller.store)
+    controller.insert_entry(len(drawables), scribble)
+    controller.set_visible(scribble, True)
+
+    def run():
+        canvas.event('<Button-1>', width / 4, height / 2)
+        for i in range(1, 21):
+            canvas.event('<B1-Motion>', width / 4 + width / 40 * i, height / 2 + height / 80 * i)
+            root.update()
+        canvas.event('<ButtonRelease-1>', 3 * width / 4, 3 * height / 4)
+
+    def restore():
+        controller.undo(None)
+        controller.set_visible(controller.remove_entry(len(drawables) - 1), False)
+
+    return run, restore
+
+
+def prepare_paste(gui, controller, rng):
+    controller.set_cursor_mode(None)
+    gui.get_canvas().event('<Button-1>', *stroke_point(controller, rng, True))
+    root = gui.get_root()
+
+    def run():
+        root.event('<Control-c>')
+        root.event('<Control-v>')
+
+    return run, lambda: controller.undo(None)
+
+
+# a random stroke duplicated a thousand times on a grid
+def prepare_duplicate(gui, controller, rng):
+    controller.set_cursor_mode(None)
+    gui.get_canvas().event('<Button-1>', *stroke_point(controller, rng))
+    return lambda: controller.duplicate_selection(1000, 40), lambda: controller.undo(None)
+
+
+def prepare_group(gui, controller, rng):
+    controller.set_grouping_mode(None)
+    canvas = gui.get_canvas()
+    points = [stroke_point(controller, rng) for _ in range(10)]
+
+    def run():
+        for x, y in points:
+            canvas.event('<Button-1>', x, y)
+        gui.get_root().event('<Control-g>')
+
+    return run, lambda: controller.undo(None)
+
+
+# undo and redo of a move of the big group
+def prepare_undo(gui, controller, rng):
+    run_move, _ = prepare_move(gui, controller, rng)
+    run_move()
+    root = gui.get_root()
+
+    def run():
+        root.event('<Control-z>')
+        root.event('<Control-y>')
+
+    return run, lambda: controller.undo(None)
+
+
+# the view dragged across a screen and back with the middle button
+def prepare_pan(gui, controller, rng):
+    canvas = gui.get_canvas()
+
+    def run():
+        canvas.event('<Button-2>', 0, 0)
+        for i in range(1, 33):
+            canvas.event('<B2-Motion>', -40 * i, -20 * i)
+        for i in range(31, -1, -1):
+            canvas.event('<B2-Motion>', -40 * i, -20 * i)
+        canvas.event('<ButtonRelease-2>', 0, 0)
+
+    return run, lambda: None
+
+
+# zoomed out four wheel steps and back in around the centre
+def prepare_zoom(gui, controller, rng):
+    canvas = gui.get_canvas()
+    x, y = canvas.winfo_width() / 2, canvas.winfo_height() / 2
+
+    def run():
+        for _ in range(4):
+            canvas.event('<Button-5>', x, y, num=5)
+        for _ in range(4):
+            canvas.event('<Button-4>', x, y, num=4)
+
+    return run, lambda: None
+
+
+# the raster ops time what the Tk thread pays with the raster cache on, few enough canvas items are
+# allowed that the view is baked at every size; the images are drawn by a worker, waited for after
+def raster_on(controller):
+    controller.set_raster_cache(RASTER_ITEMS)
+    controller.viewport.raster.wait()
+
+
+def raster_off(controller):
+    controller.viewport.raster.wait()
+    controller.set_raster_cache(None)
+
+
+def prepare_raster(gui, controller, rng):
+    return lambda: controller.set_raster_cache(RASTER_ITEMS), lambda: raster_off(controller)
+
+
+def prepare_raster_pan(gui, controller, rng):
+    raster_on(controller)
+    return prepare_pan(gui, controller, rng)[0], lambda: raster_off(controller)
+
+
+def prepare_raster_zoom(gui, controller, rng):
+    raster_on(controller)
+    return prepare_zoom(gui, controller, rng)[0], lambda: raster_off(controller)
+
+
+# what a save costs the Tk thread, the file is written by a worker from the snapshot
+def prepare_save(gui, controller, rng):
+    return lambda: SceneSnapshot(controller.get_drawables()), lambda: None
+
+
+# progressive load of the current scene until the last entry is indexed
+def prepare_load(gui, controller, rng):
+    data = io.BytesIO()
+    write_scene(data, controller.get_drawables())
+    root = gui.get_root()
+
+    def run():
+        controller.begin_load(io.BytesIO(data.getvalue()))
+        root.run_until_idle()
+
+    def restore():
+        controller.history.undo(controller)
+        controller.history.clear_redo(controller)
+
+    return run, restore
+
+
+# every stroke of the scene gathered and its boxes computed
+def prepare_bbox(gui, controller, rng):
+    rows = [leaf.row for leaf in leaves(controller.get_drawables().get_list())]
+    return lambda: PackedCoords(controller.store, rows).boxes(), lambda: None
+
+
+# every stroke of the scene rotated a little around a point and written back, then rotated back
+def prepare_rotate(gui, controller, rng):
+    rows = [leaf.row for leaf in leaves(controller.get_drawables().get_list())]
+    cx, cy = rng.uniform(0, 1000), rng.uniform(0, 1000)
+
+    def rotate(angle):
+        coords = PackedCoords(controller.store, rows)
+        coords.rotate(angle, cx, cy)
+        coords.write(controller.store)
+
+    return lambda: rotate(0.1), lambda: rotate(-0.1)
+
+
+# a step of the timeline rebuilt in review, from the keyframe before it and the records that follow
+def prepare_seek(gui, controller, rng):
+    timeline = controller.timeline
+    steps = 3 * timeline.keyframe_interval // 2
+    first = len(timeline) - 2 * steps
+
+    # the scene was built without records, once the timeline has a keyframe of it a few hundred moves
+    # and their undo are recorded after it, which leave the scene as it was; a previous run left them
+    # at the end of the timeline
+    if first < 1 or timeline.records[first - 1] is not None or \
+            any(record[0] != 'move' for record in timeline.records[first:]):
+        controller.log(None)
+        drawables = controller.get_drawables()
+        for _ in range(steps):
+            controller.execute(MoveEntry(rng.randrange(len(drawables)), rng.uniform(-5, 5), rng.uniform(-5, 5)))
+        for _ in range(steps):
+            controller.undo(None)
+        first = len(timeline) - 2 * steps
+
+    controller.set_timeline_mode(None)
+    step = rng.randrange(first, len(timeline))
+    return lambda: controller.review.seek(step), lambda: controller.leave_timeline(None)
+
+
+# ten steps back through the timeline with the arrow key, from a random step
+def prepare_scrub(gui, controller, rng):
+    seek, restore = prepare_seek(gui, controller, rng)
+    seek()
+    root = gui.get_root()
+
+    def run():
+        for _ in range(10):
+            root.event('<Left>')
+
+    return run, restore
+
+
+# distance from a point to every stroke of the scene
+def prepare_distance(gui, controller, rng):
+    coords = PackedCoords(controller.store, [leaf.row for leaf in leaves(controller.get_drawables().get_list())])
+    x, y = rng.uniform(0, 1000), rng.uniform(0, 1000)
+    return lambda: coords.distances(x, y), lambda: None
+
+
+# whether a point is inside every stroke of the scene taken as a polygon
+def prepare_contains(gui, controller, rng):
+    coords = PackedCoords(controller.store, [leaf.row for leaf in leaves(controller.get_drawables().get_list())])
+    x, y = rng.uniform(0, 1000), rng.uniform(0, 1000)
+    return lambda: coords.contains(x, y), lambda: None
+
+
+OPERATIONS = {
+    'draw': prepare_draw,
+    'search': prepare_search,
+    'move': prepare_move,
+    'turn': prepare_turn,
+    'erase': prepare_erase,
+    'paste': prepare_paste,
+    'duplicate': prepare_duplicate,
+    'group': prepare_group,
+    'undo': prepare_undo,
+    'pan': prepare_pan,
+    'zoom': prepare_zoom,
+    'raster': prepare_raster,
+    'raster_pan': prepare_raster_pan,
+    'raster_zoom': prepare_raster_zoom,
+    'save': prepare_save,
+    'load': prepare_load,
+    'bbox': prepare_bbox,
+    'rotate': prepare_rotate,
+    'distance': prepare_distance,
+    'contains': prepare_contains,
+    'seek': prepare_seek,
+    'scrub': prepare_scrub,
+}
+
+
+# sorting and hashing that does not touch the code under test, the unit the baseline is kept in
+def reference_work():
+    rng = random.Random(0)
+    values = sorted(rng.random() for _ in range(100000))
+    table = {round(value, 4): i for i, value in enumerate(values)}
+    return sum(table.values())
+
+
+def reference_ms(repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        reference_work()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+def measure(gui, controller, prepare, repeat, seed):
+    rng = random.Random(seed)
+    times = []
+    for _ in range(repeat):
+        run, restore = prepare(gui, controller, rng)
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+        restore()
+
+    # memory is traced in a separate run, tracing slows everything down
+    run, restore = prepare(gui, controller, rng)
+    gc.collect()
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    restore()
+
+    return {'median_ms': round(statistics.median(times) * 1000, 3),
+            'max_ms': round(max(times) * 1000, 3),
+            'peak_kb': round(peak / 1024, 1)}
+
+
+def run_size(n, operations, repeat, seed):
+    gc.collect()
+    tracemalloc.start()
+    gui, controller = build_scene(n, seed)
+    scene_bytes, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result = {'scene_kb': round(scene_bytes / 1024, 1),
+              'store_kb': round(controller.store.nbytes() / 1024, 1),
+              'numpy': numpy is not None,
+              'ops': {}}
+
+    for name in operations:
+        gc.collect()
+        result['ops'][name] = measure(gui, controller, OPERATIONS[name], repeat, seed)
+    return result
+
+
+# the results with the medians of the operations as multiples of the reference, as they are saved
+def relative(results, reference):
+    saved = {'reference_ms': round(reference, 3), 'sizes': {}}
+    for size, result in results.items():
+        ops = {name: {'relative': round(op['median_ms'] / reference, 5), 'peak_kb': op['peak_kb']}
+               for name, op in result['ops'].items()}
+        saved['sizes'][size] = dict(result, ops=ops)
+    return saved
+
+
+# the baseline medians are brought to this machine through the reference timed in this run
+def report(results, reference, baseline, threshold):
+    regressions = []
+    print('reference workload %.3f ms' % reference)
+    print('%8s  %-11s %11s %10s %10s %10s' % ('size', 'op', 'median ms', 'max ms', 'peak KB', 'baseline'))
+    for size, result in results.items():
+        print('%8s  scene %.0f KB, store %.0f KB, geometry %s' % (size, result['scene_kb'], result['store_kb'],
+                                                               'numpy' if result.get('numpy') else 'pure Python'))
+        old_ops = baseline.get('sizes', {}).get(size, {}).get('ops', {})
+        for name, op in result['ops'].items():
+            note = ''
+            if name in old_ops:
+                old = old_ops[name]['relative'] * reference
+                ratio = op['median_ms'] / old if old else float('inf')
+                note = '%.2fx' % ratio
+                if ratio > threshold and op['median_ms'] - old > NOISE_MS:
+                    note += ' SLOWER'
+                    regressions.append((size, name))
+            print('%8s  %-11s %11.3f %10.3f %10.1f %10s' % ('', name, op['median_ms'], op['max_ms'], op['peak_kb'], note))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='benchmark the controller hot paths on synthetic scenes')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help='number of strokes per scene')
+    parser.add_argument('--ops', nargs='+', choices=list(OPERATIONS), default=list(OPERATIONS))
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per operation')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--baseline', default=BASELINE, help='baseline file to compare with')
+    parser.add_argument('--threshold', type=float, default=1.5, help='slowdown ratio reported as a regression')
+    parser.add_argument('--save', action='store_true', help='write the results to the baseline file')
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    reference = reference_ms(max(args.repeat, 5))
+    results = {}
+    for n in args.sizes:
+        # the controller prints while drawing, keep that out of the report
+        with open(os.devnull, 'w') as null, contextlib.redirect_stdout(null):
+            results[str(n)] = run_size(n, args.ops, args.repeat, args.seed)
+
+    regressions = report(results, reference, baseline, args.threshold)
+
+    if args.save:
+        with open(args.baseline, 'w') as f:
+            json.dump(relative(results, reference), f, indent=2)
+            f.write('\n')
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
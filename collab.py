@@ -0,0 +1,506 @@
+import argparse
+import asyncio
+import bisect
+import json
+import queue
+import socket
+import sys
+import threading
+
+from scene_format import to_tree
+from scene_index import leaves, node_key
+
+# several controllers sketching on one board through a small relay server
+#
+#   python collab.py --port 8765            run the server
+#   python GUI.py --join localhost:8765     draw on the shared board
+#
+# clients and the server exchange batches of operations, a JSON list of operations per line. The
+# board is a set of top-level entries, each known everywhere by a global id "<client>.<n>" and kept
+# as a last-writer-wins register: a put replaces an entry and a del removes it only if it carries a
+# newer version than the last one applied. Versions are [lamport clock, client], so concurrent changes
+# of the same entry end up the same on every client whatever order they arrive in. The drawing order
+# is given by the z value of the entries, ties broken by the id.
+#
+#   ["hello", client, clock]            first operation from the server, the id of the new client
+#   ["put", id, version, z, tree]       create or replace an entry, tree as in the journal
+#   ["del", id, version]                remove an entry
+#   ["ink", id, color, width, start, steps]
+#                                       points of a stroke being drawn
+#   ["drag", client, ids, dx, dy]       entries being dragged by a client moved by dx, dy world units
+#   ["end", id]                         the stroke being drawn is finished or abandoned
+#   ["leave", client]                   from the server, a client disconnected
+#
+# put and del are the state, the server keeps the newest version of every entry for clients that
+# join later. ink, drag and end only show what the others are doing, they are relayed and forgotten,
+# the put that follows carries the result; when a client leaves before sending it, what it was
+# showing is taken back. Motion is sent once per tick: the drag as the distance
+# covered since the last tick, a stroke as the number of points already sent and the new points as
+# integer steps of QUANTUM world units from the point before.
+
+QUANTUM = 0.25
+
+PORT = 8765
+
+
+def encode(ops):
+    return json.dumps(ops, separators=(',', ':')).encode() + b'\n'
+
+
+class Server:
+    # relays every batch to the other clients and keeps the newest put or del of every entry
+
+    def __init__(self):
+        # id -> newest put or del operation
+        self.entries = {}
+
+        # highest clock seen, new clients start above it
+        self.clock = 0
+        self.clients = 0
+
+        self.__writers = set()
+
+    async def handle(self, reader, writer):
+        self.clients += 1
+        client = self.clients
+        writer.write(encode([['hello', client, self.clock]]))
+        snapshot = [op for op in self.entries.values() if op[0] == 'put']
+        if snapshot:
+            writer.write(encode(snapshot))
+        self.__writers.add(writer)
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                self.merge(json.loads(line))
+
+                # the line is passed on as it is, the clients merge it the same way
+                others = [other for other in self.__writers if other is not writer]
+                for other in others:
+                    other.write(line)
+                await asyncio.gather(*(other.drain() for other in others), return_exceptions=True)
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            self.__writers.discard(writer)
+            writer.close()
+
+            # the strokes and drags the others were shown of this client end with it
+            line = encode([['leave', client]])
+            others = list(self.__writers)
+            for other in others:
+                other.write(line)
+            await asyncio.gather(*(other.drain() for other in others), return_exceptions=True)
+
+    def merge(self, ops):
+        for op in ops:
+            if op[0] not in ('put', 'del'):
+                continue
+            self.clock = max(self.clock, op[2][0])
+            current = self.entries.get(op[1])
+            if current is None or op[2] > current[2]:
+                self.entries[op[1]] = op
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle, host, port)
+        async with server:
+            await server.serve_forever()
+
+
+class CollabSession:
+    # the client side of a controller: local changes go out as operations, the operations of the
+    # others are applied between Tk events
+
+    def __init__(self, controller, host, port, tick=30):
+        self.controller = controller
+
+        # milliseconds between batches
+        self.tick = tick
+
+        self.client = None
+        self.clock = 0
+        self.counter = 0
+
+        # id and (z, id) order key of the entry at every top-level position of the scene
+        self.ids = []
+        self.order = []
+
+        # id -> version last applied, for the removed entries too
+        self.versions = {}
+
+        # id -> entry in the scene
+        self.__entries = {}
+
+        # key of an entry object -> its id, an entry that comes back with undo keeps its id
+        self.__keys = {}
+
+        # operations for the next batch
+        self.__pending = []
+
+        # [id, points sent, last point in quanta, steps not sent yet] of the stroke drawn here
+        self.__ink = None
+
+        # [ids, dx, dy] of the entries dragged here since the last batch
+        self.__drag = None
+
+        # stroke id -> [canvas item, last point in quanta] for the strokes the others are drawing
+        self.__previews = {}
+
+        # id -> client dragging the entry, for the drags of the others not followed by a put yet
+        self.__dragged = {}
+
+        self.__socket = socket.create_connection((host, port))
+        self.__reader = self.__socket.makefile('rb')
+        self.__incoming = queue.Queue()
+        self.__outgoing = queue.Queue()
+        self.__after = None
+
+        # last error of the connection, the session stops when it is set
+        self.error = None
+
+        hello = json.loads(self.__reader.readline())[0]
+        self.client = hello[1]
+        self.clock = hello[2]
+
+    def start(self):
+        threading.Thread(target=self.__receive, daemon=True).start()
+        threading.Thread(target=self.__send, daemon=True).start()
+
+        # the scene drawn before joining is shared too
+        self.resync()
+        self.__poll()
+
+    def close(self):
+        if self.__after is not None:
+            self.controller.gui.get_root().after_cancel(self.__after)
+            self.__after = None
+        self.flush()
+        self.__outgoing.put(None)
+
+    def __receive(self):
+        try:
+            for line in self.__reader:
+                self.__incoming.put(json.loads(line))
+        except (OSError, ValueError) as e:
+            self.error = e
+        self.__incoming.put(None)
+
+    def __send(self):
+        while True:
+            data = self.__outgoing.get()
+            if data is None:
+                break
+            try:
+                self.__socket.sendall(data)
+            except OSError as e:
+                self.error = e
+                break
+
+        # the reader still holds the socket, shutting it down is what ends the connection
+        try:
+            self.__socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.__socket.close()
+
+    def __poll(self):
+        # batches from the others wait while a drag or a load holds on to top-level positions
+        if self.controller.loader is None and not self.controller.drag_tagged \
+                and self.controller.transform_mode is None and self.controller.eraser is None \
+                and self.controller.review is None:
+            changed = False
+            while not self.__incoming.empty():
+                ops = self.__incoming.get_nowait()
+                if ops is None:
+                    print('collaboration server disconnected')
+                    self.__after = None
+                    return
+                changed = self.__remote(ops) or changed
+            if changed:
+                self.controller.remote_changed()
+
+        self.flush()
+        self.__after = self.controller.gui.get_root().after(self.tick, self.__poll)
+
+    # send everything that happened here since the last batch as one line
+    def flush(self):
+        if self.__ink is not None and self.__ink[3]:
+            ink = self.__ink
+            self.__pending.append(['ink', ink[0], self.controller.gui.get_color(), self.controller.width,
+                                   ink[1], ink[3]])
+            ink[1] += len(ink[3]) // 2
+            ink[3] = []
+
+        if self.__drag is not None:
+            ids, dx, dy = self.__drag
+            self.__pending.append(['drag', self.client, ids, round(dx, 3), round(dy, 3)])
+            self.__drag = None
+
+        if self.__pending:
+            self.__outgoing.put(encode(self.__pending))
+            self.__pending = []
+
+    def __version(self):
+        self.clock += 1
+        return [self.clock, self.client]
+
+    def __new_id(self):
+        self.counter += 1
+        return str(self.client) + '.' + str(self.counter)
+
+    # local changes
+
+    # a command was applied or reverted here, record is its journal record, None for a new scene
+    def local_change(self, record):
+        if record is None:
+            self.resync()
+        else:
+            self.__local(record)
+
+    # replace every entry this client shared by the whole current scene
+    def resync(self):
+        while self.ids:
+            self.__remove_local(len(self.ids) - 1)
+        for position, entry in enumerate(self.controller.get_drawables()):
+            self.__put_local(position, entry, to_tree(entry), True)
+
+    # the record was applied to the scene, apply it to the ids and send what changed; the trees
+    # of entries created by the record are read from it, the others from the scene
+    def __local(self, record):
+        drawables = self.controller.get_drawables()
+        op = record[0]
+        if op == 'add':
+            self.__put_local(len(self.ids), drawables[len(self.ids)], record[1], True)
+        elif op == 'extend':
+            for tree in record[1]:
+                self.__put_local(len(self.ids), drawables[len(self.ids)], tree, True)
+        elif op == 'insert':
+            self.__put_local(record[1], drawables[record[1]], record[2], True)
+        elif op == 'pop':
+            self.__remove_local(record[1] % len(self.ids))
+        elif op == 'truncate':
+            for _ in range(record[1]):
+                self.__remove_local(len(self.ids) - 1)
+        elif op == 'move':
+            self.__put_local(record[1], drawables[record[1]], to_tree(drawables[record[1]]), False)
+        elif op == 'transform':
+            for position in record[1]:
+                self.__put_local(position, drawables[position], to_tree(drawables[position]), False)
+        elif op == 'restyle':
+            for position, _ in record[6]:
+                self.__put_local(position, drawables[position], to_tree(drawables[position]), False)
+        elif op == 'group':
+            for position in sorted(record[1], reverse=True):
+                self.__remove_local(position)
+            group = record[2] if len(record) > 2 else len(self.ids)
+            self.__put_local(group, drawables[group], to_tree(drawables[group]), True)
+        elif op == 'split':
+            self.__remove_local(record[2] if len(record) > 2 else len(self.ids) - 1)
+            for position in sorted(record[1]):
+                self.__put_local(position, drawables[position], to_tree(drawables[position]), True)
+        elif op == 'ungroup':
+            self.__remove_local(record[1])
+            start = record[2] if len(record) > 2 else len(self.ids)
+            for position in range(start, start + len(drawables) - len(self.ids)):
+                self.__put_local(position, drawables[position], to_tree(drawables[position]), True)
+        elif op == 'merge':
+            start = record[3] if len(record) > 3 else len(self.ids) - record[2]
+            for _ in range(record[2]):
+                self.__remove_local(start)
+            self.__put_local(record[1], drawables[record[1]], to_tree(drawables[record[1]]), True)
+        elif op == 'batch':
+            for inner in record[1]:
+                self.__local(inner)
+
+    # send the entry at a position, inserted there or already known
+    def __put_local(self, position, entry, tree, inserted):
+        if inserted:
+            key = node_key(entry)
+            ident = self.__keys.get(key)
+            if ident is None:
+                ident = self.__keys[key] = self.__new_id()
+
+            # z halfway between the neighbours
+            below = self.order[position - 1][0] if position > 0 else None
+            above = self.order[position][0] if position < len(self.order) else None
+            if below is None:
+                z = 0.0 if above is None else above - 1.0
+            else:
+                z = below + 1.0 if above is None else (below + above) / 2
+
+            self.ids.insert(position, ident)
+            self.order.insert(position, (z, ident))
+            self.__entries[ident] = entry
+        else:
+            z, ident = self.order[position]
+
+        version = self.versions[ident] = self.__version()
+        self.__pending.append(['put', ident, version, z, tree])
+
+    def __remove_local(self, position):
+        ident = self.ids.pop(position)
+        self.order.pop(position)
+        del self.__entries[ident]
+        version = self.versions[ident] = self.__version()
+        self.__pending.append(['del', ident, version])
+
+    # a point of the stroke being drawn here, in world units
+    def ink(self, x, y):
+        if self.__ink is None:
+            self.__ink = [self.__new_id(), 0, (0, 0), []]
+        qx, qy = round(x / QUANTUM), round(y / QUANTUM)
+        last = self.__ink[2]
+        self.__ink[3] += [qx - last[0], qy - last[1]]
+        self.__ink[2] = (qx, qy)
+
+    # the stroke is over, the entry it became follows as a put
+    def ink_end(self):
+        if self.__ink is None:
+            return
+        self.flush()
+        self.__pending.append(['end', self.__ink[0]])
+        self.__ink = None
+
+    # the entries at the positions were dragged by dx, dy world units
+    def drag(self, positions, dx, dy):
+        ids = [self.ids[position] for position in positions]
+        if self.__drag is not None and self.__drag[0] != ids:
+            self.flush()
+        if self.__drag is None:
+            self.__drag = [ids, 0.0, 0.0]
+        self.__drag[1] += dx
+        self.__drag[2] += dy
+
+    # remote changes
+
+    # apply a batch of the others, returns whether the scene changed
+    def __remote(self, ops):
+        changed = False
+        for op in ops:
+            kind = op[0]
+            if kind == 'put':
+                changed = self.__put_remote(*op[1:]) or changed
+            elif kind == 'del':
+                changed = self.__remove_remote(op[1], op[2]) or changed
+            elif kind == 'ink':
+                self.__preview(*op[1:])
+            elif kind == 'end':
+                preview = self.__previews.pop(op[1], None)
+                if preview is not None:
+                    self.controller.canvas.delete(preview[0])
+            elif kind == 'drag':
+                self.__drag_remote(*op[1:])
+            elif kind == 'leave':
+                self.__leave(op[1])
+        return changed
+
+    def __newer(self, ident, version):
+        self.clock = max(self.clock, version[0])
+        current = self.versions.get(ident)
+        if current is not None and current >= version:
+            return False
+        self.versions[ident] = version
+        return True
+
+    def __put_remote(self, ident, version, z, tree):
+        if not self.__newer(ident, version):
+            return False
+
+        self.__dragged.pop(ident, None)
+        if ident in self.__entries:
+            position = self.__position(ident)
+            self.controller.remote_remove(position)
+            del self.ids[position]
+            del self.order[position]
+
+        position = bisect.bisect(self.order, (z, ident))
+        entry = self.controller.remote_insert(position, tree)
+        self.ids.insert(position, ident)
+        self.order.insert(position, (z, ident))
+        self.__entries[ident] = entry
+        self.__keys[node_key(entry)] = ident
+        return True
+
+    def __remove_remote(self, ident, version):
+        if not self.__newer(ident, version) or ident not in self.__entries:
+            return False
+
+        self.__dragged.pop(ident, None)
+        position = self.__position(ident)
+        self.controller.remote_remove(position)
+        del self.ids[position]
+        del self.order[position]
+        del self.__entries[ident]
+        return True
+
+    # top-level position of an entry, through the index of the controller
+    def __position(self, ident):
+        leaf = next(leaves(self.__entries[ident]), None)
+        position = self.controller.search(leaf.ident) if leaf is not None else -1
+        return position if position >= 0 else self.ids.index(ident)
+
+    # draw the new points of a stroke another client is drawing
+    def __preview(self, ident, color, width, start, steps):
+        preview = self.__previews.get(ident)
+        if preview is None:
+            # a stroke begun before this client joined is only shown once finished
+            if start:
+                return
+            preview = self.__previews[ident] = [None, (0, 0)]
+
+        qx, qy = preview[1]
+        points = []
+        for i in range(0, len(steps), 2):
+            qx += steps[i]
+            qy += steps[i + 1]
+            points += [qx * QUANTUM, qy * QUANTUM]
+        preview[1] = (qx, qy)
+
+        points = self.controller.viewport.to_screen(points)
+        if preview[0] is None:
+            preview[0] = self.controller.canvas.create_line(*(points * 2 if len(points) < 4 else points),
+                                                            width=width, fill=color,
+                                                            capstyle='round', joinstyle='round', tags='remote')
+        else:
+            self.controller.canvas.insert(preview[0], 'end', points)
+
+    # move the canvas items of entries another client is dragging, the put at the end moves the model
+    def __drag_remote(self, client, ids, dx, dy):
+        scale = self.controller.viewport.scale
+        for ident in ids:
+            entry = self.__entries.get(ident)
+            if entry is not None:
+                self.__dragged[ident] = client
+                self.controller.move(entry, [dx * scale, dy * scale])
+
+    # a client left, its unfinished strokes disappear and the entries it was dragging go back to where
+    # the scene has them
+    def __leave(self, client):
+        prefix = str(client) + '.'
+        for ident in [ident for ident in self.__previews if ident.startswith(prefix)]:
+            self.controller.canvas.delete(self.__previews.pop(ident)[0])
+
+        dragged = [ident for ident, by in self.__dragged.items() if by == client]
+        for ident in dragged:
+            del self.__dragged[ident]
+        self.controller.reshaped([self.__entries[ident] for ident in dragged if ident in self.__entries])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='relay server for drawing together')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=PORT)
+    args = parser.parse_args()
+
+    print('serving on', args.host, args.port)
+    try:
+        asyncio.run(Server().serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,608 @@
+from collections import deque
+
+from scene_index import leaves
+from scene_format import to_tree
+
+
+# rough memory held by a command record: a fixed overhead plus what the entries it keeps alive cost
+def entry_size(entry):
+    size = 0
+    for leaf in leaves(entry):
+        size += 64 + 8 * leaf.store.lengths[leaf.row]
+    return size
+
+
+# another client inserted (delta 1) or removed (delta -1) the top-level entry at a position of the scene
+# as it is on one side of a command; the helpers below take that change through the command, they return
+# what the command recorded updated for it and the position the change has on the other side, or None
+# when the command refers to the removed entry
+
+# count entries from slot on that are in the scene on this side when present, or that are only there on
+# the other side, where slot is then the position they go to
+def rebase_block(slot, count, position, delta, present):
+    if position < slot or (delta > 0 and position == slot):
+        return slot + delta, position
+    if not present:
+        return slot, position + count
+
+    # a member of the block removed, or an entry put between its members
+    if position < slot + count:
+        return None
+    return slot, position - count
+
+
+# positions of entries that are in the scene on both sides
+def rebase_positions(positions, position, delta):
+    if delta < 0 and position in positions:
+        return None
+    return [at + delta if at > position or (delta > 0 and at == position) else at for at in positions]
+
+
+class Command:
+    # a reversible change to the scene, records only what is needed to apply and revert it
+    size = 64
+
+    def do(self, controller):
+        pass
+
+    def undo(self, controller):
+        pass
+
+    # called when the record leaves the history, done tells which side of it is on screen
+    def discard(self, controller, done):
+        pass
+
+    # autosave journal record for applying (done) or reverting the command, None for a whole new scene
+    def journal(self, done):
+        return None
+
+    # follow a change another client made to the scene on the side given by done, returns the position
+    # of the change on the other side or None when the command can no longer be applied or reverted
+    def rebase(self, position, delta, done):
+        return None
+
+
+class AddEntry(Command):
+    # a new top-level entry appended to the drawables list (draw, paste)
+
+    def __init__(self, entry):
+        self.entry = entry
+        self.size = entry_size(entry)
+
+        # position of the entry, and whether it went last when it was last done
+        self.position = None
+        self.last = True
+
+    # appended the first time, redone where the entry was when it was undone
+    def do(self, controller):
+        if self.position is None:
+            self.position = len(controller.get_drawables())
+        self.last = self.position == len(controller.get_drawables())
+        controller.insert_entry(self.position, self.entry)
+        controller.set_visible(self.entry, True)
+
+    def undo(self, controller):
+        controller.remove_entry(self.position)
+        controller.set_visible(self.entry, False)
+
+    def discard(self, controller, done):
+        # undone entries only survive as hidden canvas items
+        if not done:
+            controller.delete_items_recur(self.entry)
+
+    def journal(self, done):
+        if not done:
+            return ['pop', self.position]
+        if self.last:
+            return ['add', to_tree(self.entry)]
+        return ['insert', self.position, to_tree(self.entry)]
+
+    def rebase(self, position, delta, done):
+        moved = rebase_block(self.position, 1, position, delta, done)
+        if moved is None:
+            return None
+        self.position, position = moved
+        return position
+
+
+class AddEntries(Command):
+    # many new top-level entries appended at once (paste, duplicate), their canvas items are created
+    # by the refresh that follows every command, for the visible ones only
+
+    def __init__(self, entries):
+        self.entries = entries
+        self.size = sum(entry_size(entry) for entry in entries)
+
+        # position of the first entry, and whether the entries were the last ones when last done or undone
+        self.position = None
+        self.last = True
+
+    def do(self, controller):
+        if self.position is None:
+            self.position = len(controller.get_drawables())
+        self.last = self.position == len(controller.get_drawables())
+        if self.last:
+            controller.extend_entries(self.entries)
+        else:
+            for i, entry in enumerate(self.entries):
+                controller.insert_entry(self.position + i, entry)
+
+    def undo(self, controller):
+        # entries other clients added since may follow them
+        self.last = self.position + len(self.entries) == len(controller.get_drawables())
+        if self.last:
+            controller.truncate_entries(len(self.entries))
+        else:
+            for _ in self.entries:
+                controller.remove_entry(self.position)
+        for entry in self.entries:
+            controller.set_visible(entry, False)
+
+    def discard(self, controller, done):
+        if not done:
+            for entry in self.entries:
+                controller.delete_items_recur(entry)
+
+    def journal(self, done):
+        if done and self.last:
+            return ['extend', [to_tree(entry) for entry in self.entries]]
+        if done:
+            return ['batch', [['insert', self.position + i, to_tree(entry)] for i, entry in enumerate(self.entries)]]
+        if self.last:
+            return ['truncate', len(self.entries)]
+        return ['batch', [['pop', self.position] for _ in self.entries]]
+
+    def rebase(self, position, delta, done):
+        moved = rebase_block(self.position, len(self.entries), position, delta, done)
+        if moved is None:
+            return None
+        self.position, position = moved
+        return position
+
+
+class RemoveEntry(Command):
+    # a top-level entry taken out of the drawables list (cut)
+
+    def __init__(self, position):
+        self.position = position
+        self.entry = None
+
+    def do(self, controller):
+        self.entry = controller.remove_entry(self.position)
+        controller.set_visible(self.entry, False)
+        self.size = entry_size(self.entry)
+
+    def undo(self, controller):
+        controller.insert_entry(self.position, self.entry)
+        controller.set_visible(self.entry, True)
+
+    def discard(self, controller, done):
+        if done:
+            controller.delete_items_recur(self.entry)
+
+    def journal(self, done):
+        return ['pop', self.position] if done else ['insert', self.position, to_tree(self.entry)]
+
+    def rebase(self, position, delta, done):
+        moved = rebase_block(self.position, 1, position, delta, not done)
+        if moved is None:
+            return None
+        self.position, position = moved
+        return position
+
+
+class ReplaceEntry(Command):
+    # a top-level entry swapped for another one at the same position (erase), the two may share
+    # drawables, group tags and idents
+
+    def __init__(self, position, entry):
+        self.position = position
+        self.entry = entry
+        self.old_entry = None
+
+    def do(self, controller):
+        self.old_entry = controller.replace_entry(self.position, self.entry)
+        self.size = entry_size(self.entry) + entry_size(self.old_entry)
+
+    def undo(self, controller):
+        controller.replace_entry(self.position, self.old_entry)
+
+    def discard(self, controller, done):
+        # canvas items are found by ident, the ones the entry on screen shares must stay
+        gone, shown = (self.old_entry, self.entry) if done else (self.entry, self.old_entry)
+        idents = {leaf.ident for leaf in leaves(shown)}
+        for leaf in leaves(gone):
+            if leaf.ident not in idents:
+                controller.delete_items_recur(leaf)
+
+    def journal(self, done):
+        entry = self.entry if done else self.old_entry
+        return ['batch', [['pop', self.position], ['insert', self.position, to_tree(entry)]]]
+
+    def rebase(self, position, delta, done):
+        positions = rebase_positions([self.position], position, delta)
+        if positions is None:
+            return None
+        self.position = positions[0]
+        return position
+
+
+class MoveEntry(Command):
+    # a top-level entry translated by (dx, dy)
+
+    def __init__(self, position, dx, dy):
+        self.position = position
+        self.dx = dx
+        self.dy = dy
+
+    def do(self, controller):
+        controller.shift_entry(self.position, [self.dx, self.dy])
+
+    def undo(self, controller):
+        controller.shift_entry(self.position, [-self.dx, -self.dy])
+
+    def journal(self, done):
+        if done:
+            return ['move', self.position, self.dx, self.dy]
+        return ['move', self.position, -self.dx, -self.dy]
+
+    def rebase(self, position, delta, done):
+        positions = rebase_positions([self.position], position, delta)
+        if positions is None:
+            return None
+        self.position = positions[0]
+        return position
+
+
+class TransformEntries(Command):
+    # the entries at the positions scaled or rotated by an affine matrix in one pass, the shapes they
+    # had before and after are kept so that undo and redo restore them exactly, boxes and styles included
+    def __init__(self, positions, matrix):
+        self.positions = list(positions)
+        self.matrix = tuple(matrix)
+        self.entries = []
+        self.shapes = []
+        self.transformed = None
+
+    def do(self, controller):
+        # a rotated box takes a polygon style, looking it up again could give another row than the first time
+        if self.transformed is not None:
+            controller.set_shapes(self.entries, self.transformed)
+            return
+
+        self.entries = [controller.get_drawables()[position] for position in self.positions]
+        self.shapes = controller.get_shapes(self.entries)
+        controller.transform_entries(self.entries, self.matrix)
+        self.transformed = controller.get_shapes(self.entries)
+        self.size = 64 + sum(64 + 16 * len(coords) for _, coords in self.shapes)
+
+    def undo(self, controller):
+        controller.set_shapes(self.entries, self.shapes)
+
+    def journal(self, done):
+        if done:
+            return ['transform', self.positions, list(self.matrix)]
+
+        # rotated boxes cannot be turned back from the record alone, the restored entries are written out
+        records = []
+        for position, entry in zip(self.positions, self.entries):
+            records.append(['pop', position])
+            records.append(['insert', position, to_tree(entry)])
+        return ['batch', records]
+
+    def rebase(self, position, delta, done):
+        positions = rebase_positions(self.positions, position, delta)
+        if positions is None:
+            return None
+        self.positions = positions
+        return position
+
+
+class Batch(Command):
+    # several commands applied as one step and undone in reverse order (bulk edits of a selection)
+
+    def __init__(self, commands):
+        self.commands = list(commands)
+
+    # removals only know their size once applied
+    @property
+    def size(self):
+        return sum(command.size for command in self.commands)
+
+    def do(self, controller):
+        for command in self.commands:
+            command.do(controller)
+
+    def undo(self, controller):
+        for command in reversed(self.commands):
+            command.undo(controller)
+
+    def discard(self, controller, done):
+        for command in self.commands:
+            command.discard(controller, done)
+
+    def journal(self, done):
+        records = [command.journal(done) for command in (self.commands if done else reversed(self.commands))]
+        if any(record is None for record in records):
+            return None
+        return ['batch', records]
+
+    # the change passes through the commands from the side it was made on
+    def rebase(self, position, delta, done):
+        for command in reversed(self.commands) if done else self.commands:
+            position = command.rebase(position, delta, done)
+            if position is None:
+                return None
+        return position
+
+
+# a single command stays as it is, several become a Batch
+def batch(commands):
+    return commands[0] if len(commands) == 1 else Batch(commands)
+
+
+class Restyle(Command):
+    # every drawable of a (kind, color, width) style given a new color and width at once
+
+    def __init__(self, style, color, width):
+        self.style = tuple(style)
+        self.color = color
+        self.width = width
+
+        # style indices changed, found on the first do only so that a redo leaves alone the styles that
+        # were given the old values since
+        self.indices = None
+
+        # [position, leaf numbers] of the drawables of those styles, for the journal
+        self.locations = []
+
+    def do(self, controller):
+        if self.indices is None:
+            self.indices = controller.store.find_styles(*self.style)
+        controller.restyle(self.indices, self.color, self.width)
+        self.locations = controller.find_style_leaves(self.indices)
+
+    def undo(self, controller):
+        controller.restyle(self.indices, self.style[1], self.style[2])
+
+    def journal(self, done):
+        kind, color, width = self.style
+        if done:
+            return ['restyle', kind, color, width, self.color, self.width, self.locations]
+        return ['restyle', kind, self.color, self.width, color, width, self.locations]
+
+    # an entry another client replaced or removed has its own styles, it is no longer part of the change
+    def rebase(self, position, delta, done):
+        locations = []
+        for at, numbers in self.locations:
+            if delta < 0 and at == position:
+                continue
+            locations.append([at + delta if at > position or (delta > 0 and at == position) else at, numbers])
+        self.locations = locations
+        return position
+
+
+class GroupEntries(Command):
+    # top-level entries at the given positions merged into a new group appended at the end
+
+    def __init__(self, positions):
+        self.positions = sorted(positions)
+        self.group = None
+
+        # position of the group, last when it was made and kept when it is redone
+        self.position = None
+
+    def do(self, controller):
+        entries = controller.detach_entries(self.positions)
+
+        if self.group is None:
+            self.group = controller.make_group(entries)
+        else:
+            controller.tag_group(self.group)
+
+        if self.position is None:
+            self.position = len(controller.get_drawables())
+        controller.attach_entry(self.position, self.group)
+
+    def undo(self, controller):
+        controller.detach_entry(self.position)
+        controller.untag_group(self.group)
+        controller.attach_entries(zip(self.positions, self.group))
+
+    def journal(self, done):
+        return ['group', self.positions, self.position] if done else ['split', self.positions, self.position]
+
+    # grouping takes the members out in one pass and appends the group, the change passes through
+    # those steps one entry at a time; the members go back in ascending order
+    def rebase(self, position, delta, done):
+        steps = [(self.position, 1, done)] + [(at, 1, not done) for at in self.positions]
+        moved = []
+        for slot, count, present in steps if done else reversed(steps):
+            step = rebase_block(slot, count, position, delta, present)
+            if step is None:
+                return None
+            slot, position = step
+            moved.append(slot)
+
+        if not done:
+            moved.reverse()
+        self.position = moved[0]
+        self.positions = moved[1:]
+        return position
+
+
+class UngroupEntry(Command):
+    # the group at a position dissolved, its members appended at the end
+
+    def __init__(self, position):
+        self.position = position
+        self.group = None
+
+        # position of the first member, the members were last when the group was first dissolved
+        self.start = None
+
+    def do(self, controller):
+        self.group = controller.detach_entry(self.position)
+        controller.untag_group(self.group)
+
+        if self.start is None:
+            self.start = len(controller.get_drawables())
+        for i, entry in enumerate(self.group):
+            controller.attach_entry(self.start + i, entry)
+
+    def undo(self, controller):
+        for _ in self.group:
+            controller.detach_entry(self.start)
+
+        controller.tag_group(self.group)
+        controller.attach_entry(self.position, self.group)
+
+    def journal(self, done):
+        if done:
+            return ['ungroup', self.position, self.start]
+        return ['merge', self.position, len(self.group), self.start]
+
+    # the group is taken out and then its members appended, the change passes through both steps
+    def rebase(self, position, delta, done):
+        steps = [(self.position, 1, not done), (self.start, len(self.group), done)]
+        moved = []
+        for slot, count, present in reversed(steps) if done else steps:
+            step = rebase_block(slot, count, position, delta, present)
+            if step is None:
+                return None
+            slot, position = step
+            moved.append(slot)
+
+        if done:
+            moved.reverse()
+        self.position, self.start = moved
+        return position
+
+
+class ReplaceScene(Command):
+    # the whole drawables list swapped for another one (load)
+
+    def __init__(self, entries, ready=True):
+        self.new_entries = entries
+        self.old_entries = None
+        self.size = sum(entry_size(entry) for entry in entries)
+
+        # False while the new entries are still being indexed and shown one by one (progressive load)
+        self.ready = ready
+
+    def do(self, controller):
+        self.old_entries = controller.replace_entries(self.new_entries, self.ready)
+        for entry in self.old_entries:
+            controller.set_visible(entry, False)
+        if self.ready:
+            for entry in self.new_entries:
+                controller.set_visible(entry, True)
+        self.ready = True
+
+    def undo(self, controller):
+        controller.replace_entries(self.old_entries)
+        for entry in self.new_entries:
+            controller.set_visible(entry, False)
+        for entry in self.old_entries:
+            controller.set_visible(entry, True)
+
+    def discard(self, controller, done):
+        for entry in self.old_entries if done else self.new_entries:
+            controller.delete_items_recur(entry)
+
+
+class History:
+    # bounded undo/redo log of commands
+
+    def __init__(self, max_steps=200, max_bytes=64 * 1024 * 1024):
+        self.max_steps = max_steps
+        self.max_bytes = max_bytes
+
+        self.__done = deque()
+        self.__undone = []
+
+        # estimated memory held by all records
+        self.nbytes = 0
+
+        # called with (command, done) whenever a command is applied or reverted
+        self.on_change = None
+
+    def __len__(self):
+        return len(self.__done)
+
+    # record a command that has already been applied
+    def push(self, controller, command):
+        self.clear_redo(controller)
+
+        self.__done.append(command)
+        self.nbytes += command.size
+        self.__notify(command, True)
+
+        # forget the oldest steps once over either limit, but always keep the latest one
+        while len(self.__done) > 1 and (len(self.__done) > self.max_steps or self.nbytes > self.max_bytes):
+            oldest = self.__done.popleft()
+            self.nbytes -= oldest.size
+            oldest.discard(controller, True)
+
+    def undo(self, controller):
+        if not self.__done:
+            return False
+
+        command = self.__done.pop()
+        command.undo(controller)
+        self.__undone.append(command)
+        self.__notify(command, False)
+        return True
+
+    # forget every step, after the scene was changed by something else than the commands
+    def clear(self, controller):
+        self.clear_redo(controller)
+        while self.__done:
+            command = self.__done.popleft()
+            self.nbytes -= command.size
+            command.discard(controller, True)
+
+    # another client inserted (delta 1) or removed (delta -1) the top-level entry at position: the
+    # commands are updated for it, from the scene on screen outwards, and the first one that refers to
+    # the removed entry is forgotten together with the steps beyond it
+    def rebase(self, controller, position, delta):
+        at = position
+        for i in range(len(self.__done) - 1, -1, -1):
+            at = self.__done[i].rebase(at, delta, True)
+            if at is None:
+                for _ in range(i + 1):
+                    command = self.__done.popleft()
+                    self.nbytes -= command.size
+                    command.discard(controller, True)
+                break
+
+        at = position
+        for i in range(len(self.__undone) - 1, -1, -1):
+            at = self.__undone[i].rebase(at, delta, False)
+            if at is None:
+                for command in self.__undone[:i + 1]:
+                    self.nbytes -= command.size
+                    command.discard(controller, False)
+                del self.__undone[:i + 1]
+                break
+
+    # forget every undone command, they can no longer be redone
+    def clear_redo(self, controller):
+        for undone in self.__undone:
+            self.nbytes -= undone.size
+            undone.discard(controller, False)
+        self.__undone = []
+
+    def redo(self, controller):
+        if not self.__undone:
+            return False
+
+        command = self.__undone.pop()
+        command.do(controller)
+        self.__done.append(command)
+        self.__notify(command, True)
+        return True
+
+    def __notify(self, command, done):
+        if self.on_change is not None:
+            self.on_change(command, done)
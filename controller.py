@@ -1,12 +1,38 @@
-from drawable_list import DrawableList
+from drawable_list import DrawableList, Group
 from drawable import Drawable
-import pickle
-
-from tkinter.filedialog import askopenfile, asksaveasfile
+from scene_store import SceneStore, DEFAULT_WIDTH
+from geometry import BOXES, box_outline, simplify
+from packed_geometry import PackedCoords, rotates, rotation, scaling
+from scene_index import SceneIndex, leaves
+from commands import History, AddEntry, AddEntries, RemoveEntry, ReplaceEntry, MoveEntry, TransformEntries, \
+    GroupEntries, UngroupEntry, ReplaceScene, Restyle, batch
+from eraser import Eraser
+from timeline import Timeline, TimelineReview
+from scene_format import SceneSnapshot, leaf_fields
+from journal import Journal
+from loader import SceneLoader
+from saver import SceneSaver
+from viewport import Viewport, style_tag
+from paste import clone, grid_offsets
+from raster import RasterLayer
+from instrument import Instruments
+from collab import CollabSession
+import math
+import os
+import time
+
+from tkinter.filedialog import askopenfile, asksaveasfilename
+from tkinter.simpledialog import askinteger
+
+# where the autosave journal of the running session is kept
+AUTOSAVE_DIR = os.path.join(os.path.expanduser('~'), '.sketchpad', 'autosave')
+
+# where exported performance statistics go
+STATS_DIR = os.path.join(os.path.expanduser('~'), '.sketchpad', 'stats')
 
 
 class Controller:
-    def __init__(self, gui):
+    def __init__(self, gui, autosave_dir=AUTOSAVE_DIR):
         # gui object
         self.gui = gui
 
@@ -19,8 +45,8 @@ class Controller:
         # state for mode
         self.mode = None
 
-        # width of drawable items
-        self.width = 3
+        # pen width of new drawable items
+        self.width = DEFAULT_WIDTH
 
         # used to draw square or circle
         self.regular = False
@@ -31,50 +57,219 @@ class Controller:
         # to store temporary canvas item
         self.temp_item_id = None
 
+        # columnar storage shared by every drawable
+        self.store = SceneStore()
+
+        # spatial index over the drawables in world coordinates, for hit-testing and culling
+        self.__index = SceneIndex()
+
+        # zoom and pan, only drawables near the view have canvas items
+        self.viewport = Viewport(self.canvas, self.__index, self.create_item)
+
         # to store a list of temporary canvas items
-        self.temp_list = DrawableList(self.canvas)
+        self.temp_list = DrawableList(self.viewport, self.store)
+
+        # to store the points of the freehand stroke being drawn
+        self.temp_points = []
+
+        # maximum deviation in pixels when simplifying freehand strokes
+        self.tolerance = 1.0
+
+        # top-level positions of the selected entries in ascending order
+        self.selection = []
+
+        # rubber-band rectangle being dragged out and its start in screen pixels, None otherwise
+        self.marquee = None
+        self.marquee_start = None
+
+        # whether the canvas items of the selection carry the 'selected' tag for dragging
+        self.drag_tagged = False
+
+        # box around the selection in world coordinates while its scale and rotate handles are shown
+        self.handle_box = None
+
+        # radius in screen pixels of the handles, the rotate handle sits this many radii above the box
+        self.handle_size = 5
+        self.handle_lift = 4
 
-        # to store the index for selected item(s)
-        self.selected_idx = None
+        # handle being dragged, 'scale' or 'rotate', None otherwise
+        self.transform_mode = None
 
-        # to store copied or cut item(s)
-        self.clipboard = None
+        # while a handle is dragged: the canvas items showing the selection, their screen coordinates
+        # when the drag started, the centre of the transform and the press point in screen pixels
+        self.transform_items = []
+        self.transform_coords = None
+        self.transform_center = None
+        self.transform_start = None
+
+        # scale factor or angle of the drag so far
+        self.transform_amount = None
+
+        # boxes hidden while their rotated outlines are shown, and the pending frame
+        self.transform_hidden = []
+        self.transform_frame = None
+
+        # radius of the eraser brush in screen pixels
+        self.eraser_radius = 10
+
+        # while the eraser is dragged: what it took so far, the canvas items of the strokes it cut, which
+        # are hidden behind previews of their pieces, the previews, the entries it unbaked and the pending frame
+        self.eraser = None
+        self.eraser_hidden = {}
+        self.eraser_previews = {}
+        self.eraser_unbaked = set()
+        self.eraser_frame = None
+
+        # to store copied or cut entries
+        self.clipboard = []
 
         self.is_cut = False
 
         # used for drawing polygon
         self.first_poly_click = True
 
-        # stores all drawn shapes on screen
-        self.__drawables = DrawableList(self.canvas)
+        # stores all drawn shapes
+        self.__drawables = DrawableList(self.viewport, self.store)
 
-        # stores redo steps
-        self.__redo_stack = []
+        # undo and redo log of every change to the drawables list
+        self.history = History()
 
         # stores indexes to be grouped
         self.grouping_idx = []
 
+        # number of canvas tags handed out to groups
+        self.group_count = 0
+
+        # distance in screen pixels the selected entry was dragged on canvas but not yet in the model
+        self.pending_offset = [0, 0]
+
+        # autosave journal of every change, None when autosave is off
+        self.journal = Journal(autosave_dir) if autosave_dir else None
+
+        # pending look at the journal writer for errors, and the milliseconds between looks
+        self.journal_after = None
+        self.journal_tick = 200
+        self.history.on_change = self.changed
+
+        # every change of the session with keyframes of the scene, for reviewing and replaying it
+        self.timeline = Timeline()
+
+        # the timeline shown in place of the live scene and the live entries kept aside meanwhile,
+        # None otherwise
+        self.review = None
+        self.live_entries = None
+
+        # items of the timeline scene the entries shown in review were built from, and the entry built
+        # from each item by its id
+        self.review_items = None
+        self.review_entries = {}
+
+        # shared board session, None unless joined with join()
+        self.collab = None
+
+        # scene file being loaded in the background, None when idle
+        self.loader = None
+
+        # scene file being written in the background, None when idle
+        self.saver = None
+
+        # label shown before the save started, put back once it is done
+        self.saved_label = ''
+
+        # give the canvas items inside the visible area priority while loading
+        self.load_visible_first = True
+
+        # bake older drawables into a background image once this many canvas items exist, None for off
+        self.raster_items = None
+
+        # handler latency and scene size, off until toggled with F12
+        self.instruments = Instruments(self.gui.get_root(), self.counters)
+
         self.__initialize()
+        self.restore_session()
+        self.timeline.start(self.__drawables)
 
     def __initialize(self):
         # shift key detection for drawing regular shapes (square and circle)
-        self.gui.get_root().bind('<KeyPress-Shift_L>', self.set_regular_mode)
-        self.gui.get_root().bind('<KeyRelease-Shift_L>', self.reset_regular_mode)
+        self.bind(self.gui.get_root(), '<KeyPress-Shift_L>', self.set_regular_mode)
+        self.bind(self.gui.get_root(), '<KeyRelease-Shift_L>', self.reset_regular_mode)
 
         # undo and redo
-        self.gui.get_root().bind('<Control-z>', self.undo)
-        self.gui.get_root().bind('<Control-y>', self.redo)
+        self.bind(self.gui.get_root(), '<Control-z>', self.undo)
+        self.bind(self.gui.get_root(), '<Control-y>', self.redo)
+
+        # pen width
+        self.bind(self.gui.get_root(), '<bracketleft>', self.thinner)
+        self.bind(self.gui.get_root(), '<bracketright>', self.thicker)
 
         # set up behaviours for function buttons
-        self.btn_list[0].bind('<Button-1>', self.set_freehand_mode)
-        self.btn_list[1].bind('<Button-1>', self.set_line_mode)
-        self.btn_list[2].bind('<Button-1>', self.set_rect_mode)
-        self.btn_list[3].bind('<Button-1>', self.set_oval_mode)
-        self.btn_list[4].bind('<Button-1>', self.set_poly_mode)
-        self.btn_list[5].bind('<Button-1>', self.set_cursor_mode)
-        self.btn_list[6].bind('<Button-1>', self.set_grouping_mode)
-        self.btn_list[7].bind('<Button-1>', self.save_file)
-        self.btn_list[8].bind('<Button-1>', self.load_file)
+        self.enable_tools(True)
+        self.bind(self.btn_list[7], '<Button-1>', self.save_file)
+        self.bind(self.btn_list[8], '<Button-1>', self.load_file)
+
+        # zoom with the mouse wheel, pan by dragging with the middle button
+        self.bind(self.canvas, '<MouseWheel>', self.wheel_zoom)
+        self.bind(self.canvas, '<Button-4>', self.wheel_zoom)
+        self.bind(self.canvas, '<Button-5>', self.wheel_zoom)
+        self.bind(self.gui.get_root(), '<Home>', self.fit_view)
+        self.bind(self.canvas, '<Button-2>', self.pan_down)
+        self.bind(self.canvas, '<B2-Motion>', self.pan_drag)
+        self.bind(self.canvas, '<ButtonRelease-2>', self.pan_up)
+
+        # raster cache on and off
+        self.bind(self.gui.get_root(), '<Control-b>', self.toggle_raster_cache)
+
+        # performance overlay on and off, and export of what it recorded
+        self.gui.get_root().bind('<F12>', self.toggle_instruments)
+        self.gui.get_root().bind('<Control-F12>', self.export_instruments)
+
+        # closing the window ends the session cleanly
+        self.gui.get_root().protocol('WM_DELETE_WINDOW', self.quit)
+
+    # every handler is bound through the instruments so its latency can be recorded
+    def bind(self, widget, sequence, handler):
+        widget.bind(sequence, self.instruments.wrap(handler))
+
+    # scene size sampled by the instruments
+    def counters(self):
+        return {'canvas items': len(self.canvas.find_withtag('all')),
+                'vector items': len(self.viewport),
+                'entries': len(self.__drawables),
+                'store KB': self.store.nbytes() // 1024}
+
+    # a message after the name of the mode in the status label, until the next one or a mode change
+    def show_status(self, text):
+        mode = self.gui.get_label_text().split(' - ')[0]
+        self.gui.set_label_text(mode + ' - ' + text if mode else text)
+
+    def toggle_instruments(self, _):
+        self.instruments.enable(not self.instruments.enabled, self.canvas)
+
+    def export_instruments(self, _):
+        if not self.instruments.enabled:
+            return
+
+        os.makedirs(STATS_DIR, exist_ok=True)
+        path = os.path.join(STATS_DIR, 'stats-' + time.strftime('%Y%m%d-%H%M%S') + '.json')
+        self.instruments.export(path)
+        self.show_status('statistics written to ' + path)
+
+    # drawing and editing tools, switched off while a scene is loading
+    def enable_tools(self, enabled):
+        tools = [self.set_freehand_mode,
+                 self.set_line_mode,
+                 self.set_rect_mode,
+                 self.set_oval_mode,
+                 self.set_poly_mode,
+                 self.set_cursor_mode,
+                 self.set_grouping_mode]
+
+        for btn, tool in zip(self.btn_list, tools):
+            self.bind(btn, '<Button-1>', tool if enabled else self.dummy_behavior)
+
+        # the eraser and the timeline have no buttons
+        self.bind(self.gui.get_root(), '<Key-e>', self.set_eraser_mode if enabled else self.dummy_behavior)
+        self.bind(self.gui.get_root(), '<Key-t>', self.set_timeline_mode if enabled else self.dummy_behavior)
 
     # set regular mode when shift is down
     def set_regular_mode(self, _):
@@ -84,31 +279,310 @@ class Controller:
     # reset regular mode when shift is up
     def reset_regular_mode(self, _):
         self.regular = False
-        self.gui.get_root().bind('<KeyPress-Shift_L>', self.set_regular_mode)
+        self.bind(self.gui.get_root(), '<KeyPress-Shift_L>', self.set_regular_mode)
 
-    # undo when Control+z
-    def undo(self, _):
-        if not self.__drawables.get_list():
-            return
+    # end point of the shape dragged from (x0, y0), limited to a square when regular flag is set
+    def constrain(self, x, y):
+        if not self.regular:
+            return x, y
 
-        item = self.__drawables[-1]
-        self.__redo_stack.append(item)
-        del self.__drawables[-1]
+        width = x - self.x0
+        height = y - self.y0
+        side = min(abs(width), abs(height))
 
-        self.delete_items_recur(item)
+        return (self.x0 + side if width >= 0 else self.x0 - side,
+                self.y0 + side if height >= 0 else self.y0 - side)
+
+    # undo when Control+z
+    def undo(self, _):
+        if self.loader is None and self.review is None and self.history.undo(self):
+            self.viewport.refresh()
+            self.selection = []
+            self.grouping_idx = []
+            self.update_handles()
 
     # redo when Control+y
     def redo(self, _):
-        if not self.__redo_stack:
-            return
+        if self.loader is None and self.review is None and self.history.redo(self):
+            self.viewport.refresh()
+            self.selection = []
+            self.grouping_idx = []
+            self.update_handles()
+
+    # zoom in or out around the mouse pointer
+    def wheel_zoom(self, event):
+        if getattr(event, 'num', None) == 5 or getattr(event, 'delta', 0) < 0:
+            self.viewport.zoom(1 / 1.25, event.x, event.y)
+        else:
+            self.viewport.zoom(1.25, event.x, event.y)
+        self.update_handles()
 
-        item = self.__redo_stack[-1]
-        del self.__redo_stack[-1]
+    def pan_down(self, event):
+        self.pan_x, self.pan_y = event.x, event.y
+        self.viewport.panning = True
 
-        self.paste_items(item, self.__drawables, 0)
+    def pan_drag(self, event):
+        self.viewport.pan(event.x - self.pan_x, event.y - self.pan_y)
+        self.pan_x, self.pan_y = event.x, event.y
 
-    def clear_redo(self):
-        self.__redo_stack = []
+    def pan_up(self, _):
+        self.viewport.end_pan()
+
+    # keep at most max_items canvas items by baking the older drawables into an image, None for vectors only
+    def set_raster_cache(self, max_items):
+        self.raster_items = max_items
+        if max_items is None:
+            self.viewport.enable_raster(None)
+        else:
+            self.viewport.enable_raster(RasterLayer(self.canvas, self.gui.photo_image, self.gui.get_root(), max_items))
+
+    def toggle_raster_cache(self, _):
+        self.set_raster_cache(2000 if self.raster_items is None else None)
+        self.show_status('raster cache ' + ('on' if self.raster_items else 'off'))
+
+    # restore the scene of a session that did not close cleanly, then start journaling this one
+    def restore_session(self):
+        if self.journal is None:
+            return
+
+        if self.journal.has_recovery():
+            try:
+                tree = self.journal.recover()
+            except (OSError, ValueError, KeyError, IndexError) as e:
+                self.show_status('autosave journal could not be read: ' + str(e))
+                tree = []
+
+            container = []
+            for item in tree:
+                self.deserialize(item, container)
+            self.replace_entries(container)
+            self.viewport.refresh()
+
+        self.journal.start(self.__drawables)
+        self.watch_journal()
+
+    # every change applied or reverted goes to the timeline, the autosave journal and the shared board
+    def changed(self, command, done):
+        record = command.journal(done)
+        self.log(record)
+        if self.collab is not None:
+            self.collab.local_change(record)
+
+    # every change to the scene, made here or by another client, is recorded on the timeline and autosaved
+    def log(self, record):
+        self.timeline.record(record, self.__drawables)
+        self.autosave(record)
+
+    # append a change to the journal, or snapshot the scene once the journal outgrows it
+    def autosave(self, record):
+        if self.journal is None:
+            return
+
+        # a journal that failed to write a record starts over from a snapshot of the scene
+        if record is None or self.journal.failed or self.journal.needs_compaction():
+            self.journal.compact(self.__drawables)
+        else:
+            self.journal.record(record)
+        self.watch_journal()
+
+    # look for errors of the journal writer between events for as long as it has work
+    def watch_journal(self):
+        if self.journal_after is None:
+            self.journal_after = self.gui.get_root().after(self.journal_tick, self.check_journal)
+
+    def check_journal(self):
+        self.journal_after = None
+
+        # asked first, so an error of the last task is already there when the writer is done
+        busy = self.journal.busy()
+        error = self.journal.take_error()
+        if error is not None:
+            self.show_status('autosave failed: ' + str(error))
+        if busy or error is not None:
+            self.watch_journal()
+
+    def quit(self):
+        if self.review is not None:
+            self.leave_timeline(None)
+        if self.loader is not None:
+            self.cancel_load()
+        if self.collab is not None:
+            self.collab.close()
+        if self.saver is not None:
+            self.saver.wait()
+        if self.journal is not None:
+            if self.journal_after is not None:
+                self.gui.get_root().after_cancel(self.journal_after)
+            self.journal.close(clean=True)
+        self.gui.get_root().destroy()
+
+    # share the scene with the other clients of a collaboration server
+    def join(self, host, port):
+        self.collab = CollabSession(self, host, port)
+        self.collab.start()
+
+    # changes made by other clients bypass the history, its commands are rebased onto them instead
+    def remote_insert(self, position, tree):
+        container = []
+        self.deserialize(tree, container)
+        self.insert_entry(position, container[0])
+        self.log(['insert', position, tree])
+        self.history.rebase(self, position, 1)
+        return container[0]
+
+    def remote_remove(self, position):
+        entry = self.remove_entry(position)
+        self.set_visible(entry, False)
+        self.log(['pop', position])
+        self.history.rebase(self, position, -1)
+
+    # the history follows every remote change as it is applied, only the selection is dropped after a batch
+    def remote_changed(self):
+        self.selection = []
+        self.grouping_idx = []
+        self.viewport.refresh()
+        self.update_handles()
+
+    # apply a command and record it for undo, a selection is dropped once the top-level positions
+    # it holds may point at other entries
+    def execute(self, command):
+        count = len(self.__drawables)
+        command.do(self)
+        self.history.push(self, command)
+        self.viewport.refresh()
+        if self.selection and len(self.__drawables) != count:
+            self.selection = []
+            self.update_handles()
+
+    # append a newly drawn top-level entry
+    def add_entry(self, item):
+        self.execute(AddEntry(item))
+
+    def get_drawables(self):
+        return self.__drawables
+
+    # the primitives below keep the drawables list and the index in step, commands are built from them
+    def insert_entry(self, position, entry):
+        self.__drawables.get_list().insert(position, entry)
+        self.__index.add(entry)
+        self.__index.shifted(position)
+
+    def remove_entry(self, position):
+        entry = self.__drawables[position]
+        self.__index.remove(entry)
+        del self.__drawables[position]
+        self.__index.shifted(position)
+        return entry
+
+    # swap the entry at a position for one sharing part of it, only what differs is indexed and drawn again
+    def replace_entry(self, position, entry):
+        old = self.__drawables[position]
+        self.__drawables.get_list()[position] = entry
+        self.__index.replace(old, entry)
+        self.__index.shifted(position)
+        self.viewport.replace(old, entry)
+        return old
+
+    def extend_entries(self, entries):
+        self.__drawables.get_list().extend(entries)
+        for entry in entries:
+            self.__index.add(entry)
+
+    # take the last count entries out of the scene
+    def truncate_entries(self, count):
+        entries = self.__drawables.get_list()
+        start = len(entries) - count
+        for entry in entries[start:]:
+            self.__index.remove(entry)
+        del entries[start:]
+        self.__index.shifted(start)
+
+    # group and ungroup only move parent pointers, the items themselves stay indexed
+    def attach_entry(self, position, entry):
+        self.__drawables.get_list().insert(position, entry)
+        self.__index.reassign(entry)
+        self.__index.shifted(position)
+
+    def detach_entry(self, position):
+        entry = self.__drawables[position]
+        del self.__drawables[position]
+        self.__index.detach(entry)
+        self.__index.shifted(position)
+        return entry
+
+    # the entries at ascending positions taken out in one pass over the list instead of one deletion each
+    def detach_entries(self, positions):
+        entries = self.__drawables.get_list()
+        taken = [entries[i] for i in positions]
+
+        kept = []
+        start = 0
+        for i in positions:
+            kept.extend(entries[start:i])
+            start = i + 1
+        kept.extend(entries[start:])
+        entries[:] = kept
+
+        for entry in taken:
+            self.__index.detach(entry)
+        if positions:
+            self.__index.shifted(positions[0])
+        return taken
+
+    # (position, entry) pairs by ascending position put back in one pass, the reverse of detach_entries
+    def attach_entries(self, pairs):
+        entries = self.__drawables.get_list()
+        merged = []
+        start = 0
+        first = None
+        for position, entry in pairs:
+            take = position - len(merged)
+            merged.extend(entries[start:start + take])
+            start += take
+            merged.append(entry)
+            self.__index.reassign(entry)
+            if first is None:
+                first = position
+        merged.extend(entries[start:])
+        entries[:] = merged
+
+        if first is not None:
+            self.__index.shifted(first)
+
+    # entries that are not indexed yet are added to the index one by one later (progressive load)
+    def replace_entries(self, entries, indexed=True):
+        old = self.__drawables.get_list()
+        self.__drawables.set_list(entries)
+        if indexed:
+            self.__index.rebuild(entries)
+        else:
+            self.__index.clear()
+        return old
+
+    # the scene swapped for entries that share most of their top-level entries with it, only the ones
+    # removed and added are indexed again
+    def update_entries(self, entries, removed, added):
+        self.__drawables.set_list(entries)
+        for entry in removed:
+            self.__index.remove(entry)
+        for entry in added:
+            self.__index.add(entry)
+        self.__index.shifted(0)
+
+    # offset in world units
+    def shift_entry(self, position, offset):
+        entry = self.__drawables[position]
+        self.move(entry, [offset[0] * self.viewport.scale, offset[1] * self.viewport.scale])
+        self.translate(entry, offset)
+        self.__index.update(entry)
+        self.viewport.moved(entry)
+
+    def set_visible(self, entry, visible):
+        # entries outside the scene have no canvas items, the ones in it get them when near the view
+        if visible:
+            self.viewport.show(entry)
+        else:
+            self.viewport.hide(entry)
 
     # canvas behaviour for drawing straight lines
     def set_line_mode(self, _):
@@ -118,9 +592,9 @@ class Controller:
         self.gui.set_label_text('Line Mode')
 
         # set interaction behaviours
-        self.canvas.bind('<Button-1>', self.line_down)
-        self.canvas.bind('<B1-Motion>', self.line_drag)
-        self.canvas.bind('<ButtonRelease-1>', self.line_up)
+        self.bind(self.canvas, '<Button-1>', self.line_down)
+        self.bind(self.canvas, '<B1-Motion>', self.line_drag)
+        self.bind(self.canvas, '<ButtonRelease-1>', self.line_up)
 
     def line_down(self, event):
         self.x0, self.y0 = event.x, event.y
@@ -134,19 +608,11 @@ class Controller:
                                                     )
 
     def line_drag(self, event):
-        self.canvas.delete(self.temp_item_id)
-        self.temp_item_id = self.canvas.create_line(self.x0,
-                                                    self.y0,
-                                                    event.x,
-                                                    event.y,
-                                                    width=self.width,
-                                                    fill=self.gui.get_color(),
-                                                    tags='line'
-                                                    )
+        # reshape the preview in place instead of recreating it
+        self.canvas.coords(self.temp_item_id, self.x0, self.y0, event.x, event.y)
 
     def line_up(self, _):
-        self.__drawables.append(self.temp_item_id)
-        self.clear_redo()
+        self.add_entry(self.__drawables.make_drawable(self.temp_item_id))
         self.temp_item_id = None
 
     # canvas behaviour for freehand drawing
@@ -157,32 +623,55 @@ class Controller:
         self.gui.set_label_text('Scribble Mode')
 
         # set interaction behaviours
-        self.canvas.bind('<Button-1>', self.fh_down)
-        self.canvas.bind('<B1-Motion>', self.fh_drag)
-        self.canvas.bind('<ButtonRelease-1>', self.fh_up)
+        self.bind(self.canvas, '<Button-1>', self.fh_down)
+        self.bind(self.canvas, '<B1-Motion>', self.fh_drag)
+        self.bind(self.canvas, '<ButtonRelease-1>', self.fh_up)
 
     def fh_down(self, event):
         self.x0, self.y0 = event.x, event.y
+        self.temp_points = [event.x, event.y]
+        if self.collab is not None:
+            self.collab.ink(*self.viewport.to_world([event.x, event.y]))
+
+        # the whole stroke is a single polyline item that grows as the pen moves
+        self.temp_item_id = self.create_item('freehand',
+                                             [event.x, event.y, event.x, event.y],
+                                             self.gui.get_color()
+                                             )
 
     def fh_drag(self, event):
-        self.temp_list.append(self.canvas.create_line(self.x0,
-                                                      self.y0,
-                                                      event.x,
-                                                      event.y,
-                                                      width=self.width,
-                                                      fill=self.gui.get_color(),
-                                                      tags='freehand'
-                                                      )
-                              )
+        if self.temp_item_id is None:
+            return
+
+        # append the new point to the polyline instead of creating a new canvas item
+        self.temp_points.append(event.x)
+        self.temp_points.append(event.y)
+        self.canvas.insert(self.temp_item_id, 'end', (event.x, event.y))
+        if self.collab is not None:
+            self.collab.ink(*self.viewport.to_world([event.x, event.y]))
 
         self.x0, self.y0 = event.x, event.y
 
     def fh_up(self, _):
-        self.__drawables.append(self.temp_list)
-        self.clear_redo()
-        self.temp_list.clear()
+        if self.temp_item_id is None:
+            return
+
+        # a click without dragging leaves a dot
+        if len(self.temp_points) < 4:
+            self.temp_points = self.temp_points * 2
 
-        print(self.__drawables)
+        # drop points that do not change the shape of the stroke by more than the tolerance
+        coords = [float(coord) for coord in simplify(self.temp_points, self.tolerance)]
+        self.canvas.coords(self.temp_item_id, *coords)
+
+        drawable = Drawable(self.store.new_ident(), 'freehand', self.viewport.to_world(coords),
+                            self.gui.get_color(), self.store, self.width)
+        self.viewport.adopt(drawable, self.temp_item_id)
+        if self.collab is not None:
+            self.collab.ink_end()
+        self.add_entry(drawable)
+        self.temp_item_id = None
+        self.temp_points = []
 
     # canvas behaviour for drawing rectangles (and squares)
     def set_rect_mode(self, _):
@@ -192,9 +681,9 @@ class Controller:
         self.gui.set_label_text('Rectangle Mode')
 
         # set interaction behaviours
-        self.canvas.bind('<Button-1>', self.rect_down)
-        self.canvas.bind('<B1-Motion>', self.rect_drag)
-        self.canvas.bind('<ButtonRelease-1>', self.rect_up)
+        self.bind(self.canvas, '<Button-1>', self.rect_down)
+        self.bind(self.canvas, '<B1-Motion>', self.rect_drag)
+        self.bind(self.canvas, '<ButtonRelease-1>', self.rect_up)
 
     def rect_down(self, event):
         self.x0, self.y0 = event.x, event.y
@@ -208,72 +697,11 @@ class Controller:
                                                          )
 
     def rect_drag(self, event):
-        self.canvas.delete(self.temp_item_id)
-
-        # draw square when regular flag is set
-        if self.regular:
-            width = event.x - self.x0
-            height = event.y - self.y0
-
-            # handle four different cases
-            if width >= 0 and height >= 0:
-                side = min(width, height)
-                self.temp_item_id = self.canvas.create_rectangle(self.x0,
-                                                                 self.y0,
-                                                                 self.x0 + side,
-                                                                 self.y0 + side,
-                                                                 width=self.width,
-                                                                 outline=self.gui.get_color(),
-                                                                 tags='rectangle'
-                                                                 )
-
-            elif width >= 0 and height < 0:
-                side = min(width, -height)
-                self.temp_item_id = self.canvas.create_rectangle(self.x0,
-                                                                 self.y0,
-                                                                 self.x0 + side,
-                                                                 self.y0 - side,
-                                                                 width=self.width,
-                                                                 outline=self.gui.get_color(),
-                                                                 tags='rectangle'
-                                                                 )
-
-            elif width < 0 and height >= 0:
-                side = min(-width, height)
-                self.temp_item_id = self.canvas.create_rectangle(self.x0,
-                                                                 self.y0,
-                                                                 self.x0 - side,
-                                                                 self.y0 + side,
-                                                                 width=self.width,
-                                                                 outline=self.gui.get_color(),
-                                                                 tags='rectangle'
-                                                                 )
-
-            else:
-                side = min(-width, -height)
-                self.temp_item_id = self.canvas.create_rectangle(self.x0,
-                                                                 self.y0,
-                                                                 self.x0 - side,
-                                                                 self.y0 - side,
-                                                                 width=self.width,
-                                                                 outline=self.gui.get_color(),
-                                                                 tags='rectangle'
-                                                                 )
-
-        # otherwise draw rectangle
-        else:
-            self.temp_item_id = self.canvas.create_rectangle(self.x0,
-                                                             self.y0,
-                                                             event.x,
-                                                             event.y,
-                                                             width=self.width,
-                                                             outline=self.gui.get_color(),
-                                                             tags='rectangle'
-                                                             )
+        # reshape the preview in place, as a square when regular flag is set
+        self.canvas.coords(self.temp_item_id, self.x0, self.y0, *self.constrain(event.x, event.y))
 
     def rect_up(self, _):
-        self.__drawables.append(self.temp_item_id)
-        self.clear_redo()
+        self.add_entry(self.__drawables.make_drawable(self.temp_item_id))
         self.temp_item_id = None
 
     # canvas behaviour for drawing ovals (and circles)
@@ -284,9 +712,9 @@ class Controller:
         self.gui.set_label_text('Oval Mode')
 
         # set interaction behaviours
-        self.canvas.bind('<Button-1>', self.oval_down)
-        self.canvas.bind('<B1-Motion>', self.oval_drag)
-        self.canvas.bind('<ButtonRelease-1>', self.oval_up)
+        self.bind(self.canvas, '<Button-1>', self.oval_down)
+        self.bind(self.canvas, '<B1-Motion>', self.oval_drag)
+        self.bind(self.canvas, '<ButtonRelease-1>', self.oval_up)
 
     def oval_down(self, event):
         self.x0, self.y0 = event.x, event.y
@@ -300,72 +728,11 @@ class Controller:
                                                     )
 
     def oval_drag(self, event):
-        self.canvas.delete(self.temp_item_id)
-
-        # draw circle when regular flag is set
-        if self.regular:
-            width = event.x - self.x0
-            height = event.y - self.y0
-
-            # handle four difference cases
-            if width >= 0 and height >= 0:
-                side = min(width, height)
-                self.temp_item_id = self.canvas.create_oval(self.x0,
-                                                            self.y0,
-                                                            self.x0 + side,
-                                                            self.y0 + side,
-                                                            width=self.width,
-                                                            outline=self.gui.get_color(),
-                                                            tag='oval'
-                                                            )
-
-            elif width >= 0 and height < 0:
-                side = min(width, -height)
-                self.temp_item_id = self.canvas.create_oval(self.x0,
-                                                            self.y0,
-                                                            self.x0 + side,
-                                                            self.y0 - side,
-                                                            width=self.width,
-                                                            outline=self.gui.get_color(),
-                                                            tag='oval'
-                                                            )
-
-            elif width < 0 and height >= 0:
-                side = min(-width, height)
-                self.temp_item_id = self.canvas.create_oval(self.x0,
-                                                            self.y0,
-                                                            self.x0 - side,
-                                                            self.y0 + side,
-                                                            width=self.width,
-                                                            outline=self.gui.get_color(),
-                                                            tag='oval'
-                                                            )
-
-            else:
-                side = min(-width, -height)
-                self.temp_item_id = self.canvas.create_oval(self.x0,
-                                                            self.y0,
-                                                            self.x0 - side,
-                                                            self.y0 - side,
-                                                            width=self.width,
-                                                            outline=self.gui.get_color(),
-                                                            tag='oval'
-                                                            )
-
-        # otherwise draw oval
-        else:
-            self.temp_item_id = self.canvas.create_oval(self.x0,
-                                                        self.y0,
-                                                        event.x,
-                                                        event.y,
-                                                        width=self.width,
-                                                        outline=self.gui.get_color(),
-                                                        tag='oval'
-                                                        )
+        # reshape the preview in place, as a circle when regular flag is set
+        self.canvas.coords(self.temp_item_id, self.x0, self.y0, *self.constrain(event.x, event.y))
 
     def oval_up(self, _):
-        self.__drawables.append(self.temp_item_id)
-        self.clear_redo()
+        self.add_entry(self.__drawables.make_drawable(self.temp_item_id))
         self.temp_item_id = None
 
     # canvas behaviour for drawing polygons
@@ -376,9 +743,9 @@ class Controller:
         self.gui.set_label_text('Polygon Mode')
 
         # set interaction behaviours
-        self.canvas.bind('<Button-1>', self.poly_left)
-        self.canvas.bind('<Motion>', self.poly_move)
-        self.canvas.bind('<Button-3>', self.poly_right)
+        self.bind(self.canvas, '<Button-1>', self.poly_left)
+        self.bind(self.canvas, '<Motion>', self.poly_move)
+        self.bind(self.canvas, '<Button-3>', self.poly_right)
         self.first_poly_click = True
 
     def poly_left(self, event):
@@ -411,24 +778,15 @@ class Controller:
 
     def poly_move(self, event):
 
-        # draw temporary lines for visual purpose
+        # move the end of the temporary line for visual purpose
         if not self.first_poly_click:
-            self.canvas.delete(self.temp_item_id)
-            self.temp_item_id = self.canvas.create_line(self.x0,
-                                                        self.y0,
-                                                        event.x,
-                                                        event.y,
-                                                        width=self.width,
-                                                        fill=self.gui.get_color(),
-                                                        tag='poly'
-                                                        )
+            self.canvas.coords(self.temp_item_id, self.x0, self.y0, event.x, event.y)
 
     def poly_right(self, _):
         if self.temp_item_id:
             self.temp_list.append(self.temp_item_id)
         if self.temp_list:
-            self.__drawables.append(self.temp_list)
-            self.clear_redo()
+            self.add_entry(self.make_group(self.temp_list.get_list()))
         self.temp_list.clear()
         self.first_poly_click = True
 
@@ -440,320 +798,899 @@ class Controller:
         self.gui.set_label_text('Cursor Mode')
 
         # set interaction behaviours
-        self.canvas.bind('<Button-1>', self.cursor_single)
-        self.canvas.bind('<B1-Motion>', self.cursor_drag)
-        self.gui.get_root().bind('<Control-x>', self.cut)
-        self.gui.get_root().bind('<Control-c>', self.copy)
-        self.gui.get_root().bind('<Control-v>', self.paste)
+        self.bind(self.canvas, '<Button-1>', self.cursor_single)
+        self.bind(self.canvas, '<B1-Motion>', self.cursor_drag)
+        self.bind(self.canvas, '<ButtonRelease-1>', self.cursor_up)
+        self.bind(self.gui.get_root(), '<Control-x>', self.cut)
+        self.bind(self.gui.get_root(), '<Control-c>', self.copy)
+        self.bind(self.gui.get_root(), '<Control-v>', self.paste)
+        self.bind(self.gui.get_root(), '<Control-d>', self.duplicate)
+        self.bind(self.gui.get_root(), '<Control-r>', self.restyle_styles)
+        self.bind(self.gui.get_root(), '<Delete>', self.delete)
 
     def cursor_single(self, event):
+        self.x0, self.y0 = event.x, event.y
 
-        # find the canvas item that the mouse clicked on
-        clicked = list(self.canvas.find_withtag('current'))
+        handle = self.find_handle(event)
+        if handle is not None:
+            self.begin_transform(handle, event)
+            return
 
-        if not clicked:
+        # find the canvas item that the mouse clicked on
+        clicked = self.find_clicked(event)
+
+        if clicked is None:
+            # a press on empty canvas starts a rubber-band selection
+            self.selection = []
+            self.marquee_start = (event.x, event.y)
+            self.marquee = self.canvas.create_rectangle(event.x, event.y, event.x, event.y,
+                                                        dash=(4, 2),
+                                                        outline='#1f77b4',
+                                                        tags='marquee'
+                                                        )
             return
 
-        self.x0, self.y0 = event.x, event.y
+        # look up the top-level entry owning the clicked item, pressing on a selected entry keeps
+        # the whole selection so it can be dragged together
+        position = self.search(clicked)
+        if position not in self.selection:
+            self.selection = [position] if position >= 0 else []
+
+        # baked entries need their canvas items back to be dragged
+        self.viewport.unbake(self.__drawables[i] for i in self.selection)
+
+    def find_clicked(self, event):
+        # ident of the topmost drawable under the mouse, found through the spatial index
+        x, y = self.viewport.to_world([event.x, event.y])
+        return self.__index.hit(x, y, self.width / self.viewport.scale)
 
-        # recursively search for adjacent items
-        self.selected_idx = self.search(self.__drawables.get_list(), clicked[0])
-
-    def search(self, container, item):
-        # recursive search algorithm to determine the top-level position of the clicked canvas item
-        for idx, i in enumerate(container):
-            if isinstance(i, Drawable):
-                if i.ident == item:
-                    return idx
-
-            elif type(i) is list:
-                if self.does_contain(i, item):
-                    return idx
-        return -1
-
-    def does_contain(self, container, item):
-        for i in container:
-            if isinstance(i, Drawable):
-                if i.ident == item:
-                    return True
-            elif type(i) is list:
-                return self.does_contain(i, item)
+    def search(self, item):
+        # top-level position of the entry owning a drawable, -1 if there is none
+        return self.__index.position(item, self.__drawables.get_list())
 
     def cursor_drag(self, event):
-        #continually find the canvas item(s) being clicked on
-        clicked = list(self.canvas.find_withtag('current'))
-        if not clicked:
+        if self.marquee is not None:
+            self.canvas.coords(self.marquee, *self.marquee_start, event.x, event.y)
             return
-        self.selected_idx = self.search(self.__drawables.get_list(), clicked[0])
 
-        if self.selected_idx is not None:
-            to_be_moved = self.__drawables[self.selected_idx]
-            offset = [event.x - self.x0, event.y - self.y0]
+        if self.transform_mode is not None:
+            self.transform_drag(event)
+            return
 
-            # recursively move every item
-            if type(to_be_moved) is list:
-                self.move(to_be_moved, offset)
-            else:
-                self.canvas.move(to_be_moved.ident, offset[0], offset[1])
-                to_be_moved.coords = self.canvas.coords(to_be_moved.ident)
+        # move the entries selected when the button was pressed
+        if not self.selection:
+            return
 
-            self.x0, self.y0 = event.x, event.y
-            self.selected_idx = None
+        # one canvas operation moves the whole selection, the model catches up on release
+        if not self.drag_tagged:
+            self.canvas.delete('handle')
+            for position in self.selection:
+                tag = self.canvas_tag(self.__drawables[position])
+                if tag is not None:
+                    self.canvas.addtag_withtag('selected', tag)
+            self.drag_tagged = True
+
+        offset = [event.x - self.x0, event.y - self.y0]
+        self.canvas.move('selected', offset[0], offset[1])
+        if self.collab is not None:
+            self.collab.drag(self.selection, offset[0] / self.viewport.scale, offset[1] / self.viewport.scale)
+        self.pending_offset[0] += offset[0]
+        self.pending_offset[1] += offset[1]
 
-    def move(self, items, offset):
-        # recursive move algorithm
-        for i in items:
-            if type(i) is list:
-                self.move(i, offset)
-            else:
-                self.canvas.move(i.ident, offset[0], offset[1])
-                i.coords = self.canvas.coords(i.ident)
+        self.x0, self.y0 = event.x, event.y
+
+    def cursor_up(self, event):
+        if self.marquee is not None:
+            self.select_inside(*self.marquee_start, event.x, event.y)
+            self.update_handles()
+            return
+
+        if self.transform_mode is not None:
+            self.end_transform()
+            return
+
+        if self.drag_tagged:
+            self.canvas.dtag('selected')
+            self.drag_tagged = False
+
+        if self.selection and self.pending_offset != [0, 0]:
+            # sync the model and the index with the canvas once the drag is over
+            offset = [self.pending_offset[0] / self.viewport.scale, self.pending_offset[1] / self.viewport.scale]
+            self.translate([self.__drawables[position] for position in self.selection], offset)
+            for position in self.selection:
+                entry = self.__drawables[position]
+                self.__index.update(entry)
+                self.viewport.moved(entry)
+
+            # the canvas has already moved, only record the step
+            self.history.push(self, batch([MoveEntry(position, *offset) for position in self.selection]))
+            self.pending_offset = [0, 0]
+
+            # members that were off screen may have moved into view
+            self.viewport.refresh()
+
+        self.update_handles()
+
+    # draw the scale and rotate handles around the selection, or remove them when nothing is selected
+    def update_handles(self):
+        self.canvas.delete('handle')
+        self.handle_box = None
+        if self.mode != 'cursor' or not self.selection:
+            return
+
+        self.handle_box = self.scene_box([self.__drawables[position] for position in self.selection])
+        x0, y0, x1, y1 = self.viewport.to_screen(self.handle_box)
+        r = self.handle_size
+        rotate_x, rotate_y = (x0 + x1) / 2, y0 - self.handle_lift * r
+        self.canvas.create_rectangle(x0, y0, x1, y1, dash=(2, 2), outline='#1f77b4', tags='handle')
+        self.canvas.create_line(rotate_x, y0, rotate_x, rotate_y, fill='#1f77b4', tags='handle')
+        self.canvas.create_rectangle(x1 - r, y1 - r, x1 + r, y1 + r, outline='#1f77b4', fill='white', tags='handle')
+        self.canvas.create_oval(rotate_x - r, rotate_y - r, rotate_x + r, rotate_y + r, outline='#1f77b4',
+                                fill='white', tags='handle')
+
+    # 'scale' or 'rotate' when the press is on one of the handles, None otherwise
+    def find_handle(self, event):
+        if self.handle_box is None:
+            return None
+
+        x0, y0, x1, y1 = self.viewport.to_screen(self.handle_box)
+        reach = self.handle_size + 2
+        if math.hypot(event.x - x1, event.y - y1) <= reach:
+            return 'scale'
+        if math.hypot(event.x - (x0 + x1) / 2, event.y - (y0 - self.handle_lift * self.handle_size)) <= reach:
+            return 'rotate'
+        return None
+
+    # start scaling or rotating the selection around the centre of its box; the drag only changes
+    # the canvas, from the screen coordinates the items had at the press
+    def begin_transform(self, mode, event):
+        entries = [self.__drawables[position] for position in self.selection]
+        self.viewport.unbake(entries)
+        self.canvas.delete('handle')
+
+        x0, y0, x1, y1 = self.viewport.to_screen(self.handle_box)
+        self.transform_mode = mode
+        self.transform_center = ((x0 + x1) / 2, (y0 + y1) / 2)
+        self.transform_start = (event.x, event.y)
+        self.transform_amount = 1.0 if mode == 'scale' else 0.0
+
+        # screen coordinates live in a scratch store so the whole selection is transformed in one pass
+        screen = SceneStore()
+        rows = []
+        self.transform_items = []
+        self.transform_hidden = []
+        for leaf in leaves(entries):
+            item = self.viewport.item(leaf)
+            if item is None:
+                continue
+            coords = self.canvas.coords(item)
+
+            # a rotated box is shown by its outline until the model catches up
+            if mode == 'rotate' and leaf.tag in BOXES:
+                self.canvas.itemconfigure(item, state='hidden')
+                self.transform_hidden.append(item)
+                coords = box_outline(leaf.tag, coords)
+                item = self.create_item('poly', coords, leaf.color, ('transform_preview',), leaf.width)
+
+            rows.append(screen.add(0, leaf.tag, coords, leaf.color))
+            self.transform_items.append(item)
+        self.transform_coords = PackedCoords(screen, rows)
+
+    def transform_drag(self, event):
+        cx, cy = self.transform_center
+        sx, sy = self.transform_start
+        if self.transform_mode == 'scale':
+            start = math.hypot(sx - cx, sy - cy)
+            self.transform_amount = max(math.hypot(event.x - cx, event.y - cy) / start, 0.05) if start else 1.0
+        else:
+            # screen y points down, counterclockwise on screen is a negative change of atan2
+            self.transform_amount = math.atan2(sy - cy, sx - cx) - math.atan2(event.y - cy, event.x - cx)
+
+        # motion events come faster than frames, the canvas is updated once they have been handled
+        if self.transform_frame is None:
+            self.transform_frame = self.gui.get_root().after_idle(self.draw_transform)
+
+    def draw_transform(self):
+        self.transform_frame = None
+        frame = self.transform_coords.copy()
+        frame.transform(*self.transform_matrix(*self.transform_center))
+        for i, item in enumerate(self.transform_items):
+            self.canvas.coords(item, *frame.coords(i))
+
+    # affine matrix of the drag so far around the point (cx, cy)
+    def transform_matrix(self, cx, cy):
+        if self.transform_mode == 'scale':
+            return scaling(self.transform_amount, self.transform_amount, cx, cy)
+        return rotation(self.transform_amount, cx, cy)
+
+    def end_transform(self):
+        if self.transform_frame is not None:
+            self.gui.get_root().after_cancel(self.transform_frame)
+            self.transform_frame = None
+        self.canvas.delete('transform_preview')
+        for item in self.transform_hidden:
+            self.canvas.itemconfigure(item, state='normal')
+
+        entries = [self.__drawables[position] for position in self.selection]
+        if self.transform_amount != (1.0 if self.transform_mode == 'scale' else 0.0):
+            matrix = self.transform_matrix(*self.viewport.to_world(list(self.transform_center)))
+            self.execute(TransformEntries(self.selection, matrix))
+        else:
+            for entry in entries:
+                self.viewport.reshaped(entry)
+
+        self.transform_mode = None
+        self.transform_items = []
+        self.transform_hidden = []
+        self.transform_coords = None
+        self.update_handles()
+
+    # select every top-level entry with a drawable lying entirely inside the screen rectangle
+    def select_inside(self, sx0, sy0, sx1, sy1):
+        self.canvas.delete(self.marquee)
+        self.marquee = self.marquee_start = None
+
+        x0, y0, x1, y1 = self.viewport.to_world([min(sx0, sx1), min(sy0, sy1), max(sx0, sx1), max(sy0, sy1)])
+        positions = {self.search(ident) for ident in self.__index.inside(x0, y0, x1, y1)}
+        positions.discard(-1)
+        self.selection = sorted(positions)
+
+        self.viewport.unbake(self.__drawables[i] for i in self.selection)
+
+    # offset in screen pixels
+    def move(self, item, offset):
+        tag = self.canvas_tag(item)
+        if tag is not None:
+            self.canvas.move(tag, offset[0], offset[1])
+
+    def translate(self, item, offset):
+        # shift the stored coordinates of every drawable in an entry, or in a list of entries, at once
+        coords = PackedCoords(self.store, [leaf.row for leaf in leaves(item)])
+        coords.translate(offset[0], offset[1])
+        coords.write(self.store)
+
+    # box around every drawable of the scene, or of a list of entries, in world coordinates, None when empty
+    def scene_box(self, entries=None):
+        if entries is None:
+            entries = self.__drawables.get_list()
+        return PackedCoords(self.store, [leaf.row for leaf in leaves(entries)]).bbox()
+
+    # map every drawable of the entries through an affine matrix in one pass, rectangles and ovals
+    # become polygons when the matrix rotates them
+    def transform_entries(self, entries, matrix):
+        drawables = list(leaves(entries))
+        if rotates(matrix):
+            for leaf in drawables:
+                if leaf.tag in BOXES:
+                    self.viewport.hide(leaf)
+                    leaf.coords = box_outline(leaf.tag, leaf.coords)
+                    leaf.tag = 'poly'
+
+        coords = PackedCoords(self.store, [leaf.row for leaf in drawables])
+        coords.transform(*matrix)
+        coords.write(self.store)
+        self.reshaped(entries)
+
+    # (style index, coordinates) of every drawable of the entries
+    def get_shapes(self, entries):
+        return [(leaf.style, leaf.coords) for leaf in leaves(entries)]
+
+    # put back shapes taken by get_shapes, each leaf gets back the very style row it had so a later
+    # restyle of that row still reaches it
+    def set_shapes(self, entries, shapes):
+        for leaf, (style, coords) in zip(leaves(entries), shapes):
+            if leaf.style != style:
+                self.viewport.hide(leaf)
+                leaf.style = style
+            leaf.coords = coords
+        self.reshaped(entries)
+
+    def reshaped(self, entries):
+        for entry in entries:
+            self.__index.update(entry)
+            self.viewport.reshaped(entry)
+
+    # zoom and pan so the whole scene fills the view
+    def fit_view(self, _):
+        box = self.scene_box()
+        if box is not None:
+            self.viewport.fit(*box)
+            self.update_handles()
+
+    def canvas_tag(self, item):
+        # tag or id that addresses every canvas item of an entry at once, None if it has none
+        if isinstance(item, Group):
+            return item.group_tag
+        return self.viewport.item(item)
+
+    def make_group(self, items):
+        # tag the canvas items of every member with a new group tag
+        group = Group(items, self.new_group_tag())
+        self.tag_group(group)
+        return group
+
+    def new_group_tag(self):
+        self.group_count += 1
+        return 'group' + str(self.group_count)
+
+    def tag_group(self, group):
+        for i in group:
+            tag = self.canvas_tag(i)
+            if tag is not None:
+                self.canvas.addtag_withtag(group.group_tag, tag)
+
+    def untag_group(self, group):
+        self.canvas.dtag(group.group_tag)
 
     def cut(self, _):
 
-        if self.selected_idx is None:
+        if not self.selection:
+            return
+
+        # put the cut entries into the clipboard, their canvas items stay hidden until the cut leaves the history
+        self.clipboard = self.remove_selection()
+
+    def delete(self, _):
+
+        if not self.selection:
             return
 
-        # put canvas item to be cut into clipboard
-        self.clipboard = self.__drawables[self.selected_idx]
+        self.remove_selection()
 
-        # recursively delete the cut items
-        self.delete_items_recur(self.__drawables[self.selected_idx])
-        del self.__drawables[self.selected_idx]
+    # take the selected entries out of the scene as one step, returns them in drawing order
+    def remove_selection(self):
+        # later positions first so the earlier ones stay valid
+        commands = [RemoveEntry(position) for position in reversed(self.selection)]
+        self.execute(batch(commands))
+        self.selection = []
+        self.update_handles()
+        return [command.entry for command in reversed(commands)]
 
     def delete_items_recur(self, item):
-        if type(item) is list:
-            for i in item:
-                if type(i) is list:
-                    self.delete_items_recur(i)
-                else:
-                    self.canvas.delete(i.ident)
-        else:
-            self.canvas.delete(item.ident)
+        self.viewport.hide(item)
 
     def copy(self, _):
 
-        if self.selected_idx is None:
+        if not self.selection:
             return
 
-        # put canvas item to be cut into clipboard
-        self.clipboard = self.__drawables[self.selected_idx]
+        # put the selected entries into the clipboard
+        self.clipboard = [self.__drawables[position] for position in self.selection]
 
     def paste(self, _):
 
-        if self.selected_idx is None:
+        if not self.clipboard:
             return
 
-        # recursively paste canvas items with 20 pixel offset in x and y position
-        self.paste_items(self.clipboard, self.__drawables, 20)
+        # copies of the clipboard 20 units further right and down, with every point, kind and color
+        self.add_copies(self.clipboard, [(20, 20)])
 
-    def paste_items(self, item, container, offset):
-        # recursive paste algorithm
-        if type(item) is list:
-            inner_container = DrawableList(self.canvas)
-            for i in item:
-                self.paste_items(i, inner_container, offset)
-            container.append(inner_container)
-        elif isinstance(item, Drawable):
-            container.append(self.paste_item(item, offset))
-
-    def paste_item(self, item, offset):
-        coords = [coord + offset for coord in item.coords]
-
-        if item.tag == 'rectangle':
-            ident = self.canvas.create_rectangle(coords[0],
-                                                 coords[1],
-                                                 coords[2],
-                                                 coords[3],
-                                                 width=self.width,
-                                                 outline=item.color,
-                                                 tags='rectangle'
-                                                 )
-
-        elif item.tag == 'oval':
-            ident = self.canvas.create_oval(coords[0],
-                                            coords[1],
-                                            coords[2],
-                                            coords[3],
-                                            width=self.width,
-                                            outline=item.color,
-                                            tags='oval'
-                                            )
+    def duplicate(self, _):
+
+        if not self.selection:
+            return
+
+        copies = askinteger('Duplicate', 'Number of copies', initialvalue=10, minvalue=1, maxvalue=100000)
+        if copies is None:
+            return
+        columns = askinteger('Duplicate', 'Copies per row, 0 for a single row', initialvalue=0, minvalue=0)
+        if columns is None:
+            return
+        self.duplicate_selection(copies, columns)
+
+    # copies of the selection side by side, in rows of columns cells or all in one row when columns is 0,
+    # with a gap in screen pixels between them
+    def duplicate_selection(self, copies, columns=0, gap=10):
+        entries = [self.__drawables[position] for position in self.selection]
+        boxes = [self.__index.box(leaf.ident) for entry in entries for leaf in leaves(entry)]
+        if not boxes:
+            return
+
+        dx = max(box[2] for box in boxes) - min(box[0] for box in boxes) + gap / self.viewport.scale
+        dy = max(box[3] for box in boxes) - min(box[1] for box in boxes) + gap / self.viewport.scale
+        self.add_copies(entries, grid_offsets(copies, columns, dx, dy))
+
+    # entries copied once for every (dx, dy) in world units and added as one step, the copies become
+    # the selection
+    def add_copies(self, entries, offsets):
+        copies = [entry for copy in clone(self.store, entries, offsets, self.new_group_tag) for entry in copy]
+        start = len(self.__drawables)
+        self.execute(AddEntries(copies))
+        self.selection = list(range(start, start + len(copies)))
+        self.update_handles()
+
+    # give the styles of the selected entries the current color and pen width: it is the styles that
+    # change, so every drawable of the scene with one of them changes too, selected or not
+    def restyle_styles(self, _):
+        styles = []
+        for position in self.selection:
+            for leaf in leaves(self.__drawables[position]):
+                style = self.store.style_table[leaf.style]
+                if style not in styles and style[1:] != (self.gui.get_color(), self.width):
+                    styles.append(style)
+
+        if styles:
+            self.execute(batch([Restyle(style, self.gui.get_color(), self.width) for style in styles]))
+            self.show_status('restyled every shape of ' + str(len(styles)) +
+                             (' style' if len(styles) == 1 else ' styles'))
+
+    # [position, leaf numbers] of the drawables of some styles, the leaves of an entry numbered in
+    # the order leaves walks them
+    def find_style_leaves(self, styles):
+        styles = set(styles)
+        locations = []
+        for position, entry in enumerate(self.__drawables):
+            numbers = [i for i, leaf in enumerate(leaves(entry)) if leaf.style in styles]
+            if numbers:
+                locations.append([position, numbers])
+        return locations
+
+    # set the color and width of styles, the canvas items of each style change through its tag
+    def restyle(self, styles, color, width):
+        for style in styles:
+            self.store.restyle(style, color, width)
+            if self.store.style_table[style][0] in ('rectangle', 'oval'):
+                self.canvas.itemconfigure(style_tag(style), outline=color, width=width)
+            else:
+                self.canvas.itemconfigure(style_tag(style), fill=color, width=width)
+        self.viewport.restyled()
+
+    # the brackets change the eraser size instead of the pen width while erasing
+    def thinner(self, _):
+        if self.mode == 'eraser':
+            self.set_eraser_radius(self.eraser_radius - 2)
+        else:
+            self.set_width(self.width - 1)
+
+    def thicker(self, _):
+        if self.mode == 'eraser':
+            self.set_eraser_radius(self.eraser_radius + 2)
+        else:
+            self.set_width(self.width + 1)
+
+    def set_width(self, width):
+        self.width = min(max(width, 1), 20)
+        self.show_status('width ' + str(self.width))
+
+    def set_eraser_radius(self, radius):
+        self.eraser_radius = min(max(radius, 2), 100)
+        self.show_status('eraser radius ' + str(self.eraser_radius))
+
+    def create_item(self, tag, coords, color, groups=(), width=None):
+        # create the canvas item for a drawable of any kind with its full coordinate list,
+        # groups are the tags of the style and of the groups it is nested in, the pen width by default
+        tags = (tag,) + tuple(groups)
+        if width is None:
+            width = self.width
+        if tag == 'rectangle':
+            return self.canvas.create_rectangle(*coords,
+                                                width=width,
+                                                outline=color,
+                                                tags=tags
+                                                )
+
+        elif tag == 'oval':
+            return self.canvas.create_oval(*coords,
+                                           width=width,
+                                           outline=color,
+                                           tags=tags
+                                           )
+
+        elif tag == 'freehand':
+            return self.canvas.create_line(*coords,
+                                           width=width,
+                                           fill=color,
+                                           capstyle='round',
+                                           joinstyle='round',
+                                           tags=tags
+                                           )
+
+        return self.canvas.create_line(*coords,
+                                       width=width,
+                                       fill=color,
+                                       tags=tags
+                                       )
+
+    # canvas behaviour for erasing parts of freehand strokes, lines and polygons
+    def set_eraser_mode(self, _):
+        self.reset()
+        self.mode = 'eraser'
+        print('eraser mode')
+        self.gui.set_label_text('Eraser Mode')
+
+        self.bind(self.canvas, '<Button-1>', self.erase_down)
+        self.bind(self.canvas, '<B1-Motion>', self.erase_drag)
+        self.bind(self.canvas, '<ButtonRelease-1>', self.erase_up)
+
+    def erase_down(self, event):
+        self.eraser = Eraser(self.__index, self.eraser_radius / self.viewport.scale)
+        self.eraser_hidden = {}
+        self.eraser_previews = {}
+        self.eraser_unbaked = set()
+        r = self.eraser_radius
+        self.canvas.create_oval(event.x - r, event.y - r, event.x + r, event.y + r, outline='gray', dash=(2, 2),
+                                tags='eraser_brush')
+        self.erase_drag(event)
+
+    def erase_drag(self, event):
+        if self.eraser is None:
+            return
 
+        r = self.eraser_radius
+        self.canvas.coords('eraser_brush', event.x - r, event.y - r, event.x + r, event.y + r)
+        self.eraser.sweep(*self.viewport.to_world([event.x, event.y]))
+
+        # motion events come faster than frames, the previews are drawn once they have been handled
+        if self.eraser_frame is None:
+            self.eraser_frame = self.gui.get_root().after_idle(self.draw_erased)
+
+    # show what is left of the strokes cut since the last frame in place of their canvas items
+    def draw_erased(self):
+        self.eraser_frame = None
+        for ident in self.eraser.take_changed():
+            leaf = self.__index.leaf(ident)
+            owner = self.__index.owner(ident)
+            if id(owner) not in self.eraser_unbaked:
+                self.eraser_unbaked.add(id(owner))
+                self.viewport.unbake([owner])
+
+            item = self.eraser_hidden.get(ident)
+            if item is None:
+                item = self.viewport.item(leaf)
+                if item is None:
+                    continue
+                self.canvas.itemconfigure(item, state='hidden')
+                self.eraser_hidden[ident] = item
+
+            # the brush only cuts where it is, the previews of pieces with the same ends and length are kept
+            previews = self.eraser_previews.get(ident, {})
+            shown = {}
+            for piece in self.eraser.pieces(ident):
+                key = (len(piece), piece[0], piece[1], piece[-2], piece[-1])
+                preview = previews.pop(key, None)
+                if preview is None:
+                    preview = self.create_item(leaf.tag, self.viewport.to_screen(piece), leaf.color,
+                                               ('eraser_preview',), leaf.width)
+                    self.canvas.tag_lower(preview, item)
+                shown[key] = preview
+            for preview in previews.values():
+                self.canvas.delete(preview)
+            self.eraser_previews[ident] = shown
+
+    # replace every entry the drag cut into by what is left of it, as one step
+    def erase_up(self, _):
+        if self.eraser is None:
+            return
+
+        if self.eraser_frame is not None:
+            self.gui.get_root().after_cancel(self.eraser_frame)
+            self.eraser_frame = None
+        self.canvas.delete('eraser_brush')
+        self.canvas.delete('eraser_preview')
+        for item in self.eraser_hidden.values():
+            self.canvas.itemconfigure(item, state='normal')
+
+        positions = {self.search(ident) for ident in self.eraser.erased()}
+        positions.discard(-1)
+
+        # later positions first so the earlier ones stay valid
+        commands = []
+        for position in sorted(positions, reverse=True):
+            entry = self.eraser.rebuild(self.__drawables[position], self.store, self.new_group_tag)
+            commands.append(RemoveEntry(position) if entry is None else ReplaceEntry(position, entry))
+
+        self.eraser = None
+        self.eraser_hidden = {}
+        self.eraser_previews = {}
+        self.eraser_unbaked = set()
+        if commands:
+            self.execute(batch(commands))
+
+    # review the session: the scene at any step of the timeline is shown in place of the live one,
+    # stepped through with the arrow and page keys or played back as a time-lapse with space
+    def set_timeline_mode(self, _):
+        self.reset()
+        self.mode = 'timeline'
+        print('timeline mode')
+        self.enable_tools(False)
+        self.selection = []
+        self.grouping_idx = []
+
+        root = self.gui.get_root()
+        self.bind(root, '<Key-t>', self.leave_timeline)
+        self.bind(root, '<Escape>', self.leave_timeline)
+        self.bind(root, '<Left>', self.timeline_back)
+        self.bind(root, '<Right>', self.timeline_forward)
+        self.bind(root, '<Prior>', self.timeline_back_far)
+        self.bind(root, '<Next>', self.timeline_forward_far)
+        self.bind(root, '<space>', self.timeline_play)
+        self.bind(root, '<plus>', self.timeline_faster)
+        self.bind(root, '<minus>', self.timeline_slower)
+
+        self.live_entries = self.__drawables.get_list()
+        self.review = TimelineReview(self, self.timeline)
+        self.review.seek(len(self.timeline))
+
+    def leave_timeline(self, _):
+        self.reset()
+        self.mode = None
+        self.gui.set_label_text('')
+
+    # put the live scene back once the review is over
+    def close_timeline(self):
+        self.review.pause()
+        self.review = None
+        for entry in self.replace_entries(self.live_entries):
+            self.set_visible(entry, False)
+        self.live_entries = None
+        self.review_items = None
+        self.review_entries = {}
+        self.timeline.release()
+        self.viewport.refresh()
+        self.enable_tools(True)
+
+    # the scene of a step of the timeline as nested lists replaces the one shown, the entries built from
+    # items that are still the same objects are kept and only the others are built and indexed again
+    def show_timeline(self, tree):
+        keys = list(map(id, tree))
+        entries = list(map(self.review_entries.get, keys))
+        missing = [i for i, entry in enumerate(entries) if entry is None]
+        for i in missing:
+            container = []
+            self.deserialize(tree[i], container)
+            entries[i] = container[0]
+
+        # whatever is left of the old scene is gone, all of it on the first step shown
+        gone = self.review_entries.keys() - set(keys)
+        if self.review_items is None or 2 * len(missing) > len(entries):
+            removed = self.replace_entries(entries)
         else:
-            ident = self.canvas.create_line(coords[0],
-                                            coords[1],
-                                            coords[2],
-                                            coords[3],
-                                            width=self.width,
-                                            fill=item.color,
-                                            tags='line'
-                                            )
-        return Drawable(ident, item.tag, coords, item.color)
+            removed = [self.review_entries[key] for key in gone]
+            self.update_entries(entries, removed, [entries[i] for i in missing])
+        for entry in removed:
+            self.set_visible(entry, False)
+
+        # the items are kept so that their ids stay theirs
+        for key in gone:
+            del self.review_entries[key]
+        for i in missing:
+            self.review_entries[keys[i]] = entries[i]
+        self.review_items = list(tree)
+        self.viewport.refresh()
+
+    def timeline_progress(self, step, steps, seconds, playing, speed):
+        minutes, seconds = divmod(int(seconds), 60)
+        text = 'Timeline %d/%d  %d:%02d  x%d' % (step, steps, minutes, seconds, speed)
+        self.gui.set_label_text(text + '  playing' if playing else text)
+
+    def timeline_back(self, _):
+        self.review.move(-1)
+
+    def timeline_forward(self, _):
+        self.review.move(1)
+
+    # the page keys jump by a keyframe interval
+    def timeline_back_far(self, _):
+        self.review.move(-self.timeline.keyframe_interval)
+
+    def timeline_forward_far(self, _):
+        self.review.move(self.timeline.keyframe_interval)
+
+    def timeline_play(self, _):
+        self.review.toggle()
+
+    def timeline_faster(self, _):
+        self.review.faster()
+
+    def timeline_slower(self, _):
+        self.review.slower()
 
     def set_grouping_mode(self, _):
         self.reset()
         self.mode = 'grouping'
         print('grouping mode')
         self.gui.set_label_text('Grouping Mode')
-        self.canvas.bind('<Button-1>', self.grouping_click)
-        self.gui.get_root().bind('<Control-g>', self.group)
-        self.gui.get_root().bind('<Control-u>', self.ungroup)
+        self.bind(self.canvas, '<Button-1>', self.grouping_click)
+        self.bind(self.gui.get_root(), '<Control-g>', self.group)
+        self.bind(self.gui.get_root(), '<Control-u>', self.ungroup)
         self.grouping_idx = []
 
-    def grouping_click(self, _):
-        clicked = list(self.canvas.find_withtag('current'))
+    def grouping_click(self, event):
+        clicked = self.find_clicked(event)
 
-        if not clicked:
+        if clicked is None:
             return
 
         # add item to be grouped to a list
-        self.grouping_idx.append(self.search(self.__drawables.get_list(), clicked[0]))
+        position = self.search(clicked)
+        self.grouping_idx.append(position)
+        if position >= 0:
+            self.viewport.unbake([self.__drawables[position]])
 
     def group(self, _):
-        if not self.grouping_idx:
-            return
-
-        grouped = []
-        # remove all duplications
-        self.grouping_idx = list(dict.fromkeys(self.grouping_idx))
-
-        # add items to be grouped into a single list and remove them from drawables list
-        for i in self.grouping_idx:
-            grouped.append(self.__drawables[i])
-            self.__drawables[i] = -1
+        # remove all duplications and clicks that missed
+        positions = [i for i in dict.fromkeys(self.grouping_idx) if i >= 0]
+        self.grouping_idx = []
 
-        self.__drawables.remove(-1)
+        if not positions:
+            return
 
-        if grouped:
-            # append the group to drawables list
-            self.__drawables.get_list().append(grouped)
+        # move the chosen entries into a single group appended to drawables list
+        self.execute(GroupEntries(positions))
 
     def ungroup(self, _):
 
         # only allow one item to be selected when ungrouping
-        if len(self.grouping_idx) != 1:
+        if len(self.grouping_idx) != 1 or self.grouping_idx[0] < 0:
             return
 
-        grouped = self.__drawables[self.grouping_idx[0]]
+        position = self.grouping_idx[0]
+        self.grouping_idx = []
 
         # cannot ungroup primary items
-        if isinstance(grouped, Drawable):
+        if isinstance(self.__drawables[position], Drawable):
             return
 
-        del self.__drawables[self.grouping_idx[0]]
-
-        for i in grouped:
-            self.__drawables.get_list().append(i)
+        self.execute(UngroupEntry(position))
 
     # reset canvas behaviour
     def reset(self):
+        # an erase still being dragged is finished before its release is unbound
+        if self.eraser is not None:
+            self.erase_up(None)
+
         self.x0 = self.y0 = 0
+        self.canvas.delete('handle')
+        self.handle_box = None
+
+        # the selection holds top-level positions, which the other modes may shift
+        self.selection = []
         if self.mode in ['line', 'freehand', 'rectangle', 'oval']:
-            self.canvas.bind('<Button-1>', self.dummy_behavior)
-            self.canvas.bind('<B1-Motion>', self.dummy_behavior)
-            self.canvas.bind('<ButtonRelease-1>', self.dummy_behavior)
+            self.bind(self.canvas, '<Button-1>', self.dummy_behavior)
+            self.bind(self.canvas, '<B1-Motion>', self.dummy_behavior)
+            self.bind(self.canvas, '<ButtonRelease-1>', self.dummy_behavior)
 
         elif self.mode in ['poly']:
-            self.canvas.bind('<Button-1>', self.dummy_behavior)
-            self.canvas.bind('<Motion>', self.dummy_behavior)
-            self.canvas.bind('<Button-3>', self.dummy_behavior)
+            self.bind(self.canvas, '<Button-1>', self.dummy_behavior)
+            self.bind(self.canvas, '<Motion>', self.dummy_behavior)
+            self.bind(self.canvas, '<Button-3>', self.dummy_behavior)
 
         elif self.mode in ['cursor']:
-            self.canvas.bind('<Button-1>', self.dummy_behavior)
-            self.canvas.bind('<B1-Motion>', self.dummy_behavior)
-            self.gui.get_root().bind('<Control-x>', self.dummy_behavior)
-            self.gui.get_root().bind('<Control-c>', self.dummy_behavior)
-            self.gui.get_root().bind('<Control-v>', self.dummy_behavior)
+            self.bind(self.canvas, '<Button-1>', self.dummy_behavior)
+            self.bind(self.canvas, '<B1-Motion>', self.dummy_behavior)
+            self.bind(self.canvas, '<ButtonRelease-1>', self.dummy_behavior)
+            self.bind(self.gui.get_root(), '<Control-x>', self.dummy_behavior)
+            self.bind(self.gui.get_root(), '<Control-c>', self.dummy_behavior)
+            self.bind(self.gui.get_root(), '<Control-v>', self.dummy_behavior)
+            self.bind(self.gui.get_root(), '<Control-d>', self.dummy_behavior)
+            self.bind(self.gui.get_root(), '<Control-r>', self.dummy_behavior)
+            self.bind(self.gui.get_root(), '<Delete>', self.dummy_behavior)
+
+        elif self.mode in ['eraser']:
+            self.bind(self.canvas, '<Button-1>', self.dummy_behavior)
+            self.bind(self.canvas, '<B1-Motion>', self.dummy_behavior)
+            self.bind(self.canvas, '<ButtonRelease-1>', self.dummy_behavior)
+
+        elif self.mode in ['timeline']:
+            for sequence in ['<Escape>', '<Left>', '<Right>', '<Prior>', '<Next>', '<space>', '<plus>', '<minus>']:
+                self.bind(self.gui.get_root(), sequence, self.dummy_behavior)
+            if self.review is not None:
+                self.close_timeline()
 
         elif self.mode in ['grouping']:
-            self.canvas.bind('<Button-1>', self.dummy_behavior)
-            self.gui.get_root().bind('<Control-g>', self.dummy_behavior)
-            self.gui.get_root().bind('<Control-u>', self.dummy_behavior)
+            self.bind(self.canvas, '<Button-1>', self.dummy_behavior)
+            self.bind(self.gui.get_root(), '<Control-g>', self.dummy_behavior)
+            self.bind(self.gui.get_root(), '<Control-u>', self.dummy_behavior)
 
     def dummy_behavior(self, event):
         pass
 
     def save_file(self, _):
+        # one save at a time
+        if self.saver is not None:
+            return 'break'
+
         # open tkinter save as file dialog
-        f = asksaveasfile(mode='wb', filetypes=[('pickle files', '.pickle')])
-        if f is None:
+        path = asksaveasfilename(defaultextension='.sketch', filetypes=[('sketch files', '.sketch')])
+        if not path:
             return 'break'
 
-        # serialize objects into binary and save to file
-        serialized_list = []
-        self.serialize(self.__drawables.get_list(), serialized_list)
-        f.write(pickle.dumps(serialized_list[0]))
-        f.close()
+        self.save(path)
         return 'break'
 
-    def serialize(self, item, container):
-        if type(item) is list:
-            inner_container = []
-            for i in item:
-                self.serialize(i, inner_container)
-            container.append(inner_container)
-        elif isinstance(item, Drawable):
-            container.append([item.ident, item.tag, item.coords, item.color])
+    # write the scene in the binary scene format on a worker thread, drawing goes on meanwhile
+    def save(self, path):
+        self.saved_label = self.gui.get_label_text()
+        self.gui.set_label_text('Saving')
+        self.saver = SceneSaver(self)
+        self.saver.start(path, SceneSnapshot(self.__drawables))
+
+    def save_progress(self, fraction):
+        self.gui.set_label_text('Saving ' + str(int(100 * fraction)) + '%')
+
+    def finish_save(self, error):
+        path = self.saver.path
+        self.saver = None
+        if error is None:
+            self.gui.set_label_text(self.saved_label)
+        else:
+            self.gui.set_label_text(self.saved_label)
+            self.show_status('saving ' + path + ' failed: ' + str(error))
 
     def load_file(self, _):
         # open tkinter open file dialog
-        f = askopenfile(mode='rb', filetypes=[('pickle files', '.pickle')])
+        f = askopenfile(mode='rb', filetypes=[('sketch files', '.sketch'), ('pickle files', '.pickle')])
         if f is None:
             return 'break'
 
-        # deserialize binary to objects and load to canvas
-        self.clear_canvas(self.__drawables)
-        self.__drawables.clear()
-        container = []
-        self.deserialize(pickle.load(f), container)
-        self.__drawables.set_list(container[0])
-        f.close()
+        # a new file replaces the one still loading
+        if self.loader is not None:
+            self.cancel_load()
+
+        self.begin_load(f)
         return 'break'
 
-    def deserialize(self, item, container):
-        if type(item) is list and len(item) == 4 and type(item[1]) is str:
-            if item[1] == 'rectangle':
-                ident = self.canvas.create_rectangle(item[2][0],
-                                                     item[2][1],
-                                                     item[2][2],
-                                                     item[2][3],
-                                                     width=self.width,
-                                                     outline=item[3],
-                                                     tags='rectangle'
-                                                     )
-
-            elif item[1] == 'oval':
-                ident = self.canvas.create_oval(item[2][0],
-                                                item[2][1],
-                                                item[2][2],
-                                                item[2][3],
-                                                width=self.width,
-                                                outline=item[3],
-                                                tags='oval'
-                                                )
+    # load a scene file in the background, the old scene is kept hidden for undo
+    def begin_load(self, f):
+        self.reset()
+        self.mode = None
+        self.enable_tools(False)
+        self.bind(self.gui.get_root(), '<Escape>', self.cancel_load)
+        self.gui.set_label_text('Loading')
+
+        view = None
+        if self.load_visible_first:
+            view = self.viewport.view()
+
+        self.loader = SceneLoader(self, view=view)
+        self.loader.start(f)
+
+    # the model of the loaded scene is complete, its entries are indexed in realize_entry
+    def begin_scene(self, entries):
+        self.execute(ReplaceScene(entries, ready=False))
+        self.selection = []
+        self.update_handles()
+
+    # index a loaded entry and give it canvas items if it is near the view, returns its drawable count
+    def realize_entry(self, entry):
+        self.__index.add(entry)
+        self.__index.invalidate()
+        self.viewport.show(entry)
+        return sum(1 for _ in leaves(entry))
+
+    def load_progress(self, created, total):
+        if total:
+            self.gui.set_label_text('Loading ' + str(100 * created // total) + '%')
+
+    def finish_load(self):
+        self.loader = None
+        self.enable_tools(True)
+        self.gui.get_root().unbind('<Escape>')
+        self.gui.set_label_text('')
+
+        # the loaded entries may need baking
+        self.viewport.refresh()
+
+    # stop loading, a scene that was already swapped in is undone and cannot be redone
+    def cancel_load(self, _=None):
+        if self.loader is None:
+            return
 
-            else:
-                ident = self.canvas.create_line(item[2][0],
-                                                item[2][1],
-                                                item[2][2],
-                                                item[2][3],
-                                                width=self.width,
-                                                fill=item[3],
-                                                tags='line'
-                                                )
+        self.loader.cancel()
+        if self.loader.began:
+            self.history.undo(self)
+            self.history.clear_redo(self)
+        self.finish_load()
 
-            container.append(Drawable(ident, item[1], item[2], item[3]))
+    # rebuild an entry from nested lists, its canvas items are created when it is shown
+    def deserialize(self, item, container):
+        fields = leaf_fields(item)
+        if fields is not None:
+            kind, coords, color, width = fields
+            container.append(Drawable(self.store.new_ident(), kind, coords, color, self.store, width))
 
         elif type(item) is list:
             inner_container = []
             for i in item:
                 self.deserialize(i, inner_container)
-            container.append(inner_container)
-
-    def clear_canvas(self, item):
-        if isinstance(item, Drawable):
-            self.canvas.delete(item.ident)
-        else:
-            for i in item:
-                self.clear_canvas(i)
+            container.append(Group(inner_container, self.new_group_tag()))
@@ -1,9 +1,76 @@
+from scene_store import DEFAULT_WIDTH
+
+
 class Drawable:
-    def __init__(self, ident, tag, coords, color):
-        self.ident = ident
-        self.tag = tag
-        self.coords = coords
-        self.color = color
+    # a drawn shape, the data lives in a row of a SceneStore and this object only points at it
+    __slots__ = ('store', 'row')
+
+    def __init__(self, ident, tag, coords, color, store, width=DEFAULT_WIDTH):
+        self.store = store
+        self.row = store.add(ident, tag, coords, color, width)
+
+    # view of a row that is already in the store
+    @classmethod
+    def from_row(cls, store, row):
+        drawable = cls.__new__(cls)
+        drawable.store = store
+        drawable.row = row
+        return drawable
+
+    # the row belongs to this object, so it is freed together with it
+    def __del__(self):
+        try:
+            self.store.release(self.row)
+        except (AttributeError, TypeError):
+            # interpreter shutdown or partially constructed object
+            pass
+
+    @property
+    def ident(self):
+        return self.store.idents[self.row]
+
+    @ident.setter
+    def ident(self, ident):
+        self.store.idents[self.row] = ident
+
+    # index of the (kind, color, width) style shared with other drawables
+    @property
+    def style(self):
+        return self.store.styles[self.row]
+
+    @style.setter
+    def style(self, style):
+        self.store.styles[self.row] = style
+
+    @property
+    def tag(self):
+        return self.store.style_table[self.store.styles[self.row]][0]
+
+    @tag.setter
+    def tag(self, tag):
+        self.store.set_kind(self.row, tag)
+
+    @property
+    def color(self):
+        return self.store.style_table[self.store.styles[self.row]][1]
+
+    @property
+    def width(self):
+        return self.store.style_table[self.store.styles[self.row]][2]
+
+    @property
+    def coords(self):
+        return self.store.get_coords(self.row)
+
+    @coords.setter
+    def coords(self, coords):
+        self.store.set_coords(self.row, coords)
+
+    # the coordinates as an array of doubles, cheaper than coords for code that copies them or reads
+    # each value once; indexing it makes a new float every time, so coords suits repeated reads
+    @property
+    def coord_slice(self):
+        return self.store.coord_slice(self.row)
 
     def __repr__(self):
         # return f'ID: {self.ident}  tag: {self.tag}  coords: {self.coords}, color: {self.color}'
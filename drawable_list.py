@@ -1,28 +1,48 @@
 from drawable import Drawable
 
 
+class Group(list):
+    # a list of grouped entries whose canvas items all carry group_tag
+    __slots__ = ('group_tag',)
+
+    def __init__(self, items, group_tag):
+        super().__init__(items)
+        self.group_tag = group_tag
+
+
 class DrawableList:
+    # nested lists of drawables whose shape data is kept in a shared SceneStore
 
-    def __init__(self, canvas):
+    def __init__(self, viewport, store):
         self.__list = []
-        self.canvas = canvas
+        self.viewport = viewport
+        self.store = store
 
     def append(self, item):
         if isinstance(item, DrawableList):
             self.__list.append(item.get_list())
 
-        elif isinstance(item, Drawable):
+        elif isinstance(item, (Drawable, list)):
             self.__list.append(item)
 
         else:
-            tag = list(self.canvas.gettags(item))
-            coords = list(self.canvas.coords(item))
-            if 'rectangle' in tag or 'oval' in tag:
-                color = self.canvas.itemcget(item, 'outline')
-            else:
-                color = self.canvas.itemcget(item, 'fill')
-
-            self.__list.append(Drawable(item, tag[0], coords, color))
+            self.__list.append(self.make_drawable(item))
+
+    # build a drawable from the current state of a canvas item, which stays its canvas item
+    def make_drawable(self, item):
+        canvas = self.viewport.canvas
+        tag = list(canvas.gettags(item))
+        coords = self.viewport.to_world(canvas.coords(item))
+        if 'rectangle' in tag or 'oval' in tag:
+            color = canvas.itemcget(item, 'outline')
+        else:
+            color = canvas.itemcget(item, 'fill')
+
+        width = float(canvas.itemcget(item, 'width'))
+
+        drawable = Drawable(self.store.new_ident(), tag[0], coords, color, self.store, width)
+        self.viewport.adopt(drawable, item)
+        return drawable
 
     # define delete item by index
     def __delitem__(self, key):
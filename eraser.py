@@ -0,0 +1,172 @@
+import math
+
+from drawable import Drawable
+from drawable_list import Group
+from geometry import circle_span
+from scene_index import SegmentIndex
+
+# kinds drawn as open polylines, the only ones the eraser cuts
+ERASABLE = ['freehand', 'line', 'poly']
+
+# fragments of a segment shorter than this fraction of it are dropped
+EPSILON = 1e-9
+
+
+class Eraser:
+    # removes the parts of strokes under a round brush dragged over the scene: every segment it touches
+    # keeps the intervals of its parameter, from 0 at its first point to 1 at its second, that were never
+    # under the brush; the strokes themselves are only rebuilt from them once the drag is over
+    #
+    # segments are looked up in a SegmentIndex with cells the size of the brush, filled with a stroke the
+    # first time the brush crosses its bounding box in the scene index
+
+    def __init__(self, index, radius):
+        self.index = index
+        self.radius = radius
+        self.segments = SegmentIndex(2 * radius)
+
+        # ident -> segment -> list of (t0, t1) still drawn, for the segments the brush touched
+        self.kept = {}
+
+        # idents whose pieces changed since take_changed was last called
+        self.__changed = set()
+
+        # last point of the brush path
+        self.__last = None
+
+    # idents of every stroke that lost something
+    def erased(self):
+        return [ident for ident, segments in self.kept.items()
+                if any(intervals != [(0.0, 1.0)] for intervals in segments.values())]
+
+    def take_changed(self):
+        changed = self.__changed
+        self.__changed = set()
+        return changed
+
+    # move the brush to (x, y), erasing along the straight path from where it was at steps of half its radius
+    def sweep(self, x, y):
+        if self.__last is None:
+            self.erase_at(x, y)
+        else:
+            lx, ly = self.__last
+            steps = max(1, math.ceil(math.hypot(x - lx, y - ly) / (self.radius / 2)))
+            for i in range(1, steps + 1):
+                self.erase_at(lx + (x - lx) * i / steps, ly + (y - ly) * i / steps)
+        self.__last = (x, y)
+
+    def erase_at(self, x, y):
+        r = self.radius
+        for ident in self.index.query(x - r, y - r, x + r, y + r):
+            if ident not in self.segments:
+                leaf = self.index.leaf(ident)
+                # strokes of other kinds are remembered without segments so they are only looked at once
+                self.segments.add(ident, leaf.coords if leaf.tag in ERASABLE else [])
+
+        for ident, k in self.segments.near(x, y, r):
+            coords = self.segments.coords[ident]
+            span = circle_span(coords[2 * k], coords[2 * k + 1], coords[2 * k + 2], coords[2 * k + 3], x, y, r)
+            if span is None:
+                continue
+
+            segments = self.kept.setdefault(ident, {})
+            intervals = segments.get(k, [(0.0, 1.0)])
+            remaining = subtract(intervals, *span)
+            if remaining != intervals:
+                segments[k] = remaining
+                self.__changed.add(ident)
+
+    # what is left of a stroke as a list of flat coordinate lists, each one a polyline of at least two points
+    def pieces(self, ident):
+        coords = self.segments.coords[ident]
+        cut = self.kept.get(ident, {})
+        pieces = []
+
+        # piece that ends at point start and goes on with the next drawn segment, None when that point
+        # is erased; the untouched segments between two cut ones are copied as a whole
+        current = list(coords[:2])
+        pieces.append(current)
+        start = 0
+        for k in sorted(cut):
+            if k > start:
+                if current is None:
+                    current = list(coords[2 * start:2 * start + 2])
+                    pieces.append(current)
+                current.extend(coords[2 * start + 2:2 * k + 2])
+
+            for t0, t1 in cut[k]:
+                if t0 == 0.0 and current is not None:
+                    current.extend(point(coords, k, t1))
+                else:
+                    current = point(coords, k, t0) + point(coords, k, t1)
+                    pieces.append(current)
+                if t1 != 1.0:
+                    current = None
+            if not cut[k]:
+                current = None
+            start = k + 1
+
+        if current is None:
+            current = list(coords[2 * start:2 * start + 2])
+            pieces.append(current)
+        current.extend(coords[2 * start + 2:])
+
+        # a lone point is all that is left of an erased corner
+        return [piece for piece in pieces if len(piece) >= 4]
+
+    # the entry with the erased strokes replaced by what is left of them, None when nothing is left;
+    # untouched drawables and groups are shared with the original, rebuilt groups keep their tags, the
+    # first piece of a stroke keeps its ident and the others get new ones
+    def rebuild(self, entry, store, new_group_tag):
+        erased = set(self.erased())
+        nodes = self.__rebuild(entry, erased, store, new_group_tag)
+        if not nodes:
+            return None
+        if len(nodes) == 1:
+            return nodes[0]
+        return Group(nodes, new_group_tag())
+
+    def __rebuild(self, node, erased, store, new_group_tag):
+        if isinstance(node, Drawable):
+            if node.ident not in erased:
+                return [node]
+            return [Drawable(node.ident if i == 0 else store.new_ident(), node.tag, piece, node.color, store,
+                             node.width)
+                    for i, piece in enumerate(self.pieces(node.ident))]
+
+        children = []
+        changed = False
+        for child in node:
+            nodes = self.__rebuild(child, erased, store, new_group_tag)
+            changed = changed or len(nodes) != 1 or nodes[0] is not child
+            children.extend(nodes)
+
+        if not changed:
+            return [node]
+        if not children:
+            return []
+        return [Group(children, node.group_tag)]
+
+
+# intervals with (t0, t1) taken out, fragments that are too short to see are dropped
+def subtract(intervals, t0, t1):
+    remaining = []
+    for a, b in intervals:
+        if b <= t0 or a >= t1:
+            remaining.append((a, b))
+            continue
+        if t0 - a > EPSILON:
+            remaining.append((a, t0))
+        if b - t1 > EPSILON:
+            remaining.append((t1, b))
+    return remaining
+
+
+# point at parameter t of segment k, the end points are taken as they are
+def point(coords, k, t):
+    if t == 0.0:
+        return list(coords[2 * k:2 * k + 2])
+    if t == 1.0:
+        return list(coords[2 * k + 2:2 * k + 4])
+    ax, ay, bx, by = coords[2 * k:2 * k + 4]
+    return [ax + (bx - ax) * t, ay + (by - ay) * t]
@@ -0,0 +1,211 @@
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+from raster import Raster, rgb
+from scene_format import SceneFile, is_scene_file, leaf_fields, load_legacy
+from scene_store import DEFAULT_WIDTH
+
+# renders saved scenes to PNG, PPM or SVG without Tk, one file per worker process at a time
+#
+#   python export.py drawings/                          a PNG thumbnail next to every scene file
+#   python export.py --format svg --out exports a.sketch b.pickle
+#   python export.py --size 512 --jobs 8 archive/
+#
+# directories are searched recursively for .sketch and .pickle files; with --out the layout
+# under each directory argument is kept. Nothing is exported when two scene files would be written to
+# the same image, a.sketch and a.pickle side by side or files of the same name from different places
+
+EXTENSIONS = ('.sketch', '.pickle')
+
+# kind, coordinate list, color and line width of every drawable of a scene file in drawing order, and its
+# bounding box
+def read_leaves(path):
+    with open(path, 'rb') as f:
+        if is_scene_file(f):
+            with SceneFile(f) as scene:
+                leaves = [scene.leaf(i) for i in range(scene.leaf_count)]
+        else:
+            leaves = []
+            stack = [iter(load_legacy(f))]
+            while stack:
+                item = next(stack[-1], None)
+                if item is None:
+                    stack.pop()
+                    continue
+
+                fields = leaf_fields(item)
+                if fields is None:
+                    stack.append(iter(item))
+                else:
+                    leaves.append(fields)
+
+    coords = [coord for _, leaf_coords, _, _ in leaves for coord in leaf_coords]
+    if coords:
+        bbox = (min(coords[0::2]), min(coords[1::2]), max(coords[0::2]), max(coords[1::2]))
+    else:
+        bbox = (0.0, 0.0, 1.0, 1.0)
+    return leaves, bbox
+
+
+# world rectangle shown in an export: the bounding box with room for the widest line around it
+def frame(bbox, leaves):
+    padding = max((width for _, _, _, width in leaves), default=DEFAULT_WIDTH)
+    x0, y0, x1, y1 = bbox
+    return x0 - padding, y0 - padding, max(x1 + padding, x0 + padding + 1), max(y1 + padding, y0 + padding + 1)
+
+
+def render_raster(leaves, bbox, size, background):
+    x0, y0, x1, y1 = frame(bbox, leaves)
+
+    # the longer side of the scene fills the image
+    scale = size / max(x1 - x0, y1 - y0)
+    raster = Raster(max(int((x1 - x0) * scale + 0.5), 1), max(int((y1 - y0) * scale + 0.5), 1), rgb(background))
+    for kind, coords, color, width in leaves:
+        coords = [(coord - (x0 if i % 2 == 0 else y0)) * scale for i, coord in enumerate(coords)]
+        raster.draw(kind, coords, rgb(color), max(int(width * scale + 0.5), 1))
+    return raster
+
+
+def write_png(f, leaves, bbox, size, background):
+    f.write(render_raster(leaves, bbox, size, background).png())
+
+
+def write_ppm(f, leaves, bbox, size, background):
+    f.write(render_raster(leaves, bbox, size, background).ppm())
+
+
+# drawables as SVG elements in world coordinates, written as they are formatted
+def write_svg(f, leaves, bbox, size, background):
+    x0, y0, x1, y1 = frame(bbox, leaves)
+    scale = size / max(x1 - x0, y1 - y0)
+    f.write(('<svg xmlns="http://www.w3.org/2000/svg" width="%d" height="%d" viewBox="%g %g %g %g">\n'
+             % (round((x1 - x0) * scale), round((y1 - y0) * scale), x0, y0, x1 - x0, y1 - y0)).encode())
+    f.write(('<rect x="%g" y="%g" width="%g" height="%g" fill="%s"/>\n'
+             % (x0, y0, x1 - x0, y1 - y0, svg_color(background))).encode())
+    f.write(('<g fill="none" stroke-width="%g">\n' % DEFAULT_WIDTH).encode())
+
+    for kind, coords, color, width in leaves:
+        stroke = 'stroke="%s"' % svg_color(color)
+        if width != DEFAULT_WIDTH:
+            stroke += ' stroke-width="%g"' % width
+
+        if kind == 'rectangle':
+            rx0, ry0, rx1, ry1 = coords[:4]
+            element = '<rect x="%g" y="%g" width="%g" height="%g" %s/>' % (
+                min(rx0, rx1), min(ry0, ry1), abs(rx1 - rx0), abs(ry1 - ry0), stroke)
+        elif kind == 'oval':
+            ox0, oy0, ox1, oy1 = coords[:4]
+            element = '<ellipse cx="%g" cy="%g" rx="%g" ry="%g" %s/>' % (
+                (ox0 + ox1) / 2, (oy0 + oy1) / 2, abs(ox1 - ox0) / 2, abs(oy1 - oy0) / 2, stroke)
+        else:
+            points = ' '.join('%g,%g' % (coords[i], coords[i + 1]) for i in range(0, len(coords) - 1, 2))
+            caps = ' stroke-linecap="round" stroke-linejoin="round"' if kind == 'freehand' else ''
+            element = '<polyline points="%s" %s%s/>' % (points, stroke, caps)
+        f.write(element.encode() + b'\n')
+
+    f.write(b'</g>\n</svg>\n')
+
+
+# hex form of a Tk color, SVG has no grayN names
+def svg_color(color):
+    return '#' + rgb(color).hex()
+
+
+WRITERS = {
+    'png': write_png,
+    'ppm': write_ppm,
+    'svg': write_svg,
+}
+
+
+# (source, destination) of every scene file under the paths
+def find_jobs(paths, out, fmt):
+    for path in paths:
+        if os.path.isdir(path):
+            for folder, _, names in os.walk(path):
+                for name in sorted(names):
+                    if name.endswith(EXTENSIONS):
+                        src = os.path.join(folder, name)
+                        yield src, destination(src, os.path.relpath(src, path), out, fmt)
+        else:
+            yield path, destination(path, os.path.basename(path), out, fmt)
+
+
+def destination(src, relative, out, fmt):
+    if out is None:
+        return os.path.splitext(src)[0] + '.' + fmt
+    return os.path.join(out, os.path.splitext(relative)[0] + '.' + fmt)
+
+
+# every scene file once, and the groups of different scene files that have the same destination
+def check_jobs(jobs):
+    unique = []
+    sources = {}
+    for src, dst in jobs:
+        key = os.path.normcase(os.path.abspath(dst))
+        same = sources.setdefault(key, [])
+        if any(os.path.realpath(src) == os.path.realpath(other) for other in same):
+            continue
+        same.append(src)
+        unique.append((src, dst))
+    return unique, [same for same in sources.values() if len(same) > 1]
+
+
+# export one file in a worker, returns (source, destination, drawable count, error message)
+def export(job):
+    src, dst, fmt, size, background = job
+    try:
+        leaves, bbox = read_leaves(src)
+        folder = os.path.dirname(dst)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with open(dst, 'wb') as f:
+            WRITERS[fmt](f, leaves, bbox, size, background)
+    except Exception as e:
+        return src, dst, 0, type(e).__name__ + ': ' + str(e)
+    return src, dst, len(leaves), None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='render saved scenes to images without a display')
+    parser.add_argument('paths', nargs='+', help='scene files or directories to search')
+    parser.add_argument('--format', choices=list(WRITERS), default='png')
+    parser.add_argument('--out', help='output directory, next to each scene file by default')
+    parser.add_argument('--size', type=int, default=256, help='pixels along the longer side')
+    parser.add_argument('--background', default='white')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(), help='worker processes')
+    args = parser.parse_args()
+
+    # the destinations are checked before any worker starts, so no export overwrites another
+    found, clashes = check_jobs(find_jobs(args.paths, args.out, args.format))
+    for same in clashes:
+        print('same destination for', ', '.join(same), file=sys.stderr)
+    if clashes:
+        return 1
+
+    jobs = [(src, dst, args.format, args.size, args.background) for src, dst in found]
+    done = failed = drawables = 0
+    start = time.perf_counter()
+
+    # results stream back as the workers finish, only a few scenes are in memory at any time
+    with multiprocessing.Pool(args.jobs) as pool:
+        for src, dst, count, error in pool.imap_unordered(export, jobs, chunksize=4):
+            if error is None:
+                done += 1
+                drawables += count
+                print(src, '->', dst)
+            else:
+                failed += 1
+                print(src, 'failed:', error, file=sys.stderr)
+
+    elapsed = time.perf_counter() - start
+    print('%d exported, %d failed, %d drawables in %.2f s, %.1f files/s'
+          % (done, failed, drawables, elapsed, (done + failed) / elapsed if elapsed else 0.0))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,167 @@
+import math
+
+
+# perpendicular distance from point (px, py) to the line through (ax, ay) and (bx, by)
+def line_distance(px, py, ax, ay, bx, by):
+    dx, dy = bx - ax, by - ay
+    length = math.hypot(dx, dy)
+    if length == 0:
+        return math.hypot(px - ax, py - ay)
+    return abs(dy * px - dx * py + bx * ay - by * ax) / length
+
+
+# drop every point closer than tolerance to the last point kept, the ends are always kept;
+# much cheaper than simplify, good enough to thin out lines drawn at a small scale
+def decimate(coords, tolerance):
+    n = len(coords) // 2
+    if n < 3:
+        return list(coords)
+
+    limit = tolerance * tolerance
+    lx, ly = coords[0], coords[1]
+    out = [lx, ly]
+    for i in range(2, 2 * n - 2, 2):
+        x, y = coords[i], coords[i + 1]
+        if (x - lx) * (x - lx) + (y - ly) * (y - ly) >= limit:
+            out.append(x)
+            out.append(y)
+            lx, ly = x, y
+    out.append(coords[2 * n - 2])
+    out.append(coords[2 * n - 1])
+    return out
+
+
+# Ramer-Douglas-Peucker simplification of a flat coordinate list [x0, y0, x1, y1, ...]
+def simplify(coords, tolerance):
+    n = len(coords) // 2
+    if n < 3:
+        return list(coords)
+
+    keep = [False] * n
+    keep[0] = keep[n - 1] = True
+
+    # explicit stack instead of recursion so long strokes cannot hit the recursion limit
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        ax, ay = coords[2 * first], coords[2 * first + 1]
+        bx, by = coords[2 * last], coords[2 * last + 1]
+
+        max_dist = 0
+        max_idx = first
+        for i in range(first + 1, last):
+            dist = line_distance(coords[2 * i], coords[2 * i + 1], ax, ay, bx, by)
+            if dist > max_dist:
+                max_dist = dist
+                max_idx = i
+
+        # split at the farthest point if it is outside the tolerance
+        if max_dist > tolerance:
+            keep[max_idx] = True
+            stack.append((first, max_idx))
+            stack.append((max_idx, last))
+
+    simplified = []
+    for i in range(n):
+        if keep[i]:
+            simplified.append(coords[2 * i])
+            simplified.append(coords[2 * i + 1])
+    return simplified
+
+
+# distance from point (px, py) to the segment between (ax, ay) and (bx, by)
+def segment_distance(px, py, ax, ay, bx, by):
+    dx, dy = bx - ax, by - ay
+    length_sq = dx * dx + dy * dy
+    if length_sq == 0:
+        return math.hypot(px - ax, py - ay)
+
+    # project the point onto the segment and clamp to its end points
+    t = max(0.0, min(1.0, ((px - ax) * dx + (py - ay) * dy) / length_sq))
+    return math.hypot(px - (ax + t * dx), py - (ay + t * dy))
+
+
+# distance from point (px, py) to an open polyline given as a flat coordinate list
+def polyline_distance(px, py, coords):
+    if len(coords) < 4:
+        return math.hypot(px - coords[0], py - coords[1])
+
+    best = math.inf
+    for i in range(0, len(coords) - 2, 2):
+        dist = segment_distance(px, py, coords[i], coords[i + 1], coords[i + 2], coords[i + 3])
+        if dist < best:
+            best = dist
+    return best
+
+
+# distance from point (px, py) to the outline of a drawable of the given kind
+def outline_distance(px, py, tag, coords):
+    if tag == 'rectangle':
+        x0, y0, x1, y1 = coords[:4]
+        return polyline_distance(px, py, [x0, y0, x1, y0, x1, y1, x0, y1, x0, y0])
+
+    if tag == 'oval':
+        x0, y0, x1, y1 = coords[:4]
+        rx, ry = abs(x1 - x0) / 2, abs(y1 - y0) / 2
+        cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
+
+        # a degenerate oval is drawn as a line
+        if rx == 0 or ry == 0:
+            return segment_distance(px, py, x0, y0, x1, y1)
+
+        # radial approximation of the distance to the ellipse
+        r = math.hypot((px - cx) / rx, (py - cy) / ry)
+        return abs(r - 1) * min(rx, ry)
+
+    return polyline_distance(px, py, coords)
+
+
+# part of the segment from (ax, ay) to (bx, by) inside the circle around (cx, cy), as the interval
+# (t0, t1) of the segment parameter, None when the segment stays outside
+def circle_span(ax, ay, bx, by, cx, cy, radius):
+    dx, dy = bx - ax, by - ay
+    fx, fy = ax - cx, ay - cy
+    a = dx * dx + dy * dy
+    c = fx * fx + fy * fy - radius * radius
+    if a == 0:
+        return (0.0, 1.0) if c <= 0 else None
+
+    half_b = fx * dx + fy * dy
+    discriminant = half_b * half_b - a * c
+    if discriminant <= 0:
+        return None
+
+    root = math.sqrt(discriminant)
+    t0 = max((-half_b - root) / a, 0.0)
+    t1 = min((-half_b + root) / a, 1.0)
+    return (t0, t1) if t0 < t1 else None
+
+
+# kinds defined by two opposite corners of an axis aligned box
+BOXES = ['rectangle', 'oval']
+
+
+# closed outline of a rectangle or oval as a polyline, ovals approximated by chords; what is left
+# of a box once it is rotated
+def box_outline(tag, coords, segments=48):
+    x0, y0, x1, y1 = coords[:4]
+    if tag == 'rectangle':
+        return [x0, y0, x1, y0, x1, y1, x0, y1, x0, y0]
+
+    cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
+    rx, ry = (x1 - x0) / 2, (y1 - y0) / 2
+    outline = []
+    for i in range(segments):
+        angle = 2 * math.pi * i / segments
+        outline.append(cx + rx * math.cos(angle))
+        outline.append(cy + ry * math.sin(angle))
+    outline.append(outline[0])
+    outline.append(outline[1])
+    return outline
+
+
+# axis aligned bounding box (x0, y0, x1, y1) of a flat coordinate list
+def bounding_box(coords):
+    xs = coords[0::2]
+    ys = coords[1::2]
+    return min(xs), min(ys), max(xs), max(ys)
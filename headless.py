@@ -0,0 +1,396 @@
+import itertools
+
+from raster import parse_color
+
+# in-memory stand-ins for the Tk widgets the controller talks to, so scenes can be edited,
+# measured and tested without a display
+#
+# the controller only needs this part of the tk.Canvas interface:
+#   create_line, create_rectangle, create_oval   new item from a coordinate list, returns its id
+#   create_image, create_text                     raster cache background and overlay
+#   coords, insert, move                          read or change item coordinates
+#   delete, gettags, itemcget, itemconfigure      item lifetime and options
+#   addtag_withtag, dtag, tag_lower, tag_raise    tags and stacking order
+#   bind, cget, winfo_width, winfo_height, winfo_rgb
+# and of the other widgets: bind, unbind, after, after_idle, after_cancel, protocol, destroy
+#
+# items are addressed like on a real canvas: by id, by tag or by 'all'
+
+
+class HeadlessEvent:
+    # the fields of a Tk event the handlers read
+    def __init__(self, x=0, y=0, **fields):
+        self.x = x
+        self.y = y
+        self.__dict__.update(fields)
+
+
+class HeadlessWidget:
+
+    def __init__(self):
+        self.bindings = {}
+        self.protocols = {}
+        self.destroyed = False
+
+        # pending after callbacks in the order they were scheduled
+        self.__pending = {}
+        self.__after_ids = itertools.count(1)
+
+    def bind(self, sequence, func=None, add=None):
+        self.bindings[sequence] = func
+
+    def unbind(self, sequence, funcid=None):
+        self.bindings.pop(sequence, None)
+
+    def protocol(self, name, func=None):
+        self.protocols[name] = func
+
+    def destroy(self):
+        self.destroyed = True
+
+    # deliver an event to the handler bound to sequence, as Tk would
+    def event(self, sequence, x=0, y=0, **fields):
+        handler = self.bindings.get(sequence)
+        if handler is None:
+            return None
+        return handler(HeadlessEvent(x, y, **fields))
+
+    # callbacks run in the order they were scheduled, the delay is ignored
+    def after(self, ms, func=None, *args):
+        ident = 'after#' + str(next(self.__after_ids))
+        self.__pending[ident] = (func, args)
+        return ident
+
+    def after_idle(self, func, *args):
+        return self.after(0, func, *args)
+
+    def after_cancel(self, ident):
+        self.__pending.pop(ident, None)
+
+    # run the callbacks that were pending when called, like one pass of the event loop
+    def update(self):
+        pending = self.__pending
+        self.__pending = {}
+        for func, args in pending.values():
+            func(*args)
+        return len(pending)
+
+    # keep running callbacks until none are left
+    def run_until_idle(self):
+        while self.__pending:
+            self.update()
+
+
+class HeadlessItem:
+    __slots__ = ('kind', 'coords', 'tags', 'options', 'below', 'above')
+
+    def __init__(self, kind, coords, tags, options):
+        self.kind = kind
+        self.coords = coords
+        self.tags = tags
+        self.options = options
+
+        # neighbours in the stacking order, like the display list of a real canvas
+        self.below = None
+        self.above = None
+
+
+class HeadlessCanvas(HeadlessWidget):
+
+    def __init__(self, width=1280, height=720, background='gray88'):
+        super().__init__()
+        self.width = width
+        self.height = height
+        self.background = background
+
+        # item id -> item
+        self.__items = {}
+
+        # ends of the stacking order
+        self.__bottom = None
+        self.__top = None
+
+        # tag -> ids of the items carrying it
+        self.__tags = {}
+
+        self.__ids = itertools.count(1)
+
+        # number of item operations, a rough stand-in for the work a real canvas does
+        self.calls = 0
+
+    def __len__(self):
+        return len(self.__items)
+
+    def place(self, **options):
+        pass
+
+    def cget(self, option):
+        return str({'width': self.width, 'height': self.height,
+                    'background': self.background, 'bg': self.background}[option])
+
+    def winfo_width(self):
+        return self.width
+
+    def winfo_height(self):
+        return self.height
+
+    def winfo_rgb(self, color):
+        return parse_color(color)
+
+    # ids of the items tagOrId refers to, in no particular order
+    def __find(self, tag):
+        if type(tag) is int or (type(tag) is str and tag.isdigit()):
+            return [int(tag)] if int(tag) in self.__items else []
+        if tag == 'all':
+            return list(self.__items)
+        return list(self.__tags.get(tag, ()))
+
+    # lowest item in the stacking order that tagOrId refers to
+    def __first(self, tag):
+        ids = self.__find(tag)
+        if len(ids) < 2:
+            return ids[0] if ids else None
+        return self.__stacked(ids)[0]
+
+    # ids from bottom to top
+    def __stacked(self, ids):
+        if len(ids) < 2:
+            return list(ids)
+
+        ids = set(ids)
+        order = []
+        ident = self.__bottom
+        while ident is not None and len(order) < len(ids):
+            if ident in ids:
+                order.append(ident)
+            ident = self.__items[ident].above
+        return order
+
+    # ids of the items tagOrId refers to, from bottom to top
+    def find_withtag(self, tag):
+        return tuple(self.__stacked(self.__find(tag)))
+
+    def __create(self, kind, args, options):
+        self.calls += 1
+
+        coords = flatten(args)
+        tags = options.pop('tags', options.pop('tag', ()))
+        if isinstance(tags, str):
+            tags = tags.split()
+
+        ident = next(self.__ids)
+        self.__items[ident] = HeadlessItem(kind, coords, list(dict.fromkeys(tags)), options)
+        self.__link(ident, self.__top, None)
+        for tag in self.__items[ident].tags:
+            self.__tags.setdefault(tag, {})[ident] = None
+        return ident
+
+    def create_line(self, *args, **options):
+        return self.__create('line', args, options)
+
+    def create_rectangle(self, *args, **options):
+        return self.__create('rectangle', args, options)
+
+    def create_oval(self, *args, **options):
+        return self.__create('oval', args, options)
+
+    def create_image(self, *args, **options):
+        return self.__create('image', args, options)
+
+    def create_text(self, *args, **options):
+        return self.__create('text', args, options)
+
+    def type(self, tag):
+        ident = self.__first(tag)
+        return None if ident is None else self.__items[ident].kind
+
+    def coords(self, tag, *args):
+        self.calls += 1
+        ident = self.__first(tag)
+        if ident is None:
+            return []
+
+        if args:
+            self.__items[ident].coords = flatten(args)
+            return None
+        return list(self.__items[ident].coords)
+
+    def insert(self, tag, index, values):
+        self.calls += 1
+        values = flatten([values])
+        for ident in self.__find(tag):
+            coords = self.__items[ident].coords
+            position = len(coords) if index == 'end' else int(index)
+            coords[position:position] = values
+
+    def move(self, tag, dx, dy):
+        self.calls += 1
+        for ident in self.__find(tag):
+            item = self.__items[ident]
+            coords = item.coords
+            coords[0::2] = [x + dx for x in coords[0::2]]
+            coords[1::2] = [y + dy for y in coords[1::2]]
+
+    def delete(self, *tags):
+        self.calls += 1
+        for tag in tags:
+            for ident in self.__find(tag):
+                self.__unlink(ident)
+                item = self.__items.pop(ident)
+                for name in item.tags:
+                    del self.__tags[name][ident]
+                    if not self.__tags[name]:
+                        del self.__tags[name]
+
+    def gettags(self, tag):
+        ident = self.__first(tag)
+        return () if ident is None else tuple(self.__items[ident].tags)
+
+    def itemcget(self, tag, option):
+        ident = self.__first(tag)
+        return '' if ident is None else self.__items[ident].options.get(option, '')
+
+    def itemconfigure(self, tag, **options):
+        self.calls += 1
+        for ident in self.__find(tag):
+            self.__items[ident].options.update(options)
+
+    itemconfig = itemconfigure
+
+    def addtag_withtag(self, new_tag, tag):
+        for ident in self.__find(tag):
+            item = self.__items[ident]
+            if new_tag not in item.tags:
+                item.tags.append(new_tag)
+                self.__tags.setdefault(new_tag, {})[ident] = None
+
+    def dtag(self, tag, tag_to_delete=None):
+        if tag_to_delete is None:
+            tag_to_delete = tag
+        for ident in self.__find(tag):
+            item = self.__items[ident]
+            if tag_to_delete in item.tags:
+                item.tags.remove(tag_to_delete)
+                del self.__tags[tag_to_delete][ident]
+                if not self.__tags[tag_to_delete]:
+                    del self.__tags[tag_to_delete]
+
+    # move the items of tag just below the first item of below, or to the bottom
+    def tag_lower(self, tag, below=None):
+        self.__restack(tag, below, False)
+
+    # move the items of tag just above the last item of above, or to the top
+    def tag_raise(self, tag, above=None):
+        self.__restack(tag, above, True)
+
+    def __restack(self, tag, anchor, up):
+        moved = self.__find(tag)
+        if not moved:
+            return
+
+        if anchor is None:
+            target = self.__top if up else self.__bottom
+        else:
+            anchors = self.__stacked(set(self.__find(anchor)) - set(moved))
+            if not anchors:
+                return
+            target = anchors[-1] if up else anchors[0]
+
+        moved = self.__stacked(moved)
+        for ident in moved:
+            self.__unlink(ident)
+
+        # target may itself have been moved when no anchor was given
+        if target in moved:
+            target = self.__top if up else self.__bottom
+
+        for ident in moved:
+            if up:
+                self.__link(ident, target, None if target is None else self.__items[target].above)
+                target = ident
+            elif target is None:
+                self.__link(ident, self.__top, None)
+            else:
+                self.__link(ident, self.__items[target].below, target)
+
+    def __link(self, ident, below, above):
+        item = self.__items[ident]
+        item.below = below
+        item.above = above
+        if below is None:
+            self.__bottom = ident
+        else:
+            self.__items[below].above = ident
+        if above is None:
+            self.__top = ident
+        else:
+            self.__items[above].below = ident
+
+    def __unlink(self, ident):
+        item = self.__items[ident]
+        if item.below is None:
+            self.__bottom = item.above
+        else:
+            self.__items[item.below].above = item.above
+        if item.above is None:
+            self.__top = item.below
+        else:
+            self.__items[item.above].below = item.below
+        item.below = item.above = None
+
+
+class HeadlessGUI:
+    # same getters as GUI, backed by headless widgets
+
+    def __init__(self, width=1280, height=720):
+        self.__root = HeadlessWidget()
+        self.__canvas = HeadlessCanvas(width, height)
+        self.__btn_list = [HeadlessWidget() for _ in range(9)]
+        self.__color = '#000000'
+        self.label = ''
+
+    def get_canvas(self):
+        return self.__canvas
+
+    def get_btn_list(self):
+        return self.__btn_list
+
+    def get_root(self):
+        return self.__root
+
+    def get_color(self):
+        return self.__color
+
+    def set_color(self, color):
+        self.__color = color
+
+    def set_label_text(self, txt):
+        self.label = txt
+
+    def get_label_text(self):
+        return self.label
+
+    # the image data itself stands in for the photo image
+    def photo_image(self, data):
+        return data
+
+
+# flat list of floats from coordinates given as numbers, pairs or sequences
+def flatten(args):
+    # the usual call passes the numbers themselves or one flat list of them
+    if len(args) == 1 and isinstance(args[0], (list, tuple)):
+        args = args[0]
+    if all(type(value) in (int, float) for value in args):
+        return [float(value) for value in args]
+
+    coords = []
+    stack = [iter(args)]
+    while stack:
+        value = next(stack[-1], None)
+        if value is None:
+            stack.pop()
+        elif isinstance(value, (list, tuple)):
+            stack.append(iter(value))
+        else:
+            coords.append(float(value))
+    return coords
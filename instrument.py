@@ -0,0 +1,189 @@
+import json
+import math
+import time
+
+# latency of the bound Tk handlers, event rates and scene size, recorded while enabled
+#
+# every handler the controller binds goes through wrap(); while disabled the wrapper only checks
+# a flag before calling the handler. While enabled each call is timed into a histogram, and the
+# time from the first event of a batch until Tk is idle again, which includes redrawing the
+# canvas, is recorded as the frame time. A sample of the scene counters is taken every tick for
+# the overlay and the export.
+
+# histogram buckets per doubling of the latency
+STEPS = 4
+
+# latencies are kept in microseconds, everything up to about 70 seconds has a bucket
+BUCKETS = STEPS * 26
+
+
+class Histogram:
+
+    def __init__(self):
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        us = seconds * 1e6
+        self.counts[min(int(STEPS * math.log2(us)), BUCKETS - 1) if us > 1 else 0] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    # upper bound in seconds of the bucket holding the given fraction of the calls
+    def percentile(self, fraction):
+        if not self.count:
+            return 0.0
+        wanted = fraction * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= wanted:
+                return min(2 ** ((i + 1) / STEPS) / 1e6, self.max)
+        return self.max
+
+    def summary(self):
+        return {'count': self.count,
+                'mean_ms': round(self.total / self.count * 1000, 3) if self.count else 0.0,
+                'p50_ms': round(self.percentile(0.5) * 1000, 3),
+                'p90_ms': round(self.percentile(0.9) * 1000, 3),
+                'p99_ms': round(self.percentile(0.99) * 1000, 3),
+                'max_ms': round(self.max * 1000, 3)}
+
+
+class Instruments:
+
+    def __init__(self, root, sample, tick=500):
+        self.root = root
+
+        # sample() -> dict of scene counters such as item counts and memory
+        self.sample = sample
+
+        # milliseconds between samples and overlay updates
+        self.tick = tick
+
+        self.enabled = False
+
+        # canvas the overlay is drawn on, None while it is hidden
+        self.overlay = None
+        self.__text = None
+
+        self.reset()
+
+    def reset(self):
+        # handler name -> Histogram
+        self.handlers = {}
+        self.frames = Histogram()
+
+        # (seconds since start, counters) every tick
+        self.samples = []
+
+        # handler calls since the last tick, for the rates
+        self.__calls = {}
+        self.__started = time.perf_counter()
+        self.__last_tick = self.__started
+        self.__rates = {}
+
+        self.__frame_start = None
+        self.__after = None
+
+    # handler that calls the given one, timed while the instruments are enabled
+    def wrap(self, handler):
+        name = handler.__name__
+
+        def timed(event):
+            if not self.enabled:
+                return handler(event)
+
+            start = time.perf_counter()
+            try:
+                return handler(event)
+            finally:
+                self.record(name, start, time.perf_counter())
+
+        return timed
+
+    def record(self, name, start, end):
+        histogram = self.handlers.get(name)
+        if histogram is None:
+            histogram = self.handlers[name] = Histogram()
+        histogram.add(end - start)
+        self.__calls[name] = self.__calls.get(name, 0) + 1
+
+        # the frame ends once Tk has handled every pending event and redraw
+        if self.__frame_start is None:
+            self.__frame_start = start
+            self.root.after_idle(self.__frame_done)
+
+    def __frame_done(self):
+        if self.__frame_start is not None:
+            self.frames.add(time.perf_counter() - self.__frame_start)
+        self.__frame_start = None
+
+    def enable(self, enabled, canvas=None):
+        if enabled == self.enabled:
+            return
+
+        self.enabled = enabled
+        if enabled:
+            self.reset()
+            self.overlay = canvas
+            self.__tick()
+        else:
+            self.root.after_cancel(self.__after)
+            self.__after = None
+            self.__frame_start = None
+            if self.__text is not None:
+                self.overlay.delete(self.__text)
+            self.overlay = self.__text = None
+
+    def __tick(self):
+        now = time.perf_counter()
+        elapsed = now - self.__last_tick
+        self.__rates = {name: calls / elapsed for name, calls in self.__calls.items()} if elapsed else {}
+        self.__calls = {}
+        self.__last_tick = now
+
+        self.samples.append((round(now - self.__started, 3), self.sample()))
+        if self.overlay is not None:
+            self.__draw_overlay()
+        self.__after = self.root.after(self.tick, self.__tick)
+
+    def __draw_overlay(self):
+        lines = []
+        busiest = sorted(self.handlers.items(), key=lambda item: -item[1].count)
+        for name, histogram in busiest[:8]:
+            lines.append('%-16s %6.1f/s  p50 %6.2f  p99 %6.2f ms' % (name, self.__rates.get(name, 0.0),
+                                                                   histogram.percentile(0.5) * 1000,
+                                                                   histogram.percentile(0.99) * 1000))
+        lines.append('%-16s %8s  p50 %6.2f  p99 %6.2f ms' % ('frame', '', self.frames.percentile(0.5) * 1000,
+                                                             self.frames.percentile(0.99) * 1000))
+        for key, value in self.samples[-1][1].items():
+            lines.append('%-16s %s' % (key, value))
+
+        text = '\n'.join(lines)
+        if self.__text is None:
+            self.__text = self.overlay.create_text(8, 8, text=text, anchor='nw', font=('TkFixedFont', 9),
+                                                   tags='overlay')
+        else:
+            # panning moves every canvas item, the overlay included
+            self.overlay.itemconfigure(self.__text, text=text)
+            self.overlay.coords(self.__text, 8, 8)
+        self.overlay.tag_raise(self.__text)
+
+    def report(self):
+        elapsed = time.perf_counter() - self.__started
+        return {'seconds': round(elapsed, 3),
+                'handlers': {name: dict(histogram.summary(),
+                                        rate=round(histogram.count / elapsed, 2) if elapsed else 0.0)
+                             for name, histogram in sorted(self.handlers.items())},
+                'frames': self.frames.summary(),
+                'samples': [dict(counters, t=t) for t, counters in self.samples]}
+
+    def export(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+            f.write('\n')
@@ -0,0 +1,340 @@
+import io
+import json
+import os
+import queue
+import threading
+import time
+
+from geometry import BOXES, box_outline
+from packed_geometry import rotates
+from scene_format import SceneSnapshot, is_leaf_tree, leaf_fields, leaf_tree, read_tree
+
+# the journal directory holds
+#   snapshot-<n>.sketch   the scene as it was when generation n started
+#   journal.log           a header line {"base": n} followed by one JSON record per scene change
+#
+# a record is a list whose first item names the change, applied to the scene as nested lists:
+#   ["add", tree]                 append an entry
+#   ["extend", trees]             append several entries
+#   ["truncate", n]               remove the last n entries
+#   ["insert", position, tree]    insert an entry
+#   ["pop", position]             remove an entry
+#   ["move", position, dx, dy]    translate an entry
+#   ["transform", positions, [a, b, c, d, e, f]]
+#                                 map the entries through x' = a x + c y + e, y' = b x + d y + f,
+#                                 rotated rectangles and ovals become polygons
+#   ["restyle", kind, color, width, new_color, new_width, locations]
+#                                 recolor the shapes of a style, locations lists [position, leaf numbers]
+#                                 with the leaves of an entry numbered in the order leaf_trees walks
+#                                 them; without locations every shape with the old values is recolored
+#   ["group", positions, group]   group the entries at the positions, the group goes to position group,
+#                                 last without it
+#   ["split", positions, group]   dissolve the group at position group back into the positions, the last
+#                                 group without it
+#   ["ungroup", position, start]  dissolve a group, its members go from start on, last without it
+#   ["merge", position, n, start] group the n entries from start back into the position, the last n
+#                                 without start
+#   ["batch", records]            apply the records in order
+
+
+def translate_tree(item, dx, dy):
+    if is_leaf_tree(item):
+        item[2] = [coord + (dx if i % 2 == 0 else dy) for i, coord in enumerate(item[2])]
+    else:
+        for i in item:
+            translate_tree(i, dx, dy)
+
+
+def transform_tree(item, matrix):
+    if is_leaf_tree(item):
+        kind, coords, color, width = leaf_fields(item)
+        if kind in BOXES and rotates(matrix):
+            coords = box_outline(kind, coords)
+            kind = 'poly'
+        a, b, c, d, e, f = matrix
+        transformed = []
+        for i in range(0, len(coords) - 1, 2):
+            x, y = coords[i], coords[i + 1]
+            transformed.append(a * x + c * y + e)
+            transformed.append(b * x + d * y + f)
+        item[:] = leaf_tree(item[0], kind, transformed, color, width)
+    else:
+        for i in item:
+            transform_tree(i, matrix)
+
+
+# every leaf of an entry, in the order scene_index.leaves walks the drawables
+def leaf_trees(item):
+    if is_leaf_tree(item):
+        yield item
+        return
+
+    stack = [item]
+    while stack:
+        for i in stack.pop():
+            if is_leaf_tree(i):
+                yield i
+            elif type(i) is list:
+                stack.append(i)
+
+
+def restyle_leaves(scene, locations, new_color, new_width):
+    for position, numbers in locations:
+        items = list(leaf_trees(scene[position]))
+        for number in numbers:
+            item = items[number]
+            kind, coords, _, _ = leaf_fields(item)
+            item[:] = leaf_tree(item[0], kind, coords, new_color, new_width)
+
+
+def restyle_tree(item, kind, color, width, new_color, new_width):
+    if is_leaf_tree(item):
+        leaf_kind, coords, leaf_color, leaf_width = leaf_fields(item)
+        if (leaf_kind, leaf_color, leaf_width) == (kind, color, width):
+            item[:] = leaf_tree(item[0], kind, coords, new_color, new_width)
+    else:
+        for i in item:
+            restyle_tree(i, kind, color, width, new_color, new_width)
+
+
+def apply(scene, record):
+    op = record[0]
+    if op == 'add':
+        scene.append(record[1])
+    elif op == 'extend':
+        scene.extend(record[1])
+    elif op == 'truncate':
+        del scene[len(scene) - record[1]:]
+    elif op == 'insert':
+        scene.insert(record[1], record[2])
+    elif op == 'pop':
+        del scene[record[1]]
+    elif op == 'move':
+        translate_tree(scene[record[1]], record[2], record[3])
+    elif op == 'transform':
+        for position in record[1]:
+            transform_tree(scene[position], record[2])
+    elif op == 'restyle' and len(record) > 6:
+        restyle_leaves(scene, record[6], record[4], record[5])
+    elif op == 'restyle':
+        restyle_tree(scene, *record[1:])
+    elif op == 'group':
+        positions = sorted(record[1])
+        group = [scene[i] for i in positions]
+        for i in reversed(positions):
+            del scene[i]
+        scene.insert(record[2] if len(record) > 2 else len(scene), group)
+    elif op == 'split':
+        group = scene.pop(record[2] if len(record) > 2 else -1)
+        for position, entry in zip(sorted(record[1]), group):
+            scene.insert(position, entry)
+    elif op == 'ungroup':
+        group = scene.pop(record[1])
+        start = record[2] if len(record) > 2 else len(scene)
+        scene[start:start] = group
+    elif op == 'merge':
+        start = record[3] if len(record) > 3 else len(scene) - record[2]
+        group = scene[start:start + record[2]]
+        del scene[start:start + record[2]]
+        scene.insert(record[1], group)
+    elif op == 'batch':
+        for inner in record[1]:
+            apply(scene, inner)
+    else:
+        raise ValueError('unknown journal record ' + str(op))
+
+
+class Journal:
+    # append-only log of scene changes written by a background thread, compacted into snapshots
+
+    def __init__(self, directory, fsync='interval', fsync_interval=1.0):
+        self.directory = directory
+        self.log_path = os.path.join(directory, 'journal.log')
+
+        # 'always' syncs every record, 'interval' at most every fsync_interval seconds, 'never' leaves it to the OS
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+
+        # compact once the log is larger than the snapshot it is based on, but not for tiny logs
+        self.min_compact_bytes = 64 * 1024
+
+        self.generation = 0
+        self.log_bytes = 0
+        self.snapshot_bytes = 0
+
+        self.__queue = queue.Queue()
+        self.__thread = None
+        self.__log = None
+        self.__last_sync = 0
+        self.__unsynced = False
+
+        # tasks handed to the writer thread and tasks it is done with, each counted by one thread
+        self.__queued = 0
+        self.__handled = 0
+
+        # errors raised by the writer thread, and whether the log has fallen behind the scene because
+        # of one; records are dropped then until the next snapshot starts a new log
+        self.__errors = queue.Queue()
+        self.failed = False
+
+    def snapshot_path(self, generation):
+        return os.path.join(self.directory, 'snapshot-' + str(generation) + '.sketch')
+
+    # a log left behind means the last session did not close cleanly
+    def has_recovery(self):
+        return os.path.exists(self.log_path)
+
+    # scene of the crashed session as nested lists: its snapshot with the log replayed on top
+    def recover(self):
+        with open(self.log_path, 'rb') as f:
+            lines = f.read().split(b'\n')
+
+        base = json.loads(lines[0])['base']
+        scene = []
+        if os.path.exists(self.snapshot_path(base)):
+            with open(self.snapshot_path(base), 'rb') as f:
+                scene = read_tree(f)
+
+        for line in lines[1:]:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # the last record may have been cut short by the crash
+                break
+            apply(scene, record)
+
+        self.generation = base
+        return scene
+
+    # begin journaling a session whose scene is currently entries
+    def start(self, entries):
+        os.makedirs(self.directory, exist_ok=True)
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+        self.compact(entries)
+
+    def record(self, record):
+        # the record only holds plain lists, so encoding can happen on the writer thread
+        self.__put(('record', record))
+
+    def needs_compaction(self):
+        return self.log_bytes > max(self.snapshot_bytes, self.min_compact_bytes)
+
+    # the scene is copied here and written by the writer thread
+    def compact(self, entries):
+        snapshot = SceneSnapshot(entries)
+        self.generation += 1
+        self.snapshot_bytes = snapshot.nbytes()
+        self.log_bytes = 0
+        self.__put(('snapshot', self.generation, snapshot))
+
+    def __put(self, task):
+        self.__queued += 1
+        self.__queue.put(task)
+
+    # whether the writer thread still has records or snapshots to write
+    def busy(self):
+        return self.__handled != self.__queued
+
+    # next error raised by the writer thread, None when there is none
+    def take_error(self):
+        try:
+            return self.__errors.get_nowait()
+        except queue.Empty:
+            return None
+
+    # stop the writer, a clean close removes the journal so nothing is recovered next time
+    def close(self, clean=True):
+        if self.__thread is None:
+            return
+
+        self.__put(('close', clean))
+        self.__thread.join()
+        self.__thread = None
+
+    def __run(self):
+        while True:
+            try:
+                task = self.__queue.get(timeout=self.fsync_interval)
+            except queue.Empty:
+                task = None
+
+            # whatever a task raises, the thread has to live on to write the next snapshot and to close
+            try:
+                if task is None:
+                    self.__sync()
+                elif task[0] == 'record':
+                    if not self.failed:
+                        self.__append(task[1])
+                elif task[0] == 'snapshot':
+                    self.__write_snapshot(task[1], task[2])
+                    self.failed = False
+                else:
+                    self.__finish(task[1])
+            except Exception as e:
+                self.failed = True
+                self.__errors.put(e)
+
+            if task is not None:
+                self.__handled += 1
+                if task[0] == 'close':
+                    return
+
+    def __append(self, record):
+        line = json.dumps(record, separators=(',', ':')).encode('utf-8') + b'\n'
+        self.__log.write(line)
+        self.log_bytes += len(line)
+        self.__unsynced = True
+
+        if self.fsync == 'always':
+            self.__sync()
+        elif self.fsync == 'interval' and time.monotonic() - self.__last_sync >= self.fsync_interval:
+            self.__sync()
+
+    def __sync(self):
+        if self.__log is None or not self.__unsynced:
+            return
+        self.__log.flush()
+        if self.fsync != 'never':
+            os.fsync(self.__log.fileno())
+        self.__last_sync = time.monotonic()
+        self.__unsynced = False
+
+    def __write_snapshot(self, generation, snapshot):
+        data = io.BytesIO()
+        snapshot.write(data)
+        self.snapshot_bytes = len(data.getvalue())
+
+        # the new snapshot is in place before the log that refers to it
+        write_atomic(self.snapshot_path(generation), data.getvalue())
+
+        if self.__log is not None:
+            self.__log.close()
+            self.__log = None
+        write_atomic(self.log_path, json.dumps({'base': generation}).encode('utf-8') + b'\n')
+        self.__log = open(self.log_path, 'ab')
+
+        # older snapshots are no longer referenced by the log
+        for name in os.listdir(self.directory):
+            if name.startswith('snapshot-') and name != os.path.basename(self.snapshot_path(generation)):
+                os.remove(os.path.join(self.directory, name))
+
+    def __finish(self, clean):
+        if self.__log is not None:
+            self.__sync()
+            self.__log.close()
+            self.__log = None
+
+        if clean:
+            for path in [self.log_path, self.snapshot_path(self.generation)]:
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+def write_atomic(path, data):
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
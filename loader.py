@@ -0,0 +1,151 @@
+import time
+
+from drawable import Drawable
+from drawable_list import Group
+from geometry import bounding_box
+from scene_format import SceneFile, is_scene_file, leaf_fields, load_legacy
+from scene_index import leaves
+
+
+class SceneLoader:
+    # loads a scene file in time slices scheduled with after, so Tk keeps handling events:
+    # the shapes are read into the model first, then indexed and shown entry by entry
+
+    def __init__(self, controller, budget=0.012, view=None):
+        self.controller = controller
+
+        # seconds of work per slice before control goes back to the event loop
+        self.budget = budget
+
+        # world region (x0, y0, x1, y1) whose entries are shown first, None for file order
+        self.view = view
+
+        # number of shapes in the file and how many of them are indexed
+        self.total = 0
+        self.created = 0
+
+        # whether the loaded scene already replaced the old one
+        self.began = False
+
+        self.__file = None
+        self.__job = None
+        self.__after = None
+
+    def start(self, f):
+        self.__file = f
+        self.__job = self.__run()
+        self.__schedule()
+
+    def cancel(self):
+        if self.__job is None:
+            return
+        self.controller.gui.get_root().after_cancel(self.__after)
+        self.__job.close()
+        self.__job = None
+        self.__file.close()
+
+    def __schedule(self):
+        self.__after = self.controller.gui.get_root().after(1, self.__step)
+
+    def __step(self):
+        deadline = time.perf_counter() + self.budget
+        try:
+            while time.perf_counter() < deadline:
+                next(self.__job)
+        except StopIteration:
+            self.__job = None
+            self.controller.finish_load()
+            return
+
+        self.controller.load_progress(self.created, self.total)
+        self.__schedule()
+
+    def __run(self):
+        try:
+            if is_scene_file(self.__file):
+                entries = yield from self.__read_scene(self.__file)
+            else:
+                entries = yield from self.__read_legacy(self.__file)
+        finally:
+            self.__file.close()
+
+        # the new scene becomes current, its entries appear as the loader reaches them
+        self.controller.begin_scene(entries)
+        self.began = True
+
+        if self.view is not None:
+            entries = yield from self.__visible_first(entries)
+
+        for entry in entries:
+            self.created += self.controller.realize_entry(entry)
+            yield
+
+    def __read_scene(self, f):
+        store = self.controller.store
+        with SceneFile(f) as scene:
+            self.total = scene.leaf_count
+
+            # shape data goes into the store in bulk, then every row gets the drawable that owns it
+            first = scene.load_into(store)
+            last = first + scene.leaf_count
+            drawables = []
+            try:
+                for start in range(first, last, 1024):
+                    drawables.extend(Drawable.from_row(store, row) for row in range(start, min(start + 1024, last)))
+                    yield
+            finally:
+                # when cancelled, rows that have no drawable yet would never be released otherwise
+                for row in range(first + len(drawables), last):
+                    store.release(row)
+
+            stack = [([], -1)]
+            for token in scene.tokens():
+                if token >= 0:
+                    stack[-1][0].append(drawables[token])
+                else:
+                    stack.append(([], -token - 1))
+
+                while len(stack) > 1 and len(stack[-1][0]) >= stack[-1][1]:
+                    children, _ = stack.pop()
+                    stack[-1][0].append(Group(children, self.controller.new_group_tag()))
+                yield
+        return stack[0][0]
+
+    def __read_legacy(self, f):
+        tree = load_legacy(f)
+        entries = []
+        stack = [(iter(tree), entries)]
+        while stack:
+            item = next(stack[-1][0], None)
+            if item is None:
+                _, children = stack.pop()
+                if stack:
+                    stack[-1][1].append(Group(children, self.controller.new_group_tag()))
+                continue
+
+            fields = leaf_fields(item)
+            if fields is not None:
+                kind, coords, color, width = fields
+                stack[-1][1].append(Drawable(self.controller.store.new_ident(), kind, coords, color,
+                                             self.controller.store, width))
+                self.total += 1
+            else:
+                stack.append((iter(item), []))
+            yield
+        return entries
+
+    # entries touching the view first, then the rest; drawing order comes from the idents
+    def __visible_first(self, entries):
+        x0, y0, x1, y1 = self.view
+        visible = []
+        hidden = []
+        for entry in entries:
+            for leaf in leaves(entry):
+                lx0, ly0, lx1, ly1 = bounding_box(leaf.coords)
+                if lx0 <= x1 and lx1 >= x0 and ly0 <= y1 and ly1 >= y0:
+                    visible.append(entry)
+                    break
+            else:
+                hidden.append(entry)
+            yield
+        return visible + hidden
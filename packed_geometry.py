@@ -0,0 +1,226 @@
+import math
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# geometry of many drawables at once: the coordinates of a set of store rows are gathered into
+# one x and one y buffer and every operation runs over all of them in a single pass, vectorized
+# with numpy when it is installed and with list comprehensions over the whole buffer otherwise
+#
+# the rows keep their number of points, so results are written back in place; a PackedCoords is
+# only valid until the store changes, it is built right before it is used
+
+
+# affine matrices (a, b, c, d, e, f) mapping x' = a x + c y + e, y' = b x + d y + f
+
+# scale by (sx, sy) around (cx, cy)
+def scaling(sx, sy, cx, cy):
+    return sx, 0.0, 0.0, sy, cx - sx * cx, cy - sy * cy
+
+
+# rotate counterclockwise on screen by angle radians around (cx, cy), y pointing down
+def rotation(angle, cx, cy):
+    cos, sin = math.cos(angle), math.sin(angle)
+    return cos, -sin, sin, cos, cx - cos * cx - sin * cy, cy + sin * cx - cos * cy
+
+
+# whether a matrix turns axis aligned boxes into something else
+def rotates(matrix):
+    return matrix[1] != 0 or matrix[2] != 0
+
+
+class PackedCoords:
+
+    def __init__(self, store, rows):
+        self.rows = list(rows)
+
+        # first point of every row in the packed buffers, followed by the number of points
+        self.starts = [0]
+        for row in self.rows:
+            self.starts.append(self.starts[-1] + store.lengths[row] // 2)
+
+        if numpy is not None and not self.rows:
+            self.index = numpy.zeros(0, dtype=numpy.int64)
+            self.xs = numpy.zeros(0)
+            self.ys = numpy.zeros(0)
+        elif numpy is not None:
+            # position of every x in the store buffer, the y follows it
+            offsets = numpy.array([store.offsets[row] for row in self.rows], dtype=numpy.int64)
+            counts = numpy.diff(numpy.array(self.starts, dtype=numpy.int64))
+            self.index = (numpy.repeat(offsets - 2 * numpy.array(self.starts[:-1], dtype=numpy.int64), counts)
+                          + 2 * numpy.arange(self.starts[-1], dtype=numpy.int64))
+
+            # a view of the store buffer must not outlive the call, the store could not grow meanwhile
+            coords = numpy.frombuffer(store.coords, dtype=numpy.float64)
+            self.xs = coords[self.index]
+            self.ys = coords[self.index + 1]
+            del coords
+        else:
+            self.xs = array('d')
+            self.ys = array('d')
+            for row in self.rows:
+                offset = store.offsets[row]
+                end = offset + store.lengths[row]
+                self.xs.extend(store.coords[offset:end:2])
+                self.ys.extend(store.coords[offset + 1:end:2])
+
+    def __len__(self):
+        return len(self.rows)
+
+    # copy the coordinates back to their rows
+    def write(self, store):
+        if not self.rows:
+            return
+
+        if numpy is not None:
+            coords = numpy.frombuffer(store.coords, dtype=numpy.float64)
+            coords[self.index] = self.xs
+            coords[self.index + 1] = self.ys
+            del coords
+            return
+
+        for i, row in enumerate(self.rows):
+            offset = store.offsets[row]
+            end = offset + store.lengths[row]
+            store.coords[offset:end:2] = self.xs[self.starts[i]:self.starts[i + 1]]
+            store.coords[offset + 1:end:2] = self.ys[self.starts[i]:self.starts[i + 1]]
+
+    # coordinates of the i-th row as a flat list
+    def coords(self, i):
+        xs = self.xs[self.starts[i]:self.starts[i + 1]]
+        ys = self.ys[self.starts[i]:self.starts[i + 1]]
+        return [coord for point in zip(xs, ys) for coord in point]
+
+    # box around every row together, None without rows
+    def bbox(self):
+        if not self.rows:
+            return None
+        if numpy is not None:
+            return float(self.xs.min()), float(self.ys.min()), float(self.xs.max()), float(self.ys.max())
+        return min(self.xs), min(self.ys), max(self.xs), max(self.ys)
+
+    # (x0, y0, x1, y1) of every row
+    def boxes(self):
+        if not self.rows:
+            return []
+
+        if numpy is not None:
+            starts = self.starts[:-1]
+            return list(zip(numpy.minimum.reduceat(self.xs, starts).tolist(),
+                            numpy.minimum.reduceat(self.ys, starts).tolist(),
+                            numpy.maximum.reduceat(self.xs, starts).tolist(),
+                            numpy.maximum.reduceat(self.ys, starts).tolist()))
+
+        boxes = []
+        for i in range(len(self.rows)):
+            xs = self.xs[self.starts[i]:self.starts[i + 1]]
+            ys = self.ys[self.starts[i]:self.starts[i + 1]]
+            boxes.append((min(xs), min(ys), max(xs), max(ys)))
+        return boxes
+
+    def translate(self, dx, dy):
+        if numpy is not None:
+            self.xs += dx
+            self.ys += dy
+        else:
+            self.xs = array('d', [x + dx for x in self.xs])
+            self.ys = array('d', [y + dy for y in self.ys])
+
+    # affine map x' = a x + c y + e, y' = b x + d y + f
+    def transform(self, a, b, c, d, e, f):
+        xs, ys = self.xs, self.ys
+        if numpy is not None:
+            self.xs = a * xs + c * ys + e
+            self.ys = b * xs + d * ys + f
+        else:
+            self.xs = array('d', [a * x + c * y + e for x, y in zip(xs, ys)])
+            self.ys = array('d', [b * x + d * y + f for x, y in zip(xs, ys)])
+
+    def scale(self, sx, sy, cx, cy):
+        self.transform(*scaling(sx, sy, cx, cy))
+
+    def rotate(self, angle, cx, cy):
+        self.transform(*rotation(angle, cx, cy))
+
+    # the same rows with their own copy of the coordinates
+    def copy(self):
+        packed = PackedCoords.__new__(PackedCoords)
+        packed.rows = self.rows
+        packed.starts = self.starts
+        if numpy is not None:
+            packed.index = self.index
+        packed.xs = self.xs.copy() if numpy is not None else array('d', self.xs)
+        packed.ys = self.ys.copy() if numpy is not None else array('d', self.ys)
+        return packed
+
+    # distance from (px, py) to every row taken as an open polyline, a single point is its own distance
+    def distances(self, px, py):
+        if not self.rows:
+            return []
+
+        if numpy is not None:
+            xs, ys = self.xs, self.ys
+            dx = numpy.diff(xs, append=xs[-1])
+            dy = numpy.diff(ys, append=ys[-1])
+
+            # the last point of a row does not lead to the first of the next one
+            last = numpy.array(self.starts[1:], dtype=numpy.int64) - 1
+            dx[last] = 0.0
+            dy[last] = 0.0
+
+            length_sq = dx * dx + dy * dy
+            with numpy.errstate(divide='ignore', invalid='ignore'):
+                t = numpy.where(length_sq > 0, ((px - xs) * dx + (py - ys) * dy) / length_sq, 0.0)
+            t = numpy.clip(t, 0.0, 1.0)
+            distances = numpy.hypot(px - (xs + t * dx), py - (ys + t * dy))
+            return numpy.minimum.reduceat(distances, self.starts[:-1]).tolist()
+
+        distances = []
+        for i in range(len(self.rows)):
+            first, end = self.starts[i], self.starts[i + 1]
+            best = math.hypot(px - self.xs[first], py - self.ys[first])
+            for k in range(first, end - 1):
+                ax, ay = self.xs[k], self.ys[k]
+                dx, dy = self.xs[k + 1] - ax, self.ys[k + 1] - ay
+                length_sq = dx * dx + dy * dy
+                t = max(0.0, min(1.0, ((px - ax) * dx + (py - ay) * dy) / length_sq)) if length_sq else 0.0
+                distance = math.hypot(px - (ax + t * dx), py - (ay + t * dy))
+                if distance < best:
+                    best = distance
+            distances.append(best)
+        return distances
+
+    # whether (px, py) is inside every row taken as a polygon closed from its last point back to
+    # the first, by the even-odd rule
+    def contains(self, px, py):
+        if not self.rows:
+            return []
+
+        if numpy is not None:
+            xs, ys = self.xs, self.ys
+
+            # the point following every point along its own polygon
+            following = numpy.arange(1, len(xs) + 1, dtype=numpy.int64)
+            following[numpy.array(self.starts[1:], dtype=numpy.int64) - 1] = self.starts[:-1]
+            xj, yj = xs[following], ys[following]
+
+            straddles = (ys > py) != (yj > py)
+            with numpy.errstate(divide='ignore', invalid='ignore'):
+                crossing = straddles & (px < xs + (py - ys) * (xj - xs) / (yj - ys))
+            return (numpy.add.reduceat(crossing.astype(numpy.int64), self.starts[:-1]) % 2 == 1).tolist()
+
+        inside = []
+        for i in range(len(self.rows)):
+            first, end = self.starts[i], self.starts[i + 1]
+            odd = False
+            j = end - 1
+            for k in range(first, end):
+                xi, yi, xj, yj = self.xs[k], self.ys[k], self.xs[j], self.ys[j]
+                if (yi > py) != (yj > py) and px < xi + (py - yi) * (xj - xi) / (yj - yi):
+                    odd = not odd
+                j = k
+            inside.append(odd)
+        return inside
@@ -0,0 +1,69 @@
+import math
+
+from drawable import Drawable
+from drawable_list import Group
+from scene_format import flatten_rows
+
+# copies of whole entries made in bulk: the shapes of every copy go into the store in one pass,
+# with the full coordinates, kinds and colors of the originals, and only the hierarchy is rebuilt
+
+
+# the entries copied once for every (dx, dy) in offsets, as one list of top-level entries per offset;
+# new_group_tag() names the copied groups
+def clone(store, entries, offsets, new_group_tag):
+    rows, tokens, _ = flatten_rows(entries)
+    first = store.copy_rows(rows, offsets)
+
+    copies = []
+    for copy in range(len(offsets)):
+        base = first + copy * len(rows)
+        stack = [([], -1)]
+        for token in tokens:
+            if token >= 0:
+                stack[-1][0].append(Drawable.from_row(store, base + token))
+            else:
+                stack.append(([], -token - 1))
+
+            # close every group whose children are complete
+            while len(stack) > 1 and len(stack[-1][0]) >= stack[-1][1]:
+                children, _ = stack.pop()
+                stack[-1][0].append(Group(children, new_group_tag()))
+        copies.append(stack[0][0])
+    return copies
+
+
+# offsets of copies laid out in rows of columns cells of dx by dy, the original taking the first cell;
+# all in one row when columns is 0
+def grid_offsets(copies, columns, dx, dy):
+    offsets = []
+    for k in range(1, copies + 1):
+        if columns:
+            offsets.append(((k % columns) * dx, (k // columns) * dy))
+        else:
+            offsets.append((k * dx, k * dy))
+    return offsets
+
+
+# offsets of copies spread evenly along a polyline, relative to its first point
+def path_offsets(coords, copies):
+    lengths = [math.hypot(coords[i + 2] - coords[i], coords[i + 3] - coords[i + 1])
+               for i in range(0, len(coords) - 2, 2)]
+    total = sum(lengths)
+    if copies < 1 or not total:
+        return []
+
+    offsets = []
+    segment = 0
+    walked = 0.0
+    for k in range(1, copies + 1):
+        distance = total * k / copies
+        while segment < len(lengths) - 1 and walked + lengths[segment] < distance:
+            walked += lengths[segment]
+            segment += 1
+
+        t = (distance - walked) / lengths[segment] if lengths[segment] else 0.0
+        i = 2 * segment
+        x = coords[i] + (coords[i + 2] - coords[i]) * t
+        y = coords[i + 1] + (coords[i + 3] - coords[i + 1]) * t
+        offsets.append((x - coords[0], y - coords[1]))
+    return offsets
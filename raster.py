@@ -0,0 +1,263 @@
+import base64
+import math
+import queue
+import struct
+import threading
+import zlib
+
+# software rasterizer for baking drawables into a single background image, so Tk only has to
+# keep one image item for them instead of one vector item each, and for exporting scenes without Tk
+
+# the Tk color names the rasterizer knows without asking Tk
+NAMED_COLORS = {
+    'black': '#000000',
+    'white': '#ffffff',
+    'red': '#ff0000',
+    'green': '#00ff00',
+    'blue': '#0000ff',
+    'yellow': '#ffff00',
+    'cyan': '#00ffff',
+    'magenta': '#ff00ff',
+}
+
+
+# 16 bit red, green and blue of a color given as #rgb, #rrggbb, #rrrrggggbbbb, grayN or a basic name,
+# like winfo_rgb but without Tk
+def parse_color(color):
+    color = NAMED_COLORS.get(color.lower(), color)
+    if color.startswith('#') and len(color) in (4, 7, 13):
+        digits = (len(color) - 1) // 3
+        values = [int(color[1 + i * digits:1 + (i + 1) * digits], 16) for i in range(3)]
+        return tuple(value * 0xffff // (16 ** digits - 1) for value in values)
+    if color[:4].lower() in ('gray', 'grey') and color[4:].isdigit():
+        value = round(int(color[4:]) * 255 / 100) * 0x101
+        return value, value, value
+    raise ValueError('unknown color name "' + color + '"')
+
+
+# RGB bytes of a color
+def rgb(color):
+    r, g, b = parse_color(color)
+    return bytes([r >> 8, g >> 8, b >> 8])
+
+
+class Raster:
+    # RGB pixel buffer
+
+    def __init__(self, width, height, background):
+        self.width = width
+        self.height = height
+        self.pixels = bytearray(bytes(background) * (width * height))
+
+    # fill a size x size square centred on (x, y)
+    def stamp(self, x, y, color, size):
+        x0 = max(int(x - size / 2 + 0.5), 0)
+        y0 = max(int(y - size / 2 + 0.5), 0)
+        x1 = min(x0 + size, self.width)
+        y1 = min(y0 + size, self.height)
+        if x0 >= x1 or y0 >= y1:
+            return
+
+        row = color * (x1 - x0)
+        for y in range(y0, y1):
+            start = (y * self.width + x0) * 3
+            self.pixels[start:start + len(row)] = row
+
+    def line(self, x0, y0, x1, y1, color, width):
+        # skip segments that cannot touch the buffer
+        if max(x0, x1) < -width or min(x0, x1) > self.width + width \
+                or max(y0, y1) < -width or min(y0, y1) > self.height + width:
+            return
+
+        steps = max(int(math.hypot(x1 - x0, y1 - y0)), 1)
+        dx = (x1 - x0) / steps
+        dy = (y1 - y0) / steps
+        for i in range(steps + 1):
+            self.stamp(x0 + dx * i, y0 + dy * i, color, width)
+
+    def polyline(self, coords, color, width):
+        if len(coords) == 2:
+            self.stamp(coords[0], coords[1], color, width)
+        for i in range(0, len(coords) - 2, 2):
+            self.line(coords[i], coords[i + 1], coords[i + 2], coords[i + 3], color, width)
+
+    def rectangle(self, coords, color, width):
+        x0, y0, x1, y1 = coords[:4]
+        self.polyline([x0, y0, x1, y0, x1, y1, x0, y1, x0, y0], color, width)
+
+    def oval(self, coords, color, width):
+        x0, y0, x1, y1 = coords[:4]
+        cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
+        rx, ry = abs(x1 - x0) / 2, abs(y1 - y0) / 2
+
+        # one vertex every few pixels of circumference
+        n = max(int(math.pi * (rx + ry) / 4), 8)
+        points = []
+        for i in range(n + 1):
+            angle = 2 * math.pi * i / n
+            points.append(cx + rx * math.cos(angle))
+            points.append(cy + ry * math.sin(angle))
+        self.polyline(points, color, width)
+
+    def draw(self, kind, coords, color, width):
+        if kind == 'rectangle':
+            self.rectangle(coords, color, width)
+        elif kind == 'oval':
+            self.oval(coords, color, width)
+        else:
+            self.polyline(coords, color, width)
+
+    # binary PPM image of the buffer
+    def ppm(self):
+        return b'P6 ' + str(self.width).encode() + b' ' + str(self.height).encode() + b' 255\n' + bytes(self.pixels)
+
+    # PNG image of the buffer, every row unfiltered
+    def png(self):
+        stride = self.width * 3
+        rows = bytearray()
+        for start in range(0, len(self.pixels), stride):
+            rows.append(0)
+            rows += self.pixels[start:start + stride]
+
+        def chunk(name, data):
+            return struct.pack('>I', len(data)) + name + data + struct.pack('>I', zlib.crc32(name + data))
+
+        return (b'\x89PNG\r\n\x1a\n'
+                + chunk(b'IHDR', struct.pack('>IIBBBBB', self.width, self.height, 8, 2, 0, 0, 0))
+                + chunk(b'IDAT', zlib.compress(bytes(rows), 6))
+                + chunk(b'IEND', b''))
+
+
+# PPM image of shapes (kind, world coords, RGB bytes, width) in the world region at the given scale
+def rasterize(region, scale, background, shapes):
+    x0, y0, x1, y1 = region
+    width = max(int((x1 - x0) * scale + 0.5), 1)
+    height = max(int((y1 - y0) * scale + 0.5), 1)
+
+    raster = Raster(width, height, background)
+    for kind, coords, color, size in shapes:
+        raster.draw(kind, [(coord - (x0 if i % 2 == 0 else y0)) * scale for i, coord in enumerate(coords)],
+                    color, size)
+    return raster.ppm()
+
+
+class RasterLayer:
+    # background image on the canvas holding the baked drawables of the area around the view; images
+    # are drawn on a worker thread while Tk keeps handling events, the one shown stays until the next
+    # is ready and a newer request makes the worker skip the older ones
+
+    def __init__(self, canvas, photo_image, root, max_items=2000, tick=20):
+        self.canvas = canvas
+
+        # photo_image(base64 PPM data) -> image object the canvas can show
+        self.photo_image = photo_image
+
+        # widget whose after() looks at the worker, and the milliseconds between looks
+        self.root = root
+        self.tick = tick
+
+        # vector items allowed on the canvas before the oldest ones are baked
+        self.max_items = max_items
+
+        self.item = None
+        self.photo = None
+
+        # color name -> RGB bytes
+        self.__colors = {}
+
+        # number of the newest request, and the world region and world -> screen mapping it is shown with
+        self.__generation = 0
+        self.__region = None
+        self.__to_screen = None
+
+        self.__jobs = queue.Queue()
+        self.__results = queue.Queue()
+        self.__thread = None
+        self.__after = None
+
+    def rgb(self, color):
+        found = self.__colors.get(color)
+        if found is None:
+            r, g, b = self.canvas.winfo_rgb(color)
+            found = self.__colors[color] = bytes([r >> 8, g >> 8, b >> 8])
+        return found
+
+    # draw the drawables onto an image covering the world region at the given scale, to be placed
+    # where to_screen puts the corner of the region once the image is ready
+    def render(self, region, scale, to_screen, drawables):
+        # the store may change under the worker, so it gets copies of the coordinates
+        shapes = [(leaf.tag, leaf.coord_slice, self.rgb(leaf.color), max(int(leaf.width + 0.5), 1)) for leaf in drawables]
+
+        self.__generation += 1
+        self.__region = region
+        self.__to_screen = to_screen
+        self.__jobs.put((self.__generation, region, scale, self.rgb(self.canvas.cget('background')), shapes))
+
+        if self.__thread is None:
+            self.__thread = threading.Thread(target=self.__run, daemon=True)
+            self.__thread.start()
+        if self.__after is None:
+            self.__after = self.root.after(self.tick, self.__poll)
+
+    def __run(self):
+        while True:
+            job = self.__jobs.get()
+            while not self.__jobs.empty():
+                job = self.__jobs.get_nowait()
+            if job is None:
+                return
+
+            generation, region, scale, background, shapes = job
+            self.__results.put((generation, base64.b64encode(rasterize(region, scale, background, shapes))))
+
+    def __poll(self):
+        self.__after = None
+        if not self.__show(block=False):
+            self.__after = self.root.after(self.tick, self.__poll)
+
+    # show the image of the newest request if it is ready, True once nothing is pending
+    def __show(self, block):
+        while True:
+            try:
+                generation, data = self.__results.get(block)
+            except queue.Empty:
+                return False
+            if generation == self.__generation:
+                break
+
+        # the old image is only dropped once the new one is shown
+        self.photo = self.photo_image(data)
+        x, y = self.__to_screen(self.__region[:2])
+        if self.item is None:
+            self.item = self.canvas.create_image(x, y, image=self.photo, anchor='nw', tags='raster')
+            self.canvas.tag_lower(self.item)
+        else:
+            self.canvas.itemconfigure(self.item, image=self.photo)
+            self.canvas.coords(self.item, x, y)
+        return True
+
+    # block until the newest image is shown
+    def wait(self):
+        if self.__after is not None:
+            self.root.after_cancel(self.__after)
+            self.__after = None
+            self.__show(block=True)
+
+    def clear(self):
+        # a render still on its way is dropped too
+        self.__generation += 1
+        if self.__after is not None:
+            self.root.after_cancel(self.__after)
+            self.__after = None
+
+        if self.item is not None:
+            self.canvas.delete(self.item)
+        self.item = None
+        self.photo = None
+
+    # stop the worker, the layer is not used again
+    def close(self):
+        self.clear()
+        if self.__thread is not None:
+            self.__jobs.put(None)
+            self.__thread = None
@@ -0,0 +1,68 @@
+import os
+import queue
+import threading
+
+
+class SceneSaver:
+    # writes a snapshot of the scene on a worker thread while Tk keeps handling events: the file is
+    # written under a temporary name and only replaces the target once it is complete, progress and
+    # the outcome are handed back to the controller between events
+
+    def __init__(self, controller, tick=50):
+        self.controller = controller
+
+        # milliseconds between looks at the worker
+        self.tick = tick
+
+        self.path = None
+        self.__thread = None
+        self.__queue = queue.Queue()
+        self.__after = None
+
+    def start(self, path, snapshot):
+        self.path = path
+        self.__thread = threading.Thread(target=self.__run, args=(snapshot,), daemon=True)
+        self.__thread.start()
+        self.__schedule()
+
+    # block until the file is written, for quitting during a save
+    def wait(self):
+        self.__thread.join()
+        if self.__after is not None:
+            self.controller.gui.get_root().after_cancel(self.__after)
+        self.__poll()
+
+    def __run(self, snapshot):
+        tmp = self.path + '.tmp'
+        error = None
+        try:
+            with open(tmp, 'wb') as f:
+                snapshot.write(f, lambda fraction: self.__queue.put(('progress', fraction)))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+
+        # whatever the writer raises ends the save, an error left uncaught would never report it done
+        except Exception as e:
+            error = e
+        finally:
+            try:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+            except OSError:
+                pass
+            self.__queue.put(('done', error))
+
+    def __schedule(self):
+        self.__after = self.controller.gui.get_root().after(self.tick, self.__poll)
+
+    def __poll(self):
+        self.__after = None
+        while not self.__queue.empty():
+            kind, value = self.__queue.get_nowait()
+            if kind == 'progress':
+                self.controller.save_progress(value)
+            else:
+                self.controller.finish_save(value)
+                return
+        self.__schedule()
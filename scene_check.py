@@ -0,0 +1,250 @@
+import argparse
+import json
+import multiprocessing
+import os
+import pickle
+import sys
+import time
+
+from export import find_jobs
+from geometry import BOXES
+from scene_format import is_leaf_tree, read_tree, write_scene
+
+# validates saved scenes, repairs the problems old versions left behind and converts them,
+# one file per worker process at a time
+#
+#   python scene_check.py archive/                              report what is wrong
+#   python scene_check.py --repair --format sketch archive/     write repaired binary files next to them
+#   python scene_check.py --repair --format pickle --out fixed --report report.json archive/
+#
+# repairs:
+#   split strokes     runs of chained two-point freehand segments, the way strokes used to be saved,
+#                     become one freehand polyline
+#   odd coords        a trailing coordinate without its pair is dropped
+#   extra coords      rectangles and ovals keep their first four coordinates
+#   empty groups      are removed
+# leaves of unknown kinds, with too few or non-numeric coordinates, without a color name or with a width
+# that is not a positive number cannot be repaired and make the file invalid
+
+KINDS = ['freehand', 'line', 'rectangle', 'oval', 'poly']
+
+
+def is_leaf(item):
+    return is_leaf_tree(item)
+
+
+# problems found in a tree as (path, message, repairable), path being the child positions from the root
+def check(tree):
+    problems = []
+    if type(tree) is not list:
+        return [((), 'the scene is not a list', False)]
+
+    stack = [(tree, ())]
+    while stack:
+        item, path = stack.pop()
+        if is_leaf(item):
+            problems.extend((path, message, repairable) for message, repairable in check_leaf(item))
+            continue
+        if type(item) is not list:
+            problems.append((path, 'entry is neither a shape nor a group', False))
+            continue
+        if not item and path:
+            problems.append((path, 'empty group', True))
+        if path and len(split_strokes(item)) < len(item):
+            problems.append((path, 'stroke saved as separate segments', True))
+        stack.extend((child, path + (i,)) for i, child in enumerate(item))
+
+    problems.sort(key=lambda problem: problem[0])
+    return problems
+
+
+def check_leaf(leaf):
+    _, kind, coords, color = leaf[:4]
+    if kind not in KINDS:
+        yield 'unknown kind ' + repr(kind), False
+    if type(color) is not str:
+        yield 'color is not a name', False
+    if len(leaf) == 5 and (type(leaf[4]) not in (int, float) or leaf[4] <= 0):
+        yield 'width is not a positive number', False
+    if type(coords) not in (list, tuple) or not all(type(coord) in (int, float) for coord in coords):
+        yield 'coordinates are not numbers', False
+        return
+
+    if len(coords) < 4:
+        yield str(len(coords)) + ' coordinates', False
+    elif len(coords) % 2:
+        yield 'odd number of coordinates', True
+    elif kind in BOXES and len(coords) > 4:
+        yield str(len(coords)) + ' coordinates for a ' + kind, True
+
+
+# the tree with every repairable problem fixed, leaves are copied; entries at the top level are
+# never joined, they were drawn separately
+def repair(tree):
+    return repair_children(tree)
+
+
+def repair_entry(item):
+    if is_leaf(item):
+        coords = list(item[2])
+        if len(coords) % 2 and len(coords) > 4:
+            coords.pop()
+        if item[1] in BOXES and len(coords) > 4:
+            coords = coords[:4]
+        return item[:2] + [coords] + item[3:]
+
+    children = repair_children(split_strokes(item))
+
+    # a group left with a single stroke becomes that stroke
+    if len(children) == 1 and is_leaf(children[0]):
+        return children[0]
+    return children
+
+
+# repaired children of a group, without the groups that end up empty
+def repair_children(group):
+    children = []
+    for child in group:
+        child = repair_entry(child)
+        if is_leaf(child) or child:
+            children.append(child)
+    return children
+
+
+# children of a group with every run of chained freehand segments joined into one polyline
+def split_strokes(group):
+    children = []
+
+    # whether the last child is a stroke joined here, which further segments extend
+    joining = False
+    for child in group:
+        if segment(child) and children and (joining or segment(children[-1])) \
+                and list(children[-1][2][-2:]) == list(child[2][:2]):
+            if not joining:
+                last = children[-1]
+                children[-1] = [last[0], 'freehand', list(last[2])] + last[3:]
+                joining = True
+            children[-1][2].extend(child[2][2:])
+        else:
+            children.append(child)
+            joining = False
+    return children
+
+
+def segment(item):
+    return is_leaf(item) and item[1] == 'freehand' and type(item[2]) in (list, tuple) and len(item[2]) == 4
+
+
+def count_leaves(tree):
+    count = 0
+    stack = [tree]
+    while stack:
+        item = stack.pop()
+        if is_leaf(item):
+            count += 1
+        elif type(item) is list:
+            stack.extend(item)
+    return count
+
+
+def write_pickle(f, tree):
+    f.write(pickle.dumps(tree))
+
+
+WRITERS = {
+    'sketch': write_scene,
+    'pickle': write_pickle,
+}
+
+
+# check, repair and convert one file in a worker, returns its line of the report
+def process(job):
+    src, dst, fmt, fix = job
+    start = time.perf_counter()
+    result = {'file': src, 'output': None, 'status': 'ok', 'problems': [], 'leaves': 0}
+    try:
+        with open(src, 'rb') as f:
+            tree = read_tree(f)
+
+        problems = check(tree)
+        result['problems'] = [{'at': list(path), 'problem': message, 'repairable': repairable}
+                              for path, message, repairable in problems]
+        fixable = all(repairable for _, _, repairable in problems)
+        if problems and not fixable:
+            result['status'] = 'invalid'
+        elif problems and fix:
+            tree = repair(tree)
+            result['status'] = 'repaired'
+        elif problems:
+            result['status'] = 'needs repair'
+        result['leaves'] = count_leaves(tree)
+
+        # only files that are valid now are converted, through a temporary file so the source
+        # can be the destination
+        if fmt is not None and result['status'] in ('ok', 'repaired'):
+            folder = os.path.dirname(dst)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            with open(dst + '.tmp', 'wb') as f:
+                WRITERS[fmt](f, tree)
+            os.replace(dst + '.tmp', dst)
+            result['output'] = dst
+    except Exception as e:
+        result['status'] = 'failed'
+        result['problems'] = [{'at': [], 'problem': type(e).__name__ + ': ' + str(e), 'repairable': False}]
+
+    result['seconds'] = round(time.perf_counter() - start, 4)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='validate, repair and convert saved scenes')
+    parser.add_argument('paths', nargs='+', help='scene files or directories to search')
+    parser.add_argument('--repair', action='store_true', help='fix the problems that can be fixed')
+    parser.add_argument('--format', choices=list(WRITERS), help='convert the valid files to this format')
+    parser.add_argument('--out', help='output directory, next to each scene file by default')
+    parser.add_argument('--report', help='write the per-file results and totals to this JSON file')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(), help='worker processes')
+    args = parser.parse_args()
+
+    jobs = ((src, dst, args.format, args.repair) for src, dst in find_jobs(args.paths, args.out, args.format or ''))
+    results = []
+    totals = {}
+    leaves = 0
+    start = time.perf_counter()
+
+    with multiprocessing.Pool(args.jobs) as pool:
+        for result in pool.imap_unordered(process, jobs, chunksize=4):
+            results.append(result)
+            totals[result['status']] = totals.get(result['status'], 0) + 1
+            leaves += result['leaves']
+
+            line = result['file'] + ': ' + result['status']
+            if result['output']:
+                line += ' -> ' + result['output']
+            print(line)
+            for problem in result['problems']:
+                print('    at', problem['at'], problem['problem'])
+
+    elapsed = time.perf_counter() - start
+    summary = {'files': len(results),
+               'statuses': totals,
+               'leaves': leaves,
+               'seconds': round(elapsed, 3),
+               'files_per_second': round(len(results) / elapsed, 1) if elapsed else 0.0,
+               'leaves_per_second': round(leaves / elapsed, 1) if elapsed else 0.0}
+
+    print('%d files (%s), %d shapes in %.2f s, %.1f files/s, %.0f shapes/s'
+          % (len(results), ', '.join('%d %s' % (n, status) for status, n in sorted(totals.items())), leaves,
+             elapsed, summary['files_per_second'], summary['leaves_per_second']))
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump({'summary': summary, 'files': sorted(results, key=lambda result: result['file'])}, f, indent=2)
+            f.write('\n')
+
+    return 1 if totals.get('invalid') or totals.get('failed') else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
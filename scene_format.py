@@ -0,0 +1,449 @@
+import io
+import mmap
+import pickle
+import struct
+import sys
+from array import array
+
+from drawable import Drawable
+from scene_store import DEFAULT_WIDTH
+
+# binary scene file layout, all values little-endian:
+#
+#   header   magic, version, section count, leaf count, group count, bounding box
+#   table    one (name, offset, length) record per section
+#   sections each starts on an 8 byte boundary so the typed arrays can be mapped in place
+#
+# sections:
+#   STRS  kind names and color names, length-prefixed utf-8
+#   STYL  (u16 kind index, u16 color index, f32 line width) per style
+#   STID  u16 style index per leaf
+#   OFFS  u64 start of each leaf in CORD, plus the total length
+#   CORD  f64 coordinates of all leaves
+#   TREE  i32 hierarchy tokens in pre-order, a leaf index >= 0 or -(n + 1) for a group of n children
+#
+# version 1 files have no styles but a u8 kind index (KIND) and a u16 color index (COLR) per leaf,
+# their drawables get the default width
+
+MAGIC = b'SKPD'
+VERSION = 2
+
+HEADER = struct.Struct('<4sHHIIdddd')
+SECTION = struct.Struct('<4sQQ')
+STYLE = struct.Struct('<HHf')
+
+SECTION_NAMES = [b'STRS', b'STYL', b'STID', b'OFFS', b'CORD', b'TREE']
+
+
+# leaf of the nested list format: [ident, kind, coords, color] or [ident, kind, coords, color, width]
+def is_leaf_tree(item):
+    return type(item) is list and 4 <= len(item) <= 5 and type(item[1]) is str
+
+
+# kind, coords, color and width of a leaf, or None for a group
+def leaf_fields(item):
+    if isinstance(item, Drawable):
+        return item.tag, item.coords, item.color, item.width
+
+    if is_leaf_tree(item):
+        return item[1], item[2], item[3], item[4] if len(item) == 5 else DEFAULT_WIDTH
+
+    return None
+
+
+# leaf as nested lists, the width is only added when it is not the default so that the leaves keep
+# the layout the legacy pickle files used
+def leaf_tree(ident, kind, coords, color, width):
+    if width == DEFAULT_WIDTH:
+        return [ident, kind, coords, color]
+    return [ident, kind, coords, color, width]
+
+
+# entry as nested lists in the legacy format
+def to_tree(item):
+    fields = leaf_fields(item)
+    if fields is None:
+        return [to_tree(i) for i in item]
+
+    kind, coords, color, width = fields
+    return leaf_tree(0, kind, list(coords), color, width)
+
+
+def little_endian(values):
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def pack_strings(names):
+    out = [struct.pack('<H', len(names))]
+    for name in names:
+        data = name.encode('utf-8')
+        out.append(struct.pack('<H', len(data)))
+        out.append(data)
+    return b''.join(out)
+
+
+def write_scene(f, entries):
+    styles = array('H')
+    offsets = array('Q', [0])
+    coords = array('d')
+    tokens = array('i')
+    style_table, style_lookup = [], {}
+
+    # flatten the hierarchy in pre-order, iteratively so deep nesting is fine
+    stack = [iter(entries)]
+    while stack:
+        item = next(stack[-1], None)
+        if item is None:
+            stack.pop()
+            continue
+
+        fields = leaf_fields(item)
+        if fields is None:
+            tokens.append(-(len(item) + 1))
+            stack.append(iter(item))
+            continue
+
+        kind, leaf_coords, color, width = fields
+        style = (kind, color, width)
+        if style not in style_lookup:
+            style_lookup[style] = len(style_table)
+            style_table.append(style)
+
+        tokens.append(len(styles))
+        styles.append(style_lookup[style])
+        coords.extend(leaf_coords)
+        offsets.append(len(coords))
+
+    write_sections(f, style_table, styles, offsets, coords, tokens)
+
+
+# write a scene file from its style table and its other sections as typed arrays
+def write_sections(f, style_table, styles, offsets, coords, tokens):
+    if coords:
+        bbox = (min(coords[0::2]), min(coords[1::2]), max(coords[0::2]), max(coords[1::2]))
+    else:
+        bbox = (0.0, 0.0, 0.0, 0.0)
+    group_count = len(tokens) - len(styles)
+
+    # every style once, with its kind and color names stored once too
+    kind_names, kind_lookup = [], {}
+    color_names, color_lookup = [], {}
+    records = []
+    for kind, color, width in style_table:
+        if kind not in kind_lookup:
+            kind_lookup[kind] = len(kind_names)
+            kind_names.append(kind)
+        if color not in color_lookup:
+            color_lookup[color] = len(color_names)
+            color_names.append(color)
+        records.append(STYLE.pack(kind_lookup[kind], color_lookup[color], width))
+
+    sections = [
+        pack_strings(kind_names) + pack_strings(color_names),
+        b''.join(records),
+        little_endian(styles),
+        little_endian(offsets),
+        little_endian(coords),
+        little_endian(tokens),
+    ]
+
+    # lay the sections out after the header and the section table, 8 byte aligned
+    position = HEADER.size + SECTION.size * len(sections)
+    table = []
+    for name, data in zip(SECTION_NAMES, sections):
+        position += -position % 8
+        table.append(SECTION.pack(name, position, len(data)))
+        position += len(data)
+
+    f.write(HEADER.pack(MAGIC, VERSION, len(sections), len(styles), group_count, *bbox))
+    f.write(b''.join(table))
+    position = HEADER.size + SECTION.size * len(sections)
+    for data in sections:
+        padding = -position % 8
+        f.write(b'\0' * padding)
+        f.write(data)
+        position += padding + len(data)
+
+
+# store rows of the drawables of entries in pre-order, the hierarchy as TREE tokens and the store
+# they live in, None without drawables
+def flatten_rows(entries):
+    rows = []
+    tokens = []
+    store = None
+    stack = [iter(entries)]
+    while stack:
+        item = next(stack[-1], None)
+        if item is None:
+            stack.pop()
+        elif isinstance(item, Drawable):
+            tokens.append(len(rows))
+            rows.append(item.row)
+            store = item.store
+        else:
+            tokens.append(-(len(item) + 1))
+            stack.append(iter(item))
+    return rows, tokens, store
+
+
+class SceneSnapshot:
+    # the scene model copied on the main thread: the hierarchy as store rows and copies of the store
+    # columns, which take a few memory copies, so the file can be written by another thread while
+    # the scene keeps changing
+
+    def __init__(self, entries):
+        self.rows, tokens, store = flatten_rows(entries)
+        self.tokens = array('i', tokens)
+
+        if store is None:
+            self.style_table = []
+            self.styles = self.offsets = self.lengths = self.coords = ()
+            return
+
+        self.style_table = list(store.style_table)
+        self.styles = store.styles[:]
+        self.offsets = store.offsets[:]
+        self.lengths = store.lengths[:]
+        self.coords = store.coords[:]
+
+    # approximate size of the file in bytes, the store may hold some coordinates no row owns
+    def nbytes(self):
+        return 8 * len(self.coords) + 16 * len(self.rows) + 4 * len(self.tokens)
+
+    # write the scene file, progress(fraction) is called as the coordinates are gathered
+    def write(self, f, progress=None):
+        styles = array('H', [self.styles[row] for row in self.rows])
+        offsets = array('Q', [0])
+        coords = array('d')
+        for i, row in enumerate(self.rows):
+            offset = self.offsets[row]
+            coords.extend(self.coords[offset:offset + self.lengths[row]])
+            offsets.append(len(coords))
+            if progress is not None and i % 8192 == 8191:
+                progress(i / len(self.rows))
+
+        write_sections(f, self.style_table, styles, offsets, coords, self.tokens)
+
+
+class SceneFile:
+    # read access to a binary scene file, sections are only decoded when asked for
+
+    def __init__(self, f):
+        # map the file when possible so the coordinates are never copied up front
+        try:
+            self.__buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+            self.__buffer = f.read()
+        self.__view = memoryview(self.__buffer)
+
+        if len(self.__view) < HEADER.size:
+            raise ValueError('not a scene file')
+
+        magic, self.version, count, self.leaf_count, self.group_count, *bbox = HEADER.unpack_from(self.__view)
+        if magic != MAGIC:
+            raise ValueError('not a scene file')
+        if self.version > VERSION:
+            raise ValueError('unsupported scene file version ' + str(self.version))
+        self.bbox = tuple(bbox)
+
+        self.__sections = {}
+        for i in range(count):
+            name, offset, length = SECTION.unpack_from(self.__view, HEADER.size + i * SECTION.size)
+            if offset + length > len(self.__view):
+                raise ValueError('truncated scene file')
+            self.__sections[name] = (offset, length)
+
+        self.__styles = None
+        self.__style_table = None
+        self.__offsets = None
+        self.__coords = None
+        self.__kind_names = None
+        self.__color_names = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def close(self):
+        self.__styles = self.__offsets = self.__coords = None
+
+        # arrays handed out by typed() keep the buffer alive until they are dropped
+        try:
+            self.__view.release()
+            if isinstance(self.__buffer, mmap.mmap):
+                self.__buffer.close()
+        except BufferError:
+            pass
+
+    def section(self, name):
+        offset, length = self.__sections[name]
+        return self.__view[offset:offset + length]
+
+    def typed(self, name, typecode):
+        data = self.section(name)
+
+        # on little-endian machines the mapped bytes are used as they are
+        if sys.byteorder == 'little':
+            return data.cast(typecode)
+
+        values = array(typecode, data.tobytes())
+        values.byteswap()
+        return values
+
+    def __load_strings(self):
+        data = self.section(b'STRS')
+        position = 0
+        tables = []
+        for _ in range(2):
+            count, = struct.unpack_from('<H', data, position)
+            position += 2
+            names = []
+            for _ in range(count):
+                length, = struct.unpack_from('<H', data, position)
+                position += 2
+                names.append(bytes(data[position:position + length]).decode('utf-8'))
+                position += length
+            tables.append(names)
+        self.__kind_names, self.__color_names = tables
+
+    def kind_names(self):
+        if self.__kind_names is None:
+            self.__load_strings()
+        return self.__kind_names
+
+    def color_names(self):
+        if self.__color_names is None:
+            self.__load_strings()
+        return self.__color_names
+
+    # (kind, color, width) of every style
+    def style_table(self):
+        if self.__style_table is None:
+            self.__load_styles()
+        return self.__style_table
+
+    # style index of every leaf
+    def styles(self):
+        if self.__styles is None:
+            self.__load_styles()
+        return self.__styles
+
+    def __load_styles(self):
+        kind_names = self.kind_names()
+        color_names = self.color_names()
+        if self.version >= 2:
+            self.__style_table = [(kind_names[kind], color_names[color], width)
+                                  for kind, color, width in STYLE.iter_unpack(self.section(b'STYL'))]
+            self.__styles = self.typed(b'STID', 'H')
+            return
+
+        # a style for every kind and color pair in use
+        lookup = {}
+        styles = array('H')
+        for pair in zip(self.typed(b'KIND', 'B'), self.typed(b'COLR', 'H')):
+            style = lookup.get(pair)
+            if style is None:
+                style = lookup[pair] = len(lookup)
+            styles.append(style)
+        self.__style_table = [(kind_names[kind], color_names[color], DEFAULT_WIDTH) for kind, color in lookup]
+        self.__styles = styles
+
+    def coords(self):
+        if self.__coords is None:
+            self.__coords = self.typed(b'CORD', 'd')
+        return self.__coords
+
+    def offsets(self):
+        if self.__offsets is None:
+            self.__offsets = self.typed(b'OFFS', 'Q')
+        return self.__offsets
+
+    def tokens(self):
+        return self.typed(b'TREE', 'i')
+
+    # copy every leaf into a SceneStore in bulk, leaf i ends up in row first + i
+    def load_into(self, store):
+        return store.extend(self.styles(), self.offsets(), self.coords(), self.style_table())
+
+    # kind, coordinate list, color and width of leaf i
+    def leaf(self, i):
+        kind, color, width = self.style_table()[self.styles()[i]]
+        offsets = self.offsets()
+        return kind, self.coords()[offsets[i]:offsets[i + 1]].tolist(), color, width
+
+    # rebuild the hierarchy bottom-up: make_leaf(index, kind, coords, color, width) for every leaf and
+    # make_group(children) once all children of a group are built
+    def build(self, make_leaf, make_group):
+        styles = self.styles()
+        style_table = self.style_table()
+        offsets = self.offsets()
+        coords = self.coords()
+
+        root = []
+        stack = [(root, -1)]
+        for token in self.tokens():
+            if token >= 0:
+                kind, color, width = style_table[styles[token]]
+                stack[-1][0].append(make_leaf(token, kind, coords[offsets[token]:offsets[token + 1]].tolist(),
+                                              color, width))
+            else:
+                stack.append(([], -token - 1))
+
+            # close every group whose children are complete
+            while len(stack) > 1 and len(stack[-1][0]) >= stack[-1][1]:
+                children, _ = stack.pop()
+                stack[-1][0].append(make_group(children))
+        return root
+
+    # whole scene as nested lists in the legacy format, leaf idents are the leaf indices
+    def tree(self):
+        return self.build(leaf_tree, lambda children: children)
+
+
+# only plain lists, numbers and strings may come out of an old pickle file
+class LegacyUnpickler(pickle.Unpickler):
+    def find_class(self, module, name):
+        raise pickle.UnpicklingError('refusing to load ' + module + '.' + name + ' from a scene file')
+
+
+def load_legacy(f):
+    return LegacyUnpickler(f).load()
+
+
+def is_scene_file(f):
+    position = f.tell()
+    magic = f.read(len(MAGIC))
+    f.seek(position)
+    return magic == MAGIC
+
+
+# nested list form of any supported file, binary or legacy pickle
+def read_tree(f):
+    if is_scene_file(f):
+        with SceneFile(f) as scene:
+            return scene.tree()
+    return load_legacy(f)
+
+
+def migrate(src, dst):
+    with open(src, 'rb') as f:
+        tree = load_legacy(f)
+    with open(dst, 'wb') as f:
+        write_scene(f, tree)
+
+
+def main():
+    # convert legacy .pickle files to the binary format next to them
+    for src in sys.argv[1:]:
+        dst = src[:-len('.pickle')] + '.sketch' if src.endswith('.pickle') else src + '.sketch'
+        migrate(src, dst)
+        print(src, '->', dst)
+
+
+if __name__ == '__main__':
+    main()
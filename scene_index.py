@@ -0,0 +1,351 @@
+import math
+
+from drawable import Drawable
+from geometry import bounding_box, outline_distance
+from packed_geometry import PackedCoords
+
+
+class SceneIndex:
+    # uniform grid over the bounding boxes of all drawables, plus a parent pointer for every node
+    # of the hierarchy so the top-level entry owning a drawable is found without searching
+
+    def __init__(self, cell_size=64):
+        self.cell_size = cell_size
+
+        # grid cell (column, row) -> set of idents whose box touches the cell
+        self.__cells = {}
+
+        # ident -> bounding box and drawable
+        self.__boxes = {}
+        self.__leaves = {}
+
+        # node key -> group the node is a direct child of, None for top-level entries; grouping and
+        # ungrouping only touch the pointers of the direct children
+        self.__parents = {}
+
+        # id of top-level entry -> position in the drawables list, only trusted below self.__valid;
+        # the rest is recomputed lazily when looked up
+        self.__positions = {}
+        self.__valid = 0
+
+        # entries that moved since they were last boxed, re-indexed on the next query
+        self.__dirty = {}
+
+    def __len__(self):
+        return len(self.__leaves)
+
+    def __cell_range(self, x0, y0, x1, y1):
+        size = self.cell_size
+        for col in range(math.floor(x0 / size), math.floor(x1 / size) + 1):
+            for row in range(math.floor(y0 / size), math.floor(y1 / size) + 1):
+                yield col, row
+
+    def __insert(self, leaf, box):
+        self.__boxes[leaf.ident] = box
+        self.__leaves[leaf.ident] = leaf
+        for cell in self.__cell_range(*box):
+            self.__cells.setdefault(cell, set()).add(leaf.ident)
+
+    # index drawables with their boxes computed in one pass over all their coordinates
+    def __insert_all(self, drawables):
+        if len(drawables) == 1:
+            self.__insert(drawables[0], bounding_box(drawables[0].coords))
+        elif drawables:
+            boxes = PackedCoords(drawables[0].store, [leaf.row for leaf in drawables]).boxes()
+            for leaf, box in zip(drawables, boxes):
+                self.__insert(leaf, box)
+
+    def __discard(self, ident):
+        box = self.__boxes.pop(ident, None)
+        if box is None:
+            return
+        del self.__leaves[ident]
+        for cell in self.__cell_range(*box):
+            bucket = self.__cells.get(cell)
+            if bucket is not None:
+                bucket.discard(ident)
+                if not bucket:
+                    del self.__cells[cell]
+
+    # index a new top-level entry
+    def add(self, entry):
+        self.__insert_all(list(leaves(entry)))
+        self.__link(entry, None)
+
+    def __link(self, entry, parent):
+        stack = [(entry, parent)]
+        while stack:
+            node, parent = stack.pop()
+            self.__parents[node_key(node)] = parent
+            if not isinstance(node, Drawable):
+                stack.extend((child, node) for child in node)
+
+    # drop a top-level entry
+    def remove(self, entry):
+        self.__dirty.pop(id(entry), None)
+        self.__positions.pop(id(entry), None)
+        for leaf in leaves(entry):
+            self.__discard(leaf.ident)
+
+        stack = [entry]
+        while stack:
+            node = stack.pop()
+            self.__parents.pop(node_key(node), None)
+            if not isinstance(node, Drawable):
+                stack.extend(node)
+
+    # swap a top-level entry for one sharing drawables and group tags with it, only the drawables that
+    # are not shared are indexed again and only the children of new groups are linked again
+    def replace(self, old, new):
+        if self.__dirty:
+            self.__flush()
+        self.__positions.pop(id(old), None)
+
+        # a new drawable or group may take over the ident or tag of one it replaces, so the old ones go first
+        old_nodes = {id(node): node for node in nodes(old)}
+        new_nodes = {id(node): node for node in nodes(new)}
+        for key, node in old_nodes.items():
+            if key not in new_nodes:
+                if isinstance(node, Drawable):
+                    self.__discard(node.ident)
+                self.__parents.pop(node_key(node), None)
+
+        added = [node for key, node in new_nodes.items() if key not in old_nodes]
+        self.__insert_all([node for node in added if isinstance(node, Drawable)])
+        self.__parents[node_key(new)] = None
+        for node in added:
+            if not isinstance(node, Drawable):
+                for child in node:
+                    self.__parents[node_key(child)] = node
+
+    # make an entry top-level again, its direct children point at it (group, ungroup)
+    def reassign(self, entry):
+        self.__parents[node_key(entry)] = None
+        if not isinstance(entry, Drawable):
+            for child in entry:
+                self.__parents[node_key(child)] = entry
+
+    # an entry left the top level but stays indexed, it is about to be reassigned
+    def detach(self, entry):
+        self.__positions.pop(id(entry), None)
+
+    # entries from this position on have moved in the drawables list
+    def shifted(self, position):
+        self.__valid = min(self.__valid, position)
+
+    # mark an entry whose coordinates changed, it is re-boxed before the next query
+    def update(self, entry):
+        self.__dirty[id(entry)] = entry
+
+    def __flush(self):
+        moved = []
+        for entry in self.__dirty.values():
+            for leaf in leaves(entry):
+                # a moved entry may have been removed since as part of a group
+                if leaf.ident in self.__leaves:
+                    self.__discard(leaf.ident)
+                    moved.append(leaf)
+        self.__insert_all(moved)
+        self.__dirty = {}
+
+    def clear(self):
+        self.__cells = {}
+        self.__boxes = {}
+        self.__leaves = {}
+        self.__parents = {}
+        self.__positions = {}
+        self.__valid = 0
+        self.__dirty = {}
+
+    def rebuild(self, entries):
+        self.clear()
+        self.__insert_all([leaf for entry in entries for leaf in leaves(entry)])
+        for entry in entries:
+            self.__link(entry, None)
+
+    # forget every cached position (entries indexed out of order while loading)
+    def invalidate(self):
+        self.__valid = 0
+
+    # top-level entry owning a drawable, found by following the parent pointers up
+    def owner(self, ident):
+        node = self.__leaves.get(ident)
+        if node is None:
+            return None
+
+        parent = self.__parents.get(ident)
+        while parent is not None:
+            node = parent
+            parent = self.__parents.get(node.group_tag)
+        return node
+
+    # tags of the groups a drawable is nested in, outermost first
+    def group_tags(self, ident):
+        tags = []
+        parent = self.__parents.get(ident)
+        while parent is not None:
+            tags.append(parent.group_tag)
+            parent = self.__parents.get(parent.group_tag)
+        tags.reverse()
+        return tuple(tags)
+
+    def leaf(self, ident):
+        return self.__leaves.get(ident)
+
+    def box(self, ident):
+        if self.__dirty:
+            self.__flush()
+        return self.__boxes.get(ident)
+
+    # idents of every drawable whose bounding box meets the rectangle
+    def query(self, x0, y0, x1, y1):
+        if self.__dirty:
+            self.__flush()
+
+        size = self.cell_size
+        columns = math.floor(x1 / size) - math.floor(x0 / size) + 1
+        rows = math.floor(y1 / size) - math.floor(y0 / size) + 1
+
+        # a rectangle spanning more cells than are occupied is cheaper to answer from the occupied ones
+        if columns * rows > len(self.__cells):
+            c0, r0 = math.floor(x0 / size), math.floor(y0 / size)
+            c1, r1 = c0 + columns - 1, r0 + rows - 1
+            buckets = [bucket for (col, row), bucket in self.__cells.items() if c0 <= col <= c1 and r0 <= row <= r1]
+        else:
+            buckets = [self.__cells[cell] for cell in self.__cell_range(x0, y0, x1, y1) if cell in self.__cells]
+
+        found = set()
+        for bucket in buckets:
+            found.update(bucket)
+
+        boxes = self.__boxes
+        return [ident for ident in found
+                if boxes[ident][0] <= x1 and boxes[ident][2] >= x0 and boxes[ident][1] <= y1 and boxes[ident][3] >= y0]
+
+    # idents of every drawable whose bounding box lies entirely inside the rectangle
+    def inside(self, x0, y0, x1, y1):
+        boxes = self.__boxes
+        return [ident for ident in self.query(x0, y0, x1, y1)
+                if boxes[ident][0] >= x0 and boxes[ident][2] <= x1 and boxes[ident][1] >= y0 and boxes[ident][3] <= y1]
+
+    # top-level position of the entry owning a drawable, -1 if it is not indexed
+    def position(self, ident, entries):
+        owner = self.owner(ident)
+        if owner is None:
+            return -1
+
+        found = self.__positions.get(id(owner))
+        if found is not None and found < self.__valid and entries[found] is owner:
+            return found
+
+        # only the positions after the first change are recomputed
+        for i in range(self.__valid, len(entries)):
+            self.__positions[id(entries[i])] = i
+        self.__valid = len(entries)
+        return self.__positions.get(id(owner), -1)
+
+    # ident of the topmost drawable whose outline passes within tolerance of (x, y)
+    def hit(self, x, y, tolerance):
+        if self.__dirty:
+            self.__flush()
+
+        candidates = set()
+        for cell in self.__cell_range(x - tolerance, y - tolerance, x + tolerance, y + tolerance):
+            bucket = self.__cells.get(cell)
+            if bucket:
+                candidates.update(bucket)
+
+        # drawables with later idents are drawn on top of earlier ones
+        for ident in sorted(candidates, reverse=True):
+            x0, y0, x1, y1 = self.__boxes[ident]
+            if x < x0 - tolerance or x > x1 + tolerance or y < y0 - tolerance or y > y1 + tolerance:
+                continue
+            leaf = self.__leaves[ident]
+            if outline_distance(x, y, leaf.tag, leaf.coords) <= tolerance:
+                return ident
+        return None
+
+
+class SegmentIndex:
+    # uniform grid over the single segments of polylines, for finding what lies under a small brush in
+    # long and dense strokes; drawables are added one at a time when they are first needed
+
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+
+        # grid cell (column, row) -> list of (ident, segment) whose box touches the cell
+        self.__cells = {}
+
+        # ident -> flat coordinates the segments of a drawable were indexed from
+        self.coords = {}
+
+    def __contains__(self, ident):
+        return ident in self.coords
+
+    # index the segments of a drawable, segment k joins point k to point k + 1
+    def add(self, ident, coords):
+        self.coords[ident] = coords
+        size = self.cell_size
+        cells = self.__cells
+
+        # cell of every point first, most segments then start and end in the same cell
+        columns = [math.floor(x / size) for x in coords[0::2]]
+        rows = [math.floor(y / size) for y in coords[1::2]]
+        for k in range(len(columns) - 1):
+            c0, c1 = columns[k], columns[k + 1]
+            r0, r1 = rows[k], rows[k + 1]
+            if c0 == c1 and r0 == r1:
+                cell = (c0, r0)
+                bucket = cells.get(cell)
+                if bucket is None:
+                    bucket = cells[cell] = []
+                bucket.append((ident, k))
+                continue
+
+            for col in range(min(c0, c1), max(c0, c1) + 1):
+                for row in range(min(r0, r1), max(r0, r1) + 1):
+                    bucket = cells.get((col, row))
+                    if bucket is None:
+                        bucket = cells[(col, row)] = []
+                    bucket.append((ident, k))
+
+    # (ident, segment) of every segment whose box may meet the square of half side radius around (x, y)
+    def near(self, x, y, radius):
+        size = self.cell_size
+        found = set()
+        for col in range(math.floor((x - radius) / size), math.floor((x + radius) / size) + 1):
+            for row in range(math.floor((y - radius) / size), math.floor((y + radius) / size) + 1):
+                bucket = self.__cells.get((col, row))
+                if bucket:
+                    found.update(bucket)
+        return found
+
+
+# iterate over every drawable in a (possibly nested) entry
+def leaves(entry):
+    if isinstance(entry, Drawable):
+        yield entry
+        return
+
+    stack = [entry]
+    while stack:
+        for i in stack.pop():
+            if isinstance(i, Drawable):
+                yield i
+            elif isinstance(i, list):
+                stack.append(i)
+
+
+# iterate over every drawable and group of an entry, the entry included
+def nodes(entry):
+    stack = [entry]
+    while stack:
+        node = stack.pop()
+        yield node
+        if not isinstance(node, Drawable):
+            stack.extend(node)
+
+
+# stable key of a node of the hierarchy: the ident of a drawable or the canvas tag of a group
+def node_key(node):
+    return node.ident if isinstance(node, Drawable) else node.group_tag
@@ -0,0 +1,207 @@
+from array import array
+
+# line width of drawables that were saved without one
+DEFAULT_WIDTH = 3
+
+
+class SceneStore:
+    # columnar storage for every drawn shape: one row per shape in typed arrays,
+    # with the coordinates of all shapes packed into a single flat buffer
+
+    def __init__(self):
+        # last ident handed out, idents are never reused so they also give the drawing order
+        self.last_ident = 0
+
+        self.clear()
+
+    def clear(self):
+        # per-row columns
+        self.idents = array('q')
+        self.styles = array('H')
+        self.offsets = array('Q')
+        self.lengths = array('I')
+
+        # coordinates of all rows, row i owns coords[offsets[i]:offsets[i] + lengths[i]]
+        self.coords = array('d')
+
+        # (kind, color, width) styles, referred to by index from the styles column; new shapes share a
+        # style with equal values, except a style that was restyled, which keeps only the shapes it had
+        self.style_table = []
+        self.__style_lookup = {}
+
+        # rows released by deleted shapes, reused by new ones
+        self.__free = []
+
+        # number of values in the coordinate buffer no longer owned by any row
+        self.garbage = 0
+
+    def __len__(self):
+        return len(self.idents) - len(self.__free)
+
+    def new_ident(self):
+        self.last_ident += 1
+        return self.last_ident
+
+    # widths are kept as floats, the canvas hands them back that way and 3 and 3.0 must be one style
+    def style_index(self, kind, color, width=DEFAULT_WIDTH):
+        style = (kind, color, float(width))
+        idx = self.__style_lookup.get(style)
+        if idx is None:
+            idx = len(self.style_table)
+            self.style_table.append(style)
+            self.__style_lookup[style] = idx
+        return idx
+
+    # indices of every style with these values, several once restyling made two styles alike
+    def find_styles(self, kind, color, width):
+        style = (kind, color, float(width))
+        return [idx for idx, existing in enumerate(self.style_table) if existing == style]
+
+    # change the color and width of a style, and so of every row that refers to it; the style is no
+    # longer handed out by value afterwards, so undoing the change only reaches the rows it had
+    def restyle(self, idx, color, width):
+        old = self.style_table[idx]
+        if self.__style_lookup.get(old) == idx:
+            del self.__style_lookup[old]
+
+        self.style_table[idx] = (old[0], color, float(width))
+
+    # give a row the style of another kind with the same color and width
+    def set_kind(self, row, kind):
+        _, color, width = self.style_table[self.styles[row]]
+        self.styles[row] = self.style_index(kind, color, width)
+
+    # add a shape and return its row
+    def add(self, ident, kind, coords, color, width=DEFAULT_WIDTH):
+        style = self.style_index(kind, color, width)
+        offset = len(self.coords)
+        self.coords.extend(coords)
+
+        if self.__free:
+            row = self.__free.pop()
+            self.idents[row] = ident
+            self.styles[row] = style
+            self.offsets[row] = offset
+            self.lengths[row] = len(coords)
+            return row
+
+        self.idents.append(ident)
+        self.styles.append(style)
+        self.offsets.append(offset)
+        self.lengths.append(len(coords))
+        return len(self.idents) - 1
+
+    # append rows straight from typed arrays, styles index into the given list of (kind, color, width);
+    # returns the first new row, the rows get consecutive new idents
+    def extend(self, styles, offsets, coords, style_table):
+        first = len(self.idents)
+        count = len(styles)
+        base = len(self.coords)
+
+        style_map = [self.style_index(*style) for style in style_table]
+
+        self.idents.extend(range(self.last_ident + 1, self.last_ident + count + 1))
+        self.last_ident += count
+        self.styles.extend([style_map[style] for style in styles])
+        self.offsets.extend([base + offsets[i] for i in range(count)])
+        self.lengths.extend([offsets[i + 1] - offsets[i] for i in range(count)])
+        self.coords.frombytes(memoryview(coords).cast('B'))
+        return first
+
+    # append a translated copy of the rows for every (dx, dy) in offsets with their full coordinates and
+    # styles; returns the first new row, the copies follow each other in the order of rows and get
+    # consecutive new idents
+    def copy_rows(self, rows, offsets):
+        first = len(self.idents)
+        count = len(rows) * len(offsets)
+
+        source = array('d')
+        starts = []
+        for row in rows:
+            starts.append(len(source))
+            offset = self.offsets[row]
+            source.extend(self.coords[offset:offset + self.lengths[row]])
+        styles = array('H', [self.styles[row] for row in rows])
+        lengths = array('I', [self.lengths[row] for row in rows])
+
+        self.idents.extend(range(self.last_ident + 1, self.last_ident + count + 1))
+        self.last_ident += count
+
+        # every shape has whole points, so x and y alternate through the whole block
+        xs = source[0::2]
+        ys = source[1::2]
+        block = array('d', source)
+        for dx, dy in offsets:
+            base = len(self.coords)
+            block[0::2] = array('d', [x + dx for x in xs])
+            block[1::2] = array('d', [y + dy for y in ys])
+            self.coords.extend(block)
+            self.offsets.extend([base + start for start in starts])
+            self.styles.extend(styles)
+            self.lengths.extend(lengths)
+        return first
+
+    # free a row once no drawable refers to it any more
+    def release(self, row):
+        self.garbage += self.lengths[row]
+        self.lengths[row] = 0
+        self.idents[row] = 0
+        self.__free.append(row)
+
+        # start over once the last shape is gone instead of compacting an empty buffer
+        if len(self.__free) == len(self.idents):
+            self.clear()
+            return
+
+        self.__maybe_compact()
+
+    def get_coords(self, row):
+        offset = self.offsets[row]
+        return self.coords[offset:offset + self.lengths[row]].tolist()
+
+    # the coordinates of a row as a copied slice of the buffer, without a float object per value
+    def coord_slice(self, row):
+        offset = self.offsets[row]
+        return self.coords[offset:offset + self.lengths[row]]
+
+    def set_coords(self, row, coords):
+        offset = self.offsets[row]
+        length = self.lengths[row]
+
+        # overwrite in place when the number of points is unchanged
+        if len(coords) == length:
+            self.coords[offset:offset + length] = array('d', coords)
+            return
+
+        self.garbage += length
+        self.offsets[row] = len(self.coords)
+        self.lengths[row] = len(coords)
+        self.coords.extend(coords)
+        self.__maybe_compact()
+
+    def translate(self, row, dx, dy):
+        coords = self.coords
+        start = self.offsets[row]
+        end = start + self.lengths[row]
+        coords[start:end:2] = array('d', [x + dx for x in coords[start:end:2]])
+        coords[start + 1:end:2] = array('d', [y + dy for y in coords[start + 1:end:2]])
+
+    def __maybe_compact(self):
+        if self.garbage > 4096 and self.garbage * 2 > len(self.coords):
+            self.compact()
+
+    # repack the coordinate buffer so it only holds values of live rows
+    def compact(self):
+        packed = array('d')
+        for row in range(len(self.idents)):
+            offset = self.offsets[row]
+            length = self.lengths[row]
+            self.offsets[row] = len(packed)
+            packed.extend(self.coords[offset:offset + length])
+        self.coords = packed
+        self.garbage = 0
+
+    # approximate memory held by the columns in bytes
+    def nbytes(self):
+        columns = [self.idents, self.styles, self.offsets, self.lengths, self.coords]
+        return sum(column.buffer_info()[1] * column.itemsize for column in columns)
@@ -0,0 +1,62 @@
+import itertools
+import unittest
+
+from collab import Server
+
+# the last-writer-wins board the collaboration server keeps for clients that join later
+#
+#   python -m unittest test_collab
+
+LINE = [0, 'line', [0.0, 0.0, 10.0, 0.0], '#000000']
+MOVED = [0, 'line', [5.0, 5.0, 15.0, 5.0], '#000000']
+RED = [0, 'line', [0.0, 0.0, 10.0, 0.0], '#ff0000']
+
+
+class MergeTest(unittest.TestCase):
+
+    def merged(self, *batches):
+        server = Server()
+        for batch in batches:
+            server.merge(batch)
+        return server
+
+    # the put with the newest version wins, ties of the clock going to the higher client
+    def test_newest_put(self):
+        server = self.merged([['put', '1.1', [1, 1], 0.0, LINE]],
+                             [['put', '1.1', [3, 2], 0.0, RED]],
+                             [['put', '1.1', [3, 1], 0.0, MOVED]],
+                             [['put', '1.1', [2, 1], 0.0, MOVED]])
+        self.assertEqual(server.entries, {'1.1': ['put', '1.1', [3, 2], 0.0, RED]})
+        self.assertEqual(server.clock, 3)
+
+    # a del is a version like any other, an older put does not bring the entry back
+    def test_del(self):
+        server = self.merged([['put', '1.1', [1, 1], 0.0, LINE], ['del', '1.1', [2, 2]]],
+                             [['put', '1.1', [2, 1], 0.0, MOVED]])
+        self.assertEqual(server.entries['1.1'], ['del', '1.1', [2, 2]])
+
+        server.merge([['put', '1.1', [4, 1], 0.0, MOVED]])
+        self.assertEqual(server.entries['1.1'][0], 'put')
+
+    # whatever order concurrent changes arrive in, the board ends up the same
+    def test_order(self):
+        ops = [['put', '1.1', [1, 1], 0.0, LINE],
+               ['put', '1.1', [2, 2], 0.0, RED],
+               ['put', '1.1', [2, 1], 0.0, MOVED],
+               ['del', '1.1', [2, 3]],
+               ['put', '2.1', [1, 2], 1.0, LINE],
+               ['put', '2.1', [5, 1], 1.0, MOVED]]
+        expected = {'1.1': ['del', '1.1', [2, 3]], '2.1': ['put', '2.1', [5, 1], 1.0, MOVED]}
+        for order in itertools.permutations(ops):
+            self.assertEqual(self.merged(*[[op] for op in order]).entries, expected)
+
+    # only the state is kept, what the clients show of their strokes and drags is relayed and forgotten
+    def test_transient(self):
+        server = self.merged([['ink', '1.2', '#000000', 3, 0, [1, 1]], ['drag', 1, ['1.1'], 2.0, 0.0],
+                              ['end', '1.2'], ['leave', 1]])
+        self.assertEqual(server.entries, {})
+        self.assertEqual(server.clock, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import unittest
+
+from drawable import Drawable
+from drawable_list import Group
+from eraser import Eraser, subtract
+from scene_format import to_tree
+from scene_index import SceneIndex
+from scene_store import SceneStore
+
+# cutting strokes with the round brush of the eraser
+#
+#   python -m unittest test_eraser
+
+
+class EraserTest(unittest.TestCase):
+
+    def setUp(self):
+        self.store = SceneStore()
+        self.index = SceneIndex()
+        self.tags = iter('group' + str(i) for i in range(1, 100))
+
+    def add(self, tag, coords, color='#000000'):
+        drawable = Drawable(self.store.new_ident(), tag, coords, color, self.store)
+        self.index.add(drawable)
+        return drawable
+
+    def rebuild(self, eraser, entry):
+        return eraser.rebuild(entry, self.store, lambda: next(self.tags))
+
+    # a stroke cut through the middle falls apart into the pieces on either side of the brush
+    def test_split(self):
+        line = self.add('freehand', [0.0, 0.0, 40.0, 0.0, 80.0, 0.0, 120.0, 0.0])
+        eraser = Eraser(self.index, 5)
+        eraser.sweep(60, -20)
+        eraser.sweep(60, 20)
+
+        self.assertEqual(eraser.erased(), [line.ident])
+        self.assertEqual(eraser.pieces(line.ident), [[0.0, 0.0, 40.0, 0.0, 55.0, 0.0],
+                                                     [65.0, 0.0, 80.0, 0.0, 120.0, 0.0]])
+
+        ident = line.ident
+        rebuilt = self.rebuild(eraser, line)
+        self.assertIsInstance(rebuilt, Group)
+        self.assertEqual([to_tree(leaf)[1:] for leaf in rebuilt],
+                         [['freehand', [0.0, 0.0, 40.0, 0.0, 55.0, 0.0], '#000000'],
+                          ['freehand', [65.0, 0.0, 80.0, 0.0, 120.0, 0.0], '#000000']])
+        self.assertEqual(rebuilt[0].ident, ident)
+        self.assertGreater(rebuilt[1].ident, ident)
+
+    # erasing the end of a stroke shortens it, erasing all of it leaves nothing
+    def test_ends(self):
+        line = self.add('line', [0.0, 0.0, 100.0, 0.0])
+        eraser = Eraser(self.index, 5)
+        eraser.sweep(100, -10)
+        eraser.sweep(100, 10)
+        self.assertEqual(to_tree(self.rebuild(eraser, line))[1:], ['line', [0.0, 0.0, 95.0, 0.0], '#000000'])
+
+        eraser = Eraser(self.index, 5)
+        for x in range(0, 110, 5):
+            eraser.sweep(x, 0)
+        self.assertIsNone(self.rebuild(eraser, line))
+
+    # shapes the brush does not cut and strokes it misses are shared with the original entry
+    def test_group(self):
+        box = self.add('rectangle', [0.0, -10.0, 20.0, 10.0])
+        stroke = self.add('poly', [0.0, 50.0, 100.0, 50.0])
+        cut = self.add('line', [0.0, 0.0, 100.0, 0.0])
+        group = Group([box, stroke, cut], 'group0')
+
+        eraser = Eraser(self.index, 5)
+        eraser.sweep(10, 0)
+        self.assertEqual(eraser.erased(), [cut.ident])
+
+        rebuilt = self.rebuild(eraser, group)
+        self.assertEqual(rebuilt.group_tag, 'group0')
+        self.assertIs(rebuilt[0], box)
+        self.assertIs(rebuilt[1], stroke)
+        self.assertEqual(len(rebuilt), 4)
+        self.assertEqual([leaf.coords for leaf in rebuilt[2:]], [[0.0, 0.0, 5.0, 0.0], [15.0, 0.0, 100.0, 0.0]])
+
+    def test_subtract(self):
+        self.assertEqual(subtract([(0.0, 1.0)], 0.25, 0.5), [(0.0, 0.25), (0.5, 1.0)])
+        self.assertEqual(subtract([(0.0, 0.25), (0.5, 1.0)], 0.0, 0.75), [(0.75, 1.0)])
+        self.assertEqual(subtract([(0.0, 1.0)], -1.0, 2.0), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
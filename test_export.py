@@ -0,0 +1,118 @@
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+import zlib
+
+from export import check_jobs, export, find_jobs
+from scene_format import write_scene
+
+# rendering saved scenes to images without Tk
+#
+#   python -m unittest test_export
+
+# a black line along the top of a 100 by 50 box and a red rectangle in its lower right corner
+TREE = [
+    [0, 'line', [0.0, 0.0, 100.0, 0.0], '#000000'],
+    [1, 'rectangle', [60.0, 30.0, 100.0, 50.0], '#ff0000', 5],
+]
+
+
+class ExportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, True)
+        self.src = os.path.join(self.directory, 'scene.sketch')
+        with open(self.src, 'wb') as f:
+            write_scene(f, TREE)
+
+    def export(self, fmt, size=110):
+        dst = os.path.join(self.directory, 'out', 'scene.' + fmt)
+        self.assertEqual(export((self.src, dst, fmt, size, 'white')), (self.src, dst, 2, None))
+        with open(dst, 'rb') as f:
+            return f.read()
+
+    # the scene with the widest line around it fills the image, at one pixel per unit here
+    def test_ppm(self):
+        data = self.export('ppm')
+        header = b'P6 110 60 255\n'
+        self.assertTrue(data.startswith(header))
+        pixels = data[len(header):]
+        self.assertEqual(len(pixels), 110 * 60 * 3)
+
+        def pixel(x, y):
+            return pixels[3 * (y * 110 + x):3 * (y * 110 + x) + 3]
+
+        self.assertEqual(pixel(55, 5), b'\0\0\0')
+        self.assertEqual(pixel(65, 35), b'\xff\0\0')
+        self.assertEqual(pixel(30, 30), b'\xff\xff\xff')
+
+    def test_png(self):
+        data = self.export('png')
+        self.assertEqual(data[:8], b'\x89PNG\r\n\x1a\n')
+        length, name, width, height = struct.unpack('>I4sII', data[8:24])
+        self.assertEqual((name, width, height), (b'IHDR', 110, 60))
+
+        # the image data is the same pixels as the PPM, one unfiltered row at a time
+        start = data.index(b'IDAT') + 4
+        size, = struct.unpack('>I', data[start - 8:start - 4])
+        rows = zlib.decompress(data[start:start + size])
+        pixels = b''.join(rows[i + 1:i + 1 + 3 * 110] for i in range(0, len(rows), 3 * 110 + 1))
+        self.assertEqual(pixels, self.export('ppm')[len(b'P6 110 60 255\n'):])
+
+    def test_svg(self):
+        svg = self.export('svg').decode()
+        self.assertTrue(svg.startswith('<svg xmlns="http://www.w3.org/2000/svg" width="110" height="60" '
+                                       'viewBox="-5 -5 110 60">'))
+        self.assertIn('<polyline points="0,0 100,0" stroke="#000000"/>', svg)
+        self.assertIn('<rect x="60" y="30" width="40" height="20" stroke="#ff0000" stroke-width="5"/>', svg)
+        self.assertTrue(svg.endswith('</g>\n</svg>\n'))
+
+    def test_unreadable(self):
+        with open(self.src, 'wb') as f:
+            f.write(b'SKPD')
+        src, dst, count, error = export((self.src, os.path.join(self.directory, 'scene.png'), 'png', 64, 'white'))
+        self.assertEqual(count, 0)
+        self.assertTrue(error.startswith('ValueError'))
+
+
+class JobsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, True)
+        for name in ['a.sketch', 'b.pickle', os.path.join('sub', 'a.sketch'), 'notes.txt']:
+            path = os.path.join(self.directory, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            open(path, 'wb').close()
+
+    def path(self, *names):
+        return os.path.join(self.directory, *names)
+
+    # the layout under a directory is kept in the output directory
+    def test_find_jobs(self):
+        out = self.path('out')
+        self.assertEqual(sorted(find_jobs([self.directory], out, 'png')),
+                         [(self.path('a.sketch'), os.path.join(out, 'a.png')),
+                          (self.path('b.pickle'), os.path.join(out, 'b.png')),
+                          (self.path('sub', 'a.sketch'), os.path.join(out, 'sub', 'a.png'))])
+
+    # a file named twice is exported once, two files for the same image are reported
+    def test_check_jobs(self):
+        out = self.path('out')
+        jobs, clashes = check_jobs(find_jobs([self.path('a.sketch'), self.path('a.sketch')], out, 'png'))
+        self.assertEqual(jobs, [(self.path('a.sketch'), os.path.join(out, 'a.png'))])
+        self.assertEqual(clashes, [])
+
+        jobs, clashes = check_jobs(find_jobs([self.path('a.sketch'), self.path('sub', 'a.sketch')], out, 'png'))
+        self.assertEqual(clashes, [[self.path('a.sketch'), self.path('sub', 'a.sketch')]])
+
+        open(self.path('b.sketch'), 'wb').close()
+        _, clashes = check_jobs(find_jobs([self.directory], None, 'png'))
+        self.assertEqual(clashes, [[self.path('b.pickle'), self.path('b.sketch')]])
+
+
+if __name__ == '__main__':
+    unittest.main()
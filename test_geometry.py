@@ -0,0 +1,46 @@
+import unittest
+
+from geometry import decimate, simplify
+
+# the line simplification applied to freehand strokes
+#
+#   python -m unittest test_geometry
+
+
+class SimplifyTest(unittest.TestCase):
+
+    # points on the straight line between the ends add nothing
+    def test_straight_line(self):
+        coords = [float(i) for x in range(11) for i in (x * 10, x * 5)]
+        self.assertEqual(simplify(coords, 0.5), [0.0, 0.0, 100.0, 50.0])
+
+    # a corner farther from the line between the ends than the tolerance is kept, the points along the
+    # two straight runs are not
+    def test_corner(self):
+        coords = [0.0, 0.0, 50.0, 0.0, 100.0, 0.0, 100.0, 50.0, 100.0, 100.0]
+        self.assertEqual(simplify(coords, 1.0), [0.0, 0.0, 100.0, 0.0, 100.0, 100.0])
+
+    # a bump is dropped under a tolerance larger than its height and kept under a smaller one
+    def test_tolerance(self):
+        coords = [0.0, 0.0, 50.0, 2.0, 100.0, 0.0]
+        self.assertEqual(simplify(coords, 3.0), [0.0, 0.0, 100.0, 0.0])
+        self.assertEqual(simplify(coords, 1.0), coords)
+
+    # two points are left alone, and a closed stroke keeps a point on the far side of it
+    def test_short_and_closed(self):
+        self.assertEqual(simplify([1.0, 2.0, 3.0, 4.0], 10.0), [1.0, 2.0, 3.0, 4.0])
+        square = [0.0, 0.0, 100.0, 0.0, 100.0, 100.0, 0.0, 100.0, 0.0, 0.0]
+        self.assertEqual(simplify(square, 1.0), square)
+
+    # a long stroke is simplified without recursion
+    def test_long_stroke(self):
+        coords = [float(i) for x in range(100000) for i in (x, (x % 2) * 10)]
+        self.assertEqual(simplify(coords, 20.0), [0.0, 0.0, 99999.0, 10.0])
+
+    def test_decimate_keeps_ends(self):
+        coords = [0.0, 0.0, 0.5, 0.0, 1.0, 0.0, 5.0, 0.0, 5.2, 0.0]
+        self.assertEqual(decimate(coords, 2.0), [0.0, 0.0, 5.0, 0.0, 5.2, 0.0])
+
+
+if __name__ == '__main__':
+    unittest.main()
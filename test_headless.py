@@ -0,0 +1,375 @@
+import contextlib
+import io
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+from controller import Controller
+from headless import HeadlessGUI
+from journal import Journal
+from saver import SceneSaver
+from scene_format import MAGIC, to_tree
+
+# the controller driven through the headless backend the way a user drives it, one event at a time
+#
+#   python -m unittest test_headless
+
+
+# nested lists of a scene without the idents, which are handed out anew on every load
+def strip(tree):
+    return [item[1:] if isinstance(item[0], int) else strip(item) for item in tree]
+
+
+class HeadlessTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, True)
+
+        # the controller prints the modes it enters
+        self.quiet = contextlib.redirect_stdout(io.StringIO())
+        self.quiet.__enter__()
+        self.addCleanup(self.quiet.__exit__, None, None, None)
+
+        self.gui, self.controller = self.start()
+
+    def start(self, autosave_dir=None):
+        gui = HeadlessGUI()
+        controller = Controller(gui, autosave_dir=autosave_dir)
+        return gui, controller
+
+    def scene(self, controller=None):
+        controller = controller or self.controller
+        return strip([to_tree(entry) for entry in controller.get_drawables()])
+
+    def drag(self, points, gui=None):
+        canvas = (gui or self.gui).get_canvas()
+        canvas.event('<Button-1>', *points[0])
+        for point in points[1:]:
+            canvas.event('<B1-Motion>', *point)
+        canvas.event('<ButtonRelease-1>', *points[-1])
+
+    def click(self, x, y):
+        self.drag([(x, y)])
+
+    def key(self, sequence):
+        self.gui.get_root().event(sequence)
+
+    # three black lines, a red scribble and a polygon
+    def draw_scene(self, gui=None, controller=None):
+        gui = gui or self.gui
+        controller = controller or self.controller
+        gui.set_color('#000000')
+        controller.set_line_mode(None)
+        for y in (100, 200, 300):
+            self.drag([(100, y), (300, y)], gui)
+
+        gui.set_color('#ff0000')
+        controller.set_freehand_mode(None)
+        self.drag([(400, 100 + 10 * i + (i % 2) * 15) for i in range(20)], gui)
+
+        controller.set_poly_mode(None)
+        canvas = gui.get_canvas()
+        for x, y in [(600, 100), (700, 150), (650, 250)]:
+            canvas.event('<Button-1>', x, y)
+        canvas.event('<Button-3>', 650, 250)
+
+
+class UndoRedoTest(HeadlessTest):
+
+    # every step of an editing session is recorded, undoing everything walks back through them and
+    # redoing everything walks forward again
+    def test_undo_redo_round_trip(self):
+        states = [self.scene()]
+        history = self.controller.history
+
+        # a step is recorded whenever the history grows, the drag steps below make one each
+        def step():
+            if len(history) != len(states) - 1:
+                states.append(self.scene())
+                self.assertEqual(len(history), len(states) - 1)
+
+        original = history.on_change
+
+        def changed(command, done):
+            original(command, done)
+            if done:
+                step()
+
+        history.on_change = changed
+
+        self.draw_scene()
+
+        # move the first line
+        self.controller.set_cursor_mode(None)
+        self.drag([(200, 100), (220, 110), (240, 120)])
+
+        # group the other two lines
+        self.controller.set_grouping_mode(None)
+        self.click(200, 200)
+        self.click(200, 300)
+        self.key('<Control-g>')
+
+        # cut the grouped lines and the scribble with the eraser
+        self.key('<Key-e>')
+        self.drag([(150, 50), (150, 350), (450, 350), (450, 50)])
+
+        # restyle the moved line, then draw another line with its old style
+        self.controller.set_cursor_mode(None)
+        self.click(240, 120)
+        self.gui.set_color('#00ff00')
+        self.key('<Control-r>')
+        self.gui.set_color('#000000')
+        self.controller.set_line_mode(None)
+        self.drag([(100, 500), (300, 500)])
+
+        history.on_change = original
+        self.assertGreaterEqual(len(states), 10)
+
+        for expected in reversed(states[:-1]):
+            self.key('<Control-z>')
+            self.assertEqual(self.scene(), expected)
+        for expected in states[1:]:
+            self.key('<Control-y>')
+            self.assertEqual(self.scene(), expected)
+
+    # an entry another client puts between the lines drawn here stays when they are undone, and redo
+    # puts them back on either side of it
+    def test_undo_around_remote_change(self):
+        self.controller.set_line_mode(None)
+        for y in (100, 200):
+            self.drag([(100, y), (300, y)])
+        first, second = self.scene()
+
+        remote = ['line', [100.0, 400.0, 300.0, 400.0], '#0000ff']
+        self.controller.remote_insert(1, [0] + remote)
+        self.controller.remote_changed()
+        self.assertEqual(self.scene(), [first, remote, second])
+
+        self.key('<Control-z>')
+        self.assertEqual(self.scene(), [first, remote])
+        self.key('<Control-z>')
+        self.assertEqual(self.scene(), [remote])
+        self.key('<Control-y>')
+        self.assertEqual(self.scene(), [first, remote])
+        self.key('<Control-y>')
+        self.assertEqual(self.scene(), [first, remote, second])
+
+    # a selection made before the top level changed in another mode does not survive it
+    def test_selection_after_grouping(self):
+        self.controller.set_line_mode(None)
+        for y in (100, 200, 300):
+            self.drag([(100, y), (300, y)])
+
+        self.controller.set_cursor_mode(None)
+        self.drag([(10, 10), (400, 400)])
+        self.assertEqual(self.controller.selection, [0, 1, 2])
+
+        self.controller.set_grouping_mode(None)
+        self.click(200, 100)
+        self.click(200, 200)
+        self.key('<Control-g>')
+
+        self.controller.set_cursor_mode(None)
+        self.drag([(200, 300), (220, 320)])
+        self.assertEqual(self.scene()[0], ['line', [120.0, 320.0, 320.0, 320.0], '#000000'])
+
+    # undoing a rotation gives the shape back its own style, so undoing a restyle before it still
+    # reaches the shape even when another shape has the same color by then
+    def test_undo_rotate_after_restyle(self):
+        self.gui.set_color('#000000')
+        self.controller.set_rect_mode(None)
+        self.drag([(100, 100), (200, 200)])
+
+        self.controller.set_cursor_mode(None)
+        self.click(100, 150)
+        self.gui.set_color('#00ff00')
+        self.key('<Control-r>')
+        green = self.scene()
+
+        self.gui.set_color('#000000')
+        self.controller.set_rect_mode(None)
+        self.drag([(300, 100), (400, 200)])
+
+        self.controller.set_cursor_mode(None)
+        self.click(100, 150)
+        self.key('<Control-r>')
+        self.assertEqual(self.scene()[0][0], 'rectangle')
+        self.assertEqual(self.scene()[0][2], '#000000')
+
+        # drag the rotate handle above the box a quarter turn around its centre
+        top = 100 - self.controller.handle_lift * self.controller.handle_size
+        self.drag([(150, top), (200, 150), (250, 150)])
+        self.assertEqual(self.scene()[0][0], 'poly')
+
+        self.key('<Control-z>')
+        self.key('<Control-z>')
+        self.assertEqual(self.scene()[0], green[0])
+        self.assertEqual(self.scene()[1], ['rectangle', [300.0, 100.0, 400.0, 200.0], '#000000'])
+
+    # a rotated box gets back the polygon style it had when the rotation is redone, even when another
+    # shape took a polygon style with those values while the first one was restyled
+    def test_redo_rotate_then_restyle(self):
+        top = 100 - self.controller.handle_lift * self.controller.handle_size
+        states = [self.scene()]
+        for x in (100, 300):
+            self.gui.set_color('#000000')
+            self.controller.set_rect_mode(None)
+            self.drag([(x, 100), (x + 100, 200)])
+            states.append(self.scene())
+
+            self.controller.set_cursor_mode(None)
+            self.click(x, 150)
+            self.drag([(x + 50, top), (x + 100, 150), (x + 150, 150)])
+            states.append(self.scene())
+            if x == 100:
+                self.gui.set_color('#ff0000')
+                self.key('<Control-r>')
+                states.append(self.scene())
+
+        for expected in reversed(states[:-1]):
+            self.key('<Control-z>')
+            self.assertEqual(self.scene(), expected)
+        for expected in states[1:]:
+            self.key('<Control-y>')
+            self.assertEqual(self.scene(), expected)
+
+    # the pen width from the keys and the width read back from the canvas make one style
+    def test_widths_share_style(self):
+        self.controller.set_line_mode(None)
+        self.drag([(100, 100), (300, 100)])
+        self.key('<bracketright>')
+        self.key('<bracketleft>')
+        self.drag([(100, 200), (300, 200)])
+        self.assertEqual(self.controller.store.style_table, [('line', '#000000', 3.0)])
+        self.assertIs(type(self.controller.store.style_table[0][2]), float)
+
+
+class RasterTest(HeadlessTest):
+
+    # the older drawables are baked into an image drawn by a worker; the image shown stays while the
+    # view is dragged and until the one for where the drag ended is ready
+    def test_raster_pan(self):
+        self.controller.set_line_mode(None)
+        for y in range(100, 700, 50):
+            self.drag([(100, y), (300, y)])
+        self.controller.set_raster_cache(4)
+        raster = self.controller.viewport.raster
+        raster.wait()
+
+        canvas = self.gui.get_canvas()
+        self.assertEqual(len(canvas.find_withtag('raster')), 1)
+        self.assertLess(len(canvas.find_withtag('line')), 12)
+        photo = raster.photo
+        x, y = canvas.coords(raster.item)
+
+        canvas.event('<Button-2>', 1000, 300)
+        for pointer in range(950, 200, -50):
+            canvas.event('<B2-Motion>', pointer, 300)
+        self.assertIs(raster.photo, photo)
+        self.assertEqual(canvas.coords(raster.item), [x - 750, y])
+
+        canvas.event('<ButtonRelease-2>', 250, 300)
+        self.assertIs(raster.photo, photo)
+        raster.wait()
+        self.assertIsNot(raster.photo, photo)
+        region = self.controller.viewport.view(self.controller.viewport.margin)
+        self.assertEqual(canvas.coords(raster.item), self.controller.viewport.to_screen(region[:2]))
+
+class SaveLoadTest(HeadlessTest):
+
+    def test_save_load_round_trip(self):
+        self.draw_scene()
+        self.controller.set_grouping_mode(None)
+        self.click(200, 100)
+        self.click(200, 200)
+        self.key('<Control-g>')
+
+        path = os.path.join(self.directory, 'scene.sketch')
+        self.controller.save(path)
+        self.controller.saver.wait()
+        self.assertIsNone(self.controller.saver)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(len(MAGIC)), MAGIC)
+
+        gui, controller = self.start()
+        with open(path, 'rb') as f:
+            controller.begin_load(f)
+            gui.get_root().run_until_idle()
+        self.assertIsNone(controller.loader)
+        self.assertEqual(self.scene(controller), self.scene())
+
+    # an error other than an OSError still ends the save and lets the next one start
+    def test_save_error(self):
+        class Broken:
+            def write(self, f, progress=None):
+                raise struct.error('broken')
+
+        path = os.path.join(self.directory, 'scene.sketch')
+        self.controller.saved_label = self.gui.get_label_text()
+        self.controller.saver = SceneSaver(self.controller)
+        self.controller.saver.start(path, Broken())
+        self.controller.saver.wait()
+
+        self.assertIsNone(self.controller.saver)
+        self.assertTrue(self.gui.get_label_text().endswith('saving ' + path + ' failed: broken'))
+        self.assertEqual(os.listdir(self.directory), [])
+
+
+class RecoveryTest(HeadlessTest):
+
+    # a session that did not close cleanly comes back from its journal on the next start
+    def test_journal_recovery(self):
+        journal_dir = os.path.join(self.directory, 'autosave')
+        gui, controller = self.start(journal_dir)
+        self.draw_scene(gui, controller)
+
+        controller.set_cursor_mode(None)
+        self.drag([(200, 100), (250, 130)], gui)
+        gui.get_root().event('<Control-z>')
+        gui.get_root().event('<Control-y>')
+        expected = self.scene(controller)
+
+        controller.journal.close(clean=False)
+        self.assertEqual(strip(Journal(journal_dir).recover()), expected)
+
+        _, restored = self.start(journal_dir)
+        self.assertEqual(self.scene(restored), expected)
+        restored.journal.close(clean=True)
+
+    # a record the journal cannot write is reported, and the next change starts the journal over
+    def test_journal_error(self):
+        journal_dir = os.path.join(self.directory, 'autosave')
+        gui, controller = self.start(journal_dir)
+        self.draw_scene(gui, controller)
+
+        controller.autosave(['move', 0, object(), 0])
+        gui.get_root().run_until_idle()
+        self.assertTrue(controller.journal.failed)
+        self.assertIn('autosave failed', gui.get_label_text())
+
+        controller.set_line_mode(None)
+        self.drag([(100, 500), (300, 500)], gui)
+        gui.get_root().run_until_idle()
+        self.assertFalse(controller.journal.failed)
+
+        controller.journal.close(clean=False)
+        self.assertEqual(strip(Journal(journal_dir).recover()), self.scene(controller))
+
+    # a journal that cannot be read is reported and the session starts empty
+    def test_unreadable_journal(self):
+        journal_dir = os.path.join(self.directory, 'autosave')
+        os.makedirs(journal_dir)
+        with open(os.path.join(journal_dir, 'journal.log'), 'wb') as f:
+            f.write(b'not a journal\n')
+
+        gui, controller = self.start(journal_dir)
+        self.assertIn('autosave journal could not be read', gui.get_label_text())
+        self.assertEqual(self.scene(controller), [])
+        controller.journal.close(clean=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import math
+import unittest
+
+import packed_geometry
+from drawable import Drawable
+from packed_geometry import PackedCoords, rotates, rotation, scaling
+from scene_store import SceneStore
+
+# the geometry kernel over many rows at once, with numpy when it is installed and with the pure
+# Python fallback, which gives the same results
+#
+#   python -m unittest test_packed_geometry
+
+
+class PackedCoordsTest(unittest.TestCase):
+    # numpy module the tests run with, None for the fallback
+    numpy = None
+
+    def setUp(self):
+        self.addCleanup(setattr, packed_geometry, 'numpy', packed_geometry.numpy)
+        packed_geometry.numpy = self.numpy
+
+        self.store = SceneStore()
+        self.shapes = [
+            Drawable(1, 'freehand', [0.0, 0.0, 10.0, 0.0, 10.0, 10.0], '#000000', self.store),
+            Drawable(2, 'line', [20.0, 5.0, 30.0, 15.0], '#000000', self.store),
+            Drawable(3, 'poly', [0.0, 20.0, 10.0, 20.0, 10.0, 30.0, 0.0, 30.0], '#000000', self.store),
+        ]
+
+    def pack(self):
+        return PackedCoords(self.store, [shape.row for shape in self.shapes])
+
+    def test_boxes(self):
+        packed = self.pack()
+        self.assertEqual(len(packed), 3)
+        self.assertEqual(packed.boxes(), [(0.0, 0.0, 10.0, 10.0), (20.0, 5.0, 30.0, 15.0), (0.0, 20.0, 10.0, 30.0)])
+        self.assertEqual(packed.bbox(), (0.0, 0.0, 30.0, 30.0))
+        self.assertEqual(packed.coords(1), [20.0, 5.0, 30.0, 15.0])
+
+    # moved coordinates are written back to their rows, the copy keeps its own
+    def test_translate_write(self):
+        packed = self.pack()
+        copy = packed.copy()
+        packed.translate(5, -5)
+        packed.write(self.store)
+        self.assertEqual(self.shapes[1].coords, [25.0, 0.0, 35.0, 10.0])
+        self.assertEqual(self.shapes[2].coords, [5.0, 15.0, 15.0, 15.0, 15.0, 25.0, 5.0, 25.0])
+        self.assertEqual(copy.coords(1), [20.0, 5.0, 30.0, 15.0])
+
+    def test_transform(self):
+        packed = self.pack()
+        packed.scale(2, 3, 10, 10)
+        self.assertEqual(packed.coords(0), [-10.0, -20.0, 10.0, -20.0, 10.0, 10.0])
+
+        # a quarter turn counterclockwise on screen, where y points down
+        packed = self.pack()
+        packed.rotate(math.pi / 2, 0, 0)
+        self.assertEqual([round(coord, 9) + 0.0 for coord in packed.coords(1)], [5.0, -20.0, 15.0, -30.0])
+
+        self.assertTrue(rotates(rotation(0.1, 0, 0)))
+        self.assertFalse(rotates(scaling(2, 2, 0, 0)))
+
+    # distance to every row as an open polyline, the end of one row does not join the next
+    def test_distances(self):
+        distances = self.pack().distances(15, 0)
+        self.assertEqual(distances[0], 5.0)
+        self.assertAlmostEqual(distances[1], math.hypot(5, 5))
+        self.assertEqual(distances[2], math.hypot(5, 20))
+
+    # inside every row as a polygon closed back to its first point
+    def test_contains(self):
+        packed = self.pack()
+        self.assertEqual(packed.contains(8, 2), [True, False, False])
+        self.assertEqual(packed.contains(5, 25), [False, False, True])
+        self.assertEqual(packed.contains(50, 50), [False, False, False])
+
+    def test_empty(self):
+        packed = PackedCoords(self.store, [])
+        self.assertIsNone(packed.bbox())
+        self.assertEqual(packed.boxes(), [])
+        self.assertEqual(packed.distances(0, 0), [])
+        self.assertEqual(packed.contains(0, 0), [])
+        packed.write(self.store)
+
+
+@unittest.skipIf(packed_geometry.numpy is None, 'numpy is not installed')
+class NumpyPackedCoordsTest(PackedCoordsTest):
+    numpy = packed_geometry.numpy
+
+
+if __name__ == '__main__':
+    unittest.main()
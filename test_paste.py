@@ -0,0 +1,62 @@
+import unittest
+
+from drawable import Drawable
+from drawable_list import Group
+from paste import clone, grid_offsets, path_offsets
+from scene_format import to_tree
+from scene_store import SceneStore
+
+# where pasted and duplicated copies go, and the copies themselves
+#
+#   python -m unittest test_paste
+
+
+class OffsetsTest(unittest.TestCase):
+
+    # the original takes the first cell, the copies fill the rest of its row and then the next rows
+    def test_grid(self):
+        self.assertEqual(grid_offsets(5, 3, 10, 20), [(10, 0), (20, 0), (0, 20), (10, 20), (20, 20)])
+
+    # without columns every copy goes in one row, stepping along the diagonal of a cell
+    def test_grid_one_row(self):
+        self.assertEqual(grid_offsets(3, 0, 10, 20), [(10, 20), (20, 40), (30, 60)])
+
+    # copies spread evenly along the path, the last at its end
+    def test_path(self):
+        offsets = path_offsets([0.0, 0.0, 30.0, 0.0, 30.0, 30.0], 4)
+        self.assertEqual(offsets, [(15.0, 0.0), (30.0, 0.0), (30.0, 15.0), (30.0, 30.0)])
+
+    def test_path_without_length(self):
+        self.assertEqual(path_offsets([5.0, 5.0, 5.0, 5.0], 3), [])
+        self.assertEqual(path_offsets([0.0, 0.0, 10.0, 0.0], 0), [])
+
+
+class CloneTest(unittest.TestCase):
+
+    # every copy is the entries moved by its offset, with new rows, idents and group tags
+    def test_clone(self):
+        store = SceneStore()
+        line = Drawable(store.new_ident(), 'line', [0.0, 0.0, 10.0, 0.0], '#000000', store)
+        group = Group([Drawable(store.new_ident(), 'oval', [0.0, 0.0, 4.0, 4.0], '#ff0000', store, 5),
+                       Drawable(store.new_ident(), 'freehand', [1.0, 1.0, 2.0, 3.0], '#0000ff', store)], 'group1')
+
+        tags = iter(['group2', 'group3'])
+        copies = clone(store, [line, group], grid_offsets(2, 0, 100, 0), lambda: next(tags))
+        self.assertEqual(len(copies), 2)
+
+        first = copies[0]
+        self.assertEqual(to_tree(first[0])[1:], ['line', [100.0, 0.0, 110.0, 0.0], '#000000'])
+        self.assertEqual([to_tree(leaf)[1:] for leaf in first[1]],
+                         [['oval', [100.0, 0.0, 104.0, 4.0], '#ff0000', 5.0],
+                          ['freehand', [101.0, 1.0, 102.0, 3.0], '#0000ff']])
+        self.assertEqual(first[1].group_tag, 'group2')
+        self.assertEqual(copies[1][0].coords, [200.0, 0.0, 210.0, 0.0])
+
+        rows = {line.row, group[0].row, group[1].row}
+        for copy in copies:
+            self.assertTrue(rows.isdisjoint({copy[0].row, copy[1][0].row, copy[1][1].row}))
+        self.assertEqual(line.coords, [0.0, 0.0, 10.0, 0.0])
+
+
+if __name__ == '__main__':
+    unittest.main()
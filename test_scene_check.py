@@ -0,0 +1,98 @@
+import io
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+from scene_check import check, process, repair
+from scene_format import read_tree
+
+# finding and repairing the problems of old scene files
+#
+#   python -m unittest test_scene_check
+
+# a stroke saved as three chained segments inside a group, next to shapes with other problems; a group
+# left with a single shape becomes that shape
+BROKEN = [
+    [[0, 'freehand', [0, 0, 1, 1], 'black'],
+     [1, 'freehand', [1, 1, 2, 3], 'black'],
+     [2, 'freehand', [2, 3, 5, 5], 'black']],
+    [3, 'line', [0, 0, 10, 10, 20], 'red'],
+    [4, 'rectangle', [0, 0, 10, 10, 20, 20], 'blue', 2],
+    [[], [5, 'oval', [0, 0, 4, 4], 'green']],
+]
+
+REPAIRED = [
+    [0, 'freehand', [0, 0, 1, 1, 2, 3, 5, 5], 'black'],
+    [3, 'line', [0, 0, 10, 10], 'red'],
+    [4, 'rectangle', [0, 0, 10, 10], 'blue', 2],
+    [5, 'oval', [0, 0, 4, 4], 'green'],
+]
+
+
+class CheckTest(unittest.TestCase):
+
+    def test_problems(self):
+        self.assertEqual(check(BROKEN), [
+            ((0,), 'stroke saved as separate segments', True),
+            ((1,), 'odd number of coordinates', True),
+            ((2,), '6 coordinates for a rectangle', True),
+            ((3, 0), 'empty group', True),
+        ])
+        self.assertEqual(check(REPAIRED), [])
+
+    # the repairs leave the input as it was
+    def test_repair(self):
+        original = pickle.loads(pickle.dumps(BROKEN))
+        self.assertEqual(repair(BROKEN), REPAIRED)
+        self.assertEqual(BROKEN, original)
+
+    # segments that do not chain, and chains at the top level, stay apart
+    def test_separate_segments(self):
+        group = [[[0, 'freehand', [0, 0, 1, 1], 'black'], [1, 'freehand', [5, 5, 6, 6], 'black']]]
+        self.assertEqual(repair(group), group)
+        top = [[0, 'freehand', [0, 0, 1, 1], 'black'], [1, 'freehand', [1, 1, 2, 2], 'black']]
+        self.assertEqual(repair(top), top)
+
+    def test_invalid(self):
+        problems = check([[0, 'star', [0, 0], 7, -1]])
+        self.assertEqual([repairable for _, _, repairable in problems], [False, False, False, False])
+        self.assertEqual(check('scene'), [((), 'the scene is not a list', False)])
+
+
+class ProcessTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, True)
+        self.path = os.path.join(self.directory, 'old.pickle')
+        with open(self.path, 'wb') as f:
+            pickle.dump(BROKEN, f)
+
+    def test_report_only(self):
+        result = process((self.path, None, None, False))
+        self.assertEqual(result['status'], 'needs repair')
+        self.assertEqual(len(result['problems']), 4)
+        self.assertIsNone(result['output'])
+
+    # a repaired file is converted to the binary format
+    def test_repair_convert(self):
+        out = os.path.join(self.directory, 'out', 'old.sketch')
+        result = process((self.path, out, 'sketch', True))
+        self.assertEqual(result['status'], 'repaired')
+        self.assertEqual(result['output'], out)
+        self.assertEqual(result['leaves'], 4)
+        with open(out, 'rb') as f:
+            tree = read_tree(f)
+        self.assertEqual([leaf[1:] for leaf in tree], [leaf[1:] for leaf in REPAIRED])
+
+    def test_unreadable(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'not a scene')
+        result = process((self.path, None, None, True))
+        self.assertEqual(result['status'], 'failed')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import datetime
+import io
+import pickle
+import struct
+import unittest
+from array import array
+
+from scene_format import (HEADER, MAGIC, SECTION, SceneFile, load_legacy, little_endian, pack_strings, read_tree,
+                          write_scene)
+
+# the binary scene file and the legacy pickle format
+#
+#   python -m unittest test_scene_format
+
+# a group of two strokes between two single shapes, the leaf idents are the leaf indices as read_tree
+# gives them back; widths are exact in the f32 of the file
+TREE = [
+    [0, 'line', [0.0, 0.0, 100.0, 50.0], '#000000'],
+    [[1, 'freehand', [1.0, 2.0, 3.0, 4.0, 5.0, 6.0], '#ff0000', 1.5],
+     [2, 'oval', [10.0, 10.0, 20.0, 30.0], '#000000']],
+    [3, 'poly', [0.0, 0.0, 10.0, 0.0, 5.0, 8.0], 'gray50', 7.0],
+]
+
+
+# a version 1 file of the same leaves: a kind and a color per leaf instead of styles, no widths
+def version1_file(tree):
+    kinds, colors, offsets, coords, tokens = [], [], array('Q', [0]), array('d'), array('i')
+    kind_names, color_names = [], []
+
+    def add(item):
+        if type(item[0]) is int:
+            for names, values, name in ((kind_names, kinds, item[1]), (color_names, colors, item[3])):
+                if name not in names:
+                    names.append(name)
+                values.append(names.index(name))
+            tokens.append(len(kinds) - 1)
+            coords.extend(item[2])
+            offsets.append(len(coords))
+        else:
+            tokens.append(-(len(item) + 1))
+            for child in item:
+                add(child)
+
+    for entry in tree:
+        add(entry)
+
+    sections = [(b'STRS', pack_strings(kind_names) + pack_strings(color_names)),
+                (b'KIND', bytes(kinds)),
+                (b'COLR', little_endian(array('H', colors))),
+                (b'OFFS', little_endian(offsets)),
+                (b'CORD', little_endian(coords)),
+                (b'TREE', little_endian(tokens))]
+
+    position = HEADER.size + SECTION.size * len(sections)
+    table, body = [], b''
+    for name, data in sections:
+        padding = -(position + len(body)) % 8
+        body += b'\0' * padding
+        table.append(SECTION.pack(name, position + len(body), len(data)))
+        body += data
+    header = HEADER.pack(MAGIC, 1, len(sections), len(kinds), len(tokens) - len(kinds), 0.0, 0.0, 0.0, 0.0)
+    return header + b''.join(table) + body
+
+
+class SceneFileTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        data = io.BytesIO()
+        write_scene(data, TREE)
+        data.seek(0)
+        self.assertEqual(read_tree(data), TREE)
+
+    def test_header(self):
+        data = io.BytesIO()
+        write_scene(data, TREE)
+        with SceneFile(io.BytesIO(data.getvalue())) as scene:
+            self.assertEqual(scene.version, 2)
+            self.assertEqual(scene.leaf_count, 4)
+            self.assertEqual(scene.group_count, 1)
+            self.assertEqual(scene.bbox, (0.0, 0.0, 100.0, 50.0))
+            self.assertEqual(scene.leaf(1), ('freehand', [1.0, 2.0, 3.0, 4.0, 5.0, 6.0], '#ff0000', 1.5))
+
+    # a version 1 file reads as the same scene with every width the default one
+    def test_version1(self):
+        expected = [[0, 'line', [0.0, 0.0, 100.0, 50.0], '#000000'],
+                    [[1, 'freehand', [1.0, 2.0, 3.0, 4.0, 5.0, 6.0], '#ff0000'],
+                     [2, 'oval', [10.0, 10.0, 20.0, 30.0], '#000000']],
+                    [3, 'poly', [0.0, 0.0, 10.0, 0.0, 5.0, 8.0], 'gray50']]
+        self.assertEqual(read_tree(io.BytesIO(version1_file(TREE))), expected)
+
+        # and writes out as version 2
+        data = io.BytesIO()
+        write_scene(data, expected)
+        data.seek(0)
+        self.assertEqual(read_tree(data), expected)
+
+    def test_not_a_scene_file(self):
+        with self.assertRaises(ValueError):
+            SceneFile(io.BytesIO(b'SKPX' + bytes(HEADER.size)))
+        with self.assertRaises(ValueError):
+            SceneFile(io.BytesIO(MAGIC + struct.pack('<H', 3) + bytes(HEADER.size)))
+
+
+class LegacyTest(unittest.TestCase):
+
+    def test_plain_lists(self):
+        tree = [[0, 'line', [0, 0, 10, 10], 'black'], [[1, 'oval', [0, 0, 5, 5], 'red']]]
+        self.assertEqual(load_legacy(io.BytesIO(pickle.dumps(tree))), tree)
+        self.assertEqual(read_tree(io.BytesIO(pickle.dumps(tree))), tree)
+
+    # an old file cannot make the loader build objects of any class
+    def test_refuses_classes(self):
+        for value in [datetime.date(2020, 1, 1), [[0, 'line', [0, 0, 1, 1], 'black'], ValueError('x')]]:
+            with self.assertRaises(pickle.UnpicklingError):
+                load_legacy(io.BytesIO(pickle.dumps(value)))
+
+
+if __name__ == '__main__':
+    unittest.main()
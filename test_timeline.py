@@ -0,0 +1,65 @@
+import unittest
+
+from test_headless import HeadlessTest
+
+# replaying the session from its timeline, on the controller driven through the headless backend
+#
+#   python -m unittest test_timeline
+
+
+class TimelineTest(HeadlessTest):
+
+    # the scene after every change, from the records the controller logs
+    def record_session(self):
+        self.controller.timeline.keyframe_interval = 3
+        states = [self.scene()]
+        original = self.controller.log
+
+        def log(record):
+            original(record)
+            states.append(self.scene())
+
+        self.controller.log = log
+        self.draw_scene()
+        self.controller.set_cursor_mode(None)
+        self.drag([(200, 100), (220, 110), (240, 120)])
+        self.controller.set_grouping_mode(None)
+        self.click(200, 200)
+        self.click(200, 300)
+        self.key('<Control-g>')
+        self.key('<Control-z>')
+        self.key('<Control-z>')
+        self.key('<Control-y>')
+        self.controller.log = original
+        return states
+
+    # any step is shown as the scene was then, seeking forwards, backwards and across keyframes
+    def test_seek(self):
+        states = self.record_session()
+        live = self.scene()
+        self.assertEqual(len(self.controller.timeline), len(states) - 1)
+        self.assertGreater(len(self.controller.timeline.keyframes), 2)
+
+        self.key('<Key-t>')
+        review = self.controller.review
+        self.assertEqual(review.step, len(states) - 1)
+        self.assertEqual(self.scene(), live)
+
+        for step in [0, 1, 5, 4, 7, len(states) - 1, 2, 3, 3, 6, 0]:
+            review.seek(step)
+            self.assertEqual(self.scene(), states[step])
+
+        self.key('<Right>')
+        self.key('<Right>')
+        self.assertEqual(self.scene(), states[2])
+        self.key('<Left>')
+        self.assertEqual(self.scene(), states[1])
+
+        # leaving puts the live scene back
+        self.key('<Key-t>')
+        self.assertIsNone(self.controller.review)
+        self.assertEqual(self.scene(), live)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,230 @@
+import bisect
+import io
+import time
+
+from journal import apply
+from scene_format import SceneFile, SceneSnapshot, is_leaf_tree
+
+# speeds of the time-lapse, as multiples of the time the session took
+SPEEDS = [1, 2, 4, 8, 16, 32, 64, 128]
+
+
+class Timeline:
+    # every change of the session in order, as the journal records of the changes together with the
+    # time they happened, and a keyframe of the whole scene every keyframe_interval records and after
+    # changes that have no record (load); step n is the scene after the first n records
+    #
+    # the scene at any step is rebuilt from the last keyframe at or before it and at most
+    # keyframe_interval records, whatever the length of the session; a keyframe is a copy of the scene
+    # model that is only written into a scene file the first time it is decoded, recording stays a few
+    # memory copies
+    #
+    # replaying a record copies the entries it changes instead of changing them in place, so the records
+    # are kept as they are, and the entries of a scene that are the same objects as in the scene it was
+    # carried on from, or as in the last keyframe decoded which is kept, are unchanged
+
+    def __init__(self, keyframe_interval=100):
+        self.keyframe_interval = keyframe_interval
+
+        # every record and the seconds since the start at which it happened
+        self.records = []
+        self.times = []
+
+        # step of every keyframe and its SceneSnapshot, replaced by its scene file once decoded
+        self.keyframe_steps = []
+        self.keyframes = []
+
+        # position of the last keyframe decoded and its scene as nested lists
+        self.__decoded = None
+        self.__tree = None
+
+        self.__start = None
+
+    def __len__(self):
+        return len(self.records)
+
+    # begin recording a session whose scene is currently entries
+    def start(self, entries):
+        self.__start = time.monotonic()
+        self.keyframe(entries)
+
+    # a change applied to the scene, which is entries afterwards; None for a change without a record
+    def record(self, record, entries):
+        self.records.append(record)
+        self.times.append(time.monotonic() - self.__start)
+        if record is None or len(self.records) - self.keyframe_steps[-1] >= self.keyframe_interval:
+            self.keyframe(entries)
+
+    def keyframe(self, entries):
+        self.keyframe_steps.append(len(self.records))
+        self.keyframes.append(SceneSnapshot(entries))
+
+    # the scene file of a keyframe
+    def __encode(self, i):
+        keyframe = self.keyframes[i]
+        if isinstance(keyframe, SceneSnapshot):
+            data = io.BytesIO()
+            keyframe.write(data)
+            self.keyframes[i] = data.getvalue()
+        return self.keyframes[i]
+
+    # drop the decoded keyframe, it is only worth keeping while the timeline is being reviewed
+    def release(self):
+        self.__decoded = None
+        self.__tree = None
+
+    # the scene at a step as nested lists; current is the scene at current_step, which is carried on
+    # instead of decoding the keyframe when it lies between the keyframe and the step
+    def scene(self, step, current=None, current_step=0):
+        i = bisect.bisect_right(self.keyframe_steps, step) - 1
+        first = self.keyframe_steps[i]
+        if current is not None and first <= current_step <= step:
+            scene, first = current, current_step
+        else:
+            if self.__decoded != i:
+                with SceneFile(io.BytesIO(self.__encode(i))) as f:
+                    self.__tree = f.tree()
+                self.__decoded = i
+            scene = list(self.__tree)
+
+        for record in self.records[first:step]:
+            apply_copied(scene, record)
+        return scene
+
+
+# apply a journal record to a scene, the top-level entries it changes in place are copied first
+def apply_copied(scene, record):
+    op = record[0]
+    if op == 'batch':
+        for inner in record[1]:
+            apply_copied(scene, inner)
+        return
+
+    if op == 'move':
+        positions = [record[1]]
+    elif op == 'transform':
+        positions = record[1]
+    elif op == 'restyle':
+        positions = [position for position, _ in record[6]]
+    else:
+        positions = []
+    for position in positions:
+        scene[position] = copy_tree(scene[position])
+    apply(scene, record)
+
+
+# the lists of an entry down to its leaves, the changes of a record replace the fields of a leaf
+def copy_tree(item):
+    if is_leaf_tree(item):
+        return list(item)
+    return [copy_tree(i) for i in item]
+
+
+class TimelineReview:
+    # shows the scene of the session at any step of its timeline in place of the live one, stepping
+    # through it or playing it back as a time-lapse scheduled with after
+
+    def __init__(self, controller, timeline, speed=8, max_gap=1.0, tick=40):
+        self.controller = controller
+        self.timeline = timeline
+
+        # the time-lapse runs speed times faster than the session did, with pauses longer than
+        # max_gap seconds cut down to it, and looks at the clock every tick milliseconds
+        self.speed = speed
+        self.max_gap = max_gap
+        self.tick = tick
+
+        # step shown and its scene as nested lists
+        self.step = None
+        self.scene = None
+
+        # session seconds the time-lapse is ahead of the step shown, and when it last looked at the clock
+        self.__lag = 0.0
+        self.__clock = None
+        self.__after = None
+
+    @property
+    def playing(self):
+        return self.__after is not None
+
+    def seek(self, step):
+        step = min(max(step, 0), len(self.timeline))
+        if step == self.step:
+            return
+
+        self.scene = self.timeline.scene(step, self.scene, self.step or 0)
+        self.step = step
+        self.controller.show_timeline(self.scene)
+        self.controller.timeline_progress(self.step, len(self.timeline), self.__time(), self.playing, self.speed)
+
+    def move(self, steps):
+        self.pause()
+        self.seek(self.step + steps)
+
+    def play(self):
+        if self.playing:
+            return
+
+        # playing from the end starts over
+        if self.step == len(self.timeline):
+            self.seek(0)
+        self.__lag = 0.0
+        self.__clock = time.monotonic()
+        self.__after = self.controller.gui.get_root().after(self.tick, self.__advance)
+        self.controller.timeline_progress(self.step, len(self.timeline), self.__time(), True, self.speed)
+
+    def pause(self):
+        if self.__after is None:
+            return
+        self.controller.gui.get_root().after_cancel(self.__after)
+        self.__after = None
+        self.controller.timeline_progress(self.step, len(self.timeline), self.__time(), False, self.speed)
+
+    def toggle(self):
+        if self.playing:
+            self.pause()
+        else:
+            self.play()
+
+    def faster(self):
+        self.__set_speed(1)
+
+    def slower(self):
+        self.__set_speed(-1)
+
+    def __set_speed(self, change):
+        position = bisect.bisect_left(SPEEDS, self.speed)
+        self.speed = SPEEDS[min(max(position + change, 0), len(SPEEDS) - 1)]
+        self.controller.timeline_progress(self.step, len(self.timeline), self.__time(), self.playing, self.speed)
+
+    # session seconds from the step shown to the next one
+    def __gap(self, step):
+        if step == 0:
+            return 0.0
+        return min(self.timeline.times[step] - self.timeline.times[step - 1], self.max_gap)
+
+    # the steps whose time has come are applied together and shown once
+    def __advance(self):
+        now = time.monotonic()
+        self.__lag += (now - self.__clock) * self.speed
+        self.__clock = now
+
+        step = self.step
+        while step < len(self.timeline) and self.__lag >= self.__gap(step):
+            self.__lag -= self.__gap(step)
+            step += 1
+
+        # the time-lapse stops at the end of the timeline
+        if step < len(self.timeline):
+            self.__after = self.controller.gui.get_root().after(self.tick, self.__advance)
+        else:
+            self.__after = None
+
+        if step != self.step:
+            self.seek(step)
+        elif self.__after is None:
+            self.controller.timeline_progress(self.step, len(self.timeline), self.__time(), False, self.speed)
+
+    # session seconds at the step shown
+    def __time(self):
+        return self.timeline.times[self.step - 1] if self.step else 0.0
@@ -0,0 +1,359 @@
+import bisect
+
+from drawable import Drawable
+from geometry import bounding_box, decimate
+from scene_index import leaves
+
+# kinds drawn as polylines, simplified when zoomed out
+POLYLINES = ['freehand', 'line', 'poly']
+
+
+class Viewport:
+    # maps the unbounded world coordinates of the scene onto the canvas, and keeps canvas items
+    # only for the drawables that cross the visible area plus a margin
+
+    def __init__(self, canvas, index, create_item, margin=0.25, min_scale=1 / 64, max_scale=64):
+        self.canvas = canvas
+        self.index = index
+
+        # create_item(kind, screen coords, color, tags, width) -> canvas item
+        self.create_item = create_item
+
+        # world point shown at the top left corner of the canvas and screen pixels per world unit
+        self.x = 0.0
+        self.y = 0.0
+        self.scale = 1.0
+        self.min_scale = min_scale
+        self.max_scale = max_scale
+
+        # extra area around the view that gets canvas items, as a fraction of the view size;
+        # items are only dropped once they are twice as far out
+        self.margin = margin
+
+        # points of polylines closer than this many pixels are merged while zoomed out
+        self.lod_tolerance = 1.0
+
+        # ident -> (canvas item, drawable) for every drawable that has a canvas item
+        self.__items = {}
+
+        # idents with canvas items in drawing order, to stack new items between them
+        self.__stacked = []
+
+        # world rectangle whose drawables have canvas items, None before the first refresh
+        self.__region = None
+
+        # background image the older drawables are baked into, None while the raster cache is off
+        self.raster = None
+
+        # drawables with an ident up to this one are drawn on the raster instead of as canvas items,
+        # apart from the unbaked ones the tools have picked since the last bake
+        self.watermark = 0
+        self.__unbaked = set()
+
+        # ident -> drawable for the baked drawables near the view
+        self.__baked = {}
+
+        # whether the raster no longer shows the baked drawables, and the region and scale it was drawn for
+        self.__dirty = False
+        self.__rendered = None
+
+        # while the view is dragged the raster keeps its image, it is baked and drawn again at the end
+        self.panning = False
+
+    def __len__(self):
+        return len(self.__items)
+
+    def size(self):
+        width, height = self.canvas.winfo_width(), self.canvas.winfo_height()
+
+        # an unmapped canvas reports 1x1, use its requested size instead
+        if width <= 1 or height <= 1:
+            width, height = int(self.canvas.cget('width')), int(self.canvas.cget('height'))
+        return width, height
+
+    # world rectangle currently on screen, grown by a fraction of its size on every side
+    def view(self, grow=0.0):
+        width, height = self.size()
+        x1 = self.x + width / self.scale
+        y1 = self.y + height / self.scale
+        dx = (x1 - self.x) * grow
+        dy = (y1 - self.y) * grow
+        return self.x - dx, self.y - dy, x1 + dx, y1 + dy
+
+    def to_world(self, coords):
+        return [coord / self.scale + (self.x if i % 2 == 0 else self.y) for i, coord in enumerate(coords)]
+
+    def to_screen(self, coords):
+        return [(coord - (self.x if i % 2 == 0 else self.y)) * self.scale for i, coord in enumerate(coords)]
+
+    # screen coordinates of a drawable, with detail the current zoom cannot show dropped
+    def screen_coords(self, leaf):
+        coords = self.to_screen(leaf.coord_slice)
+        if self.scale < 1 and len(coords) > 4 and leaf.tag in POLYLINES:
+            coords = decimate(coords, self.lod_tolerance)
+        return coords
+
+    # bounding box of a drawable as the index has it, computed only for one that is still being drawn
+    def __box(self, leaf):
+        box = self.index.box(leaf.ident)
+        return box if box is not None else bounding_box(leaf.coords)
+
+    # canvas item of a drawable, None while it has none
+    def item(self, leaf):
+        found = self.__items.get(leaf.ident)
+        return None if found is None else found[0]
+
+    # take over a canvas item that was drawn for a new drawable
+    def adopt(self, leaf, item):
+        self.canvas.addtag_withtag(style_tag(leaf.style), item)
+        self.__items[leaf.ident] = (item, leaf)
+        bisect.insort(self.__stacked, leaf.ident)
+
+    def __realize(self, leaf, groups):
+        if self.raster is not None and leaf.ident <= self.watermark and leaf.ident not in self.__unbaked:
+            self.__baked[leaf.ident] = leaf
+            self.__dirty = True
+            return
+
+        item = self.create_item(leaf.tag, self.screen_coords(leaf), leaf.color, (style_tag(leaf.style),) + tuple(groups),
+                                leaf.width)
+
+        # stack the item below the first item of a later drawable
+        position = bisect.bisect(self.__stacked, leaf.ident)
+        if position < len(self.__stacked):
+            self.canvas.tag_lower(item, self.__items[self.__stacked[position]][0])
+
+        self.__items[leaf.ident] = (item, leaf)
+        self.__stacked.insert(position, leaf.ident)
+
+    def __forget(self, ident):
+        del self.__items[ident]
+        position = bisect.bisect_left(self.__stacked, ident)
+        del self.__stacked[position]
+
+    # create canvas items for the drawables of an entry that are near the view
+    def show(self, entry):
+        if self.__region is None:
+            self.refresh()
+            return
+
+        x0, y0, x1, y1 = self.__region
+        stack = [(entry, ())]
+        while stack:
+            item, groups = stack.pop()
+            if isinstance(item, Drawable):
+                if item.ident in self.__items or item.ident in self.__baked:
+                    continue
+                bx0, by0, bx1, by1 = self.__box(item)
+                if bx0 <= x1 and bx1 >= x0 and by0 <= y1 and by1 >= y0:
+                    self.__realize(item, groups)
+            else:
+                groups = groups + (item.group_tag,)
+                stack.extend((i, groups) for i in item)
+
+    # delete the canvas items of every drawable in an entry
+    def hide(self, entry):
+        for leaf in leaves(entry):
+            found = self.__items.get(leaf.ident)
+            if found is not None:
+                self.canvas.delete(found[0])
+                self.__forget(leaf.ident)
+            elif self.__baked.pop(leaf.ident, None) is not None:
+                self.__dirty = True
+
+    # an entry was swapped for one sharing drawables and group tags with it, the shared drawables keep
+    # their canvas items
+    def replace(self, old, new):
+        kept = {id(leaf) for leaf in leaves(old)}
+        added = [leaf for leaf in leaves(new) if id(leaf) not in kept]
+        shared = {id(leaf) for leaf in leaves(new)}
+        self.hide([leaf for leaf in leaves(old) if id(leaf) not in shared])
+
+        if self.__region is None:
+            self.refresh()
+            return
+
+        x0, y0, x1, y1 = self.__region
+        tags = None
+        for leaf in added:
+            bx0, by0, bx1, by1 = self.__box(leaf)
+            if bx0 <= x1 and bx1 >= x0 and by0 <= y1 and by1 >= y0:
+                if tags is None:
+                    tags = group_tags(new)
+                self.__realize(leaf, tags.get(leaf.ident, ()))
+
+    # an entry was moved in the model, its baked drawables have to be drawn again
+    def moved(self, entry):
+        if any(leaf.ident in self.__baked for leaf in leaves(entry)):
+            self.__dirty = True
+
+    # the coordinates of an entry changed in the model, its canvas items follow
+    def reshaped(self, entry):
+        for leaf in leaves(entry):
+            found = self.__items.get(leaf.ident)
+            if found is not None:
+                self.canvas.coords(found[0], *self.screen_coords(leaf))
+            elif leaf.ident in self.__baked:
+                self.__dirty = True
+
+    # bring the canvas items in line with the view: create the missing ones near it and
+    # delete the ones that are far out
+    def refresh(self):
+        region = self.view(self.margin)
+        keep_x0, keep_y0, keep_x1, keep_y1 = self.view(2 * self.margin)
+
+        for ident, (item, leaf) in list(self.__items.items()):
+            box = self.index.box(ident)
+
+            # drawables outside the index are still being drawn
+            if box is None:
+                continue
+            if box[0] > keep_x1 or box[2] < keep_x0 or box[1] > keep_y1 or box[3] < keep_y0:
+                self.canvas.delete(item)
+                self.__forget(ident)
+
+        for ident in list(self.__baked):
+            box = self.index.box(ident)
+            if box is not None and (box[0] > keep_x1 or box[2] < keep_x0 or box[1] > keep_y1 or box[3] < keep_y0):
+                del self.__baked[ident]
+                self.__dirty = True
+
+        for ident in sorted(self.index.query(*region)):
+            if ident in self.__items or ident in self.__baked:
+                continue
+            self.__realize(self.index.leaf(ident), self.index.group_tags(ident))
+
+        self.__region = region
+
+        if self.raster is not None and not self.panning:
+            if len(self.__items) > self.raster.max_items:
+                self.__bake()
+            if self.__dirty or self.__rendered != (region, self.scale):
+                self.__render()
+
+    # turn the raster cache on with a RasterLayer, or off with None
+    def enable_raster(self, raster):
+        if self.raster is not None:
+            self.raster.close()
+        self.raster = raster
+        self.watermark = 0
+        self.__unbaked.clear()
+        self.__baked.clear()
+        self.__rendered = None
+
+        # the drawables that were baked get their canvas items back
+        self.refresh()
+
+    # raise the watermark so that only the newest half of the allowed canvas items stay vectors
+    def __bake(self):
+        keep = self.raster.max_items // 2
+        self.watermark = max(self.watermark, self.__stacked[-keep - 1])
+        self.__unbaked.clear()
+
+        for ident in self.__stacked[:bisect.bisect(self.__stacked, self.watermark)]:
+            # drawables outside the index are still being drawn
+            if self.index.box(ident) is None:
+                continue
+
+            item, leaf = self.__items.pop(ident)
+            self.canvas.delete(item)
+            self.__baked[ident] = leaf
+        self.__stacked = [ident for ident in self.__stacked if ident in self.__items]
+        self.__dirty = True
+
+    # draw the baked drawables of the region onto the raster, in drawing order
+    def __render(self):
+        self.__dirty = False
+        self.__rendered = (self.__region, self.scale)
+        if not self.__baked:
+            self.raster.clear()
+            return
+
+        self.raster.render(self.__region, self.scale, self.to_screen,
+                           [self.__baked[ident] for ident in sorted(self.__baked)])
+
+    # the colors or widths of styles changed, the canvas items follow their style tags but the raster
+    # has to be drawn again
+    def restyled(self):
+        if self.__baked:
+            self.__dirty = True
+
+    # give the baked drawables of top-level entries their canvas items back while a tool works on them
+    def unbake(self, entries):
+        if self.raster is None:
+            return
+
+        for entry in entries:
+            tags = None
+            for leaf in leaves(entry):
+                self.__unbaked.add(leaf.ident)
+                if self.__baked.pop(leaf.ident, None) is not None:
+                    if tags is None:
+                        tags = group_tags(entry)
+                    self.__realize(leaf, tags.get(leaf.ident, ()))
+                    self.__dirty = True
+
+        if self.__dirty:
+            self.__render()
+
+    # move the view by a distance in screen pixels
+    def pan(self, dx, dy):
+        self.x -= dx / self.scale
+        self.y -= dy / self.scale
+        self.canvas.move('all', dx, dy)
+
+        # new canvas items are only needed once the view leaves the area that already has them
+        x0, y0, x1, y1 = self.view()
+        if self.__region is None or x0 < self.__region[0] or y0 < self.__region[1] \
+                or x1 > self.__region[2] or y1 > self.__region[3]:
+            self.refresh()
+
+    # the view is no longer dragged, bring the raster up to date with where it ended
+    def end_pan(self):
+        self.panning = False
+        if self.raster is not None:
+            self.refresh()
+
+    # scale the view by factor, keeping the world point under the screen point (sx, sy) in place
+    def zoom(self, factor, sx, sy):
+        scale = min(max(self.scale * factor, self.min_scale), self.max_scale)
+        if scale == self.scale:
+            return
+
+        wx, wy = self.x + sx / self.scale, self.y + sy / self.scale
+        self.scale = scale
+        self.x, self.y = wx - sx / scale, wy - sy / scale
+        self.__rescaled()
+
+    # zoom and pan so the world rectangle fills the view with padding screen pixels around it
+    def fit(self, x0, y0, x1, y1, padding=20):
+        width, height = self.size()
+        scale = min((width - 2 * padding) / max(x1 - x0, 1e-9), (height - 2 * padding) / max(y1 - y0, 1e-9))
+        self.scale = min(max(scale, self.min_scale), self.max_scale)
+        self.x = (x0 + x1) / 2 - width / 2 / self.scale
+        self.y = (y0 + y1) / 2 - height / 2 / self.scale
+        self.__rescaled()
+
+    def __rescaled(self):
+        for item, leaf in self.__items.values():
+            self.canvas.coords(item, *self.screen_coords(leaf))
+        self.refresh()
+
+
+# tag on the canvas items of every drawable of a style
+def style_tag(style):
+    return 'style' + str(style)
+
+
+# ident -> tags of the groups a drawable is nested in, for every drawable of an entry
+def group_tags(entry):
+    tags = {}
+    stack = [(entry, ())]
+    while stack:
+        item, groups = stack.pop()
+        if isinstance(item, Drawable):
+            tags[item.ident] = groups
+        else:
+            groups = groups + (item.group_tag,)
+            stack.extend((i, groups) for i in item)
+    return tags